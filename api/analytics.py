@@ -0,0 +1,115 @@
+"""
+Disease analytics for admins, served from the history rollups.
+
+The rollup tables (see repository.update_rollups) hold a prediction count
+and confidence sum per user and class, and per day and class. They are
+updated in the same transaction as every history insert and delete, so the
+endpoints below read only the rows they return instead of scanning history.
+
+After creating the rollup tables on an existing database, or to repair
+them, rebuild them from the history table:
+
+    python analytics.py backfill
+"""
+import argparse
+import logging
+import time
+from datetime import date, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from mysql.connector import Error
+
+from config import ANALYTICS_DEFAULT_DAYS, ANALYTICS_MAX_PAGE_SIZE, ANALYTICS_PAGE_SIZE
+from security import CurrentUser, require_admin
+import repository
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/admin/analytics")
+
+
+def date_range(date_from: Optional[date], date_to: Optional[date]):
+    """Inclusive [date_from, date_to] as [since, until); the last ANALYTICS_DEFAULT_DAYS by default."""
+    until = (date_to or date.today()) + timedelta(days=1)
+    since = date_from or until - timedelta(days=ANALYTICS_DEFAULT_DAYS)
+    if since >= until:
+        raise HTTPException(status_code=400, detail="date_from must not be after date_to")
+    return since, until
+
+
+@router.get("/users")
+async def get_user_analytics(
+    response: Response,
+    limit: int = Query(ANALYTICS_PAGE_SIZE, ge=1, le=ANALYTICS_MAX_PAGE_SIZE),
+    after: Optional[int] = None,
+    admin: CurrentUser = Depends(require_admin)
+):
+    """
+    Prediction count and mean confidence per user, by user id. When more
+    users follow, the X-Next-Cursor header holds the `after` value for the
+    next page.
+    """
+    try:
+        rows = await repository.user_analytics(limit + 1, after)
+    except Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = str(rows[-1]["user_id"])
+    return rows
+
+
+@router.get("/users/{user_id}")
+async def get_user_disease_analytics(user_id: int, admin: CurrentUser = Depends(require_admin)):
+    """One user's prediction count and mean confidence per class."""
+    try:
+        return await repository.user_disease_analytics(user_id)
+    except Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/diseases")
+async def get_disease_analytics(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    admin: CurrentUser = Depends(require_admin)
+):
+    """Prediction count and mean confidence per class over an inclusive date range."""
+    try:
+        return await repository.disease_analytics(*date_range(date_from, date_to))
+    except Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/daily")
+async def get_daily_analytics(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    disease: Optional[str] = None,
+    admin: CurrentUser = Depends(require_admin)
+):
+    """Prediction count and mean confidence per day and class, optionally for one disease."""
+    try:
+        return await repository.daily_analytics(*date_range(date_from, date_to), disease)
+    except Error as e:
+        logger.error(f"Database error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def backfill():
+    """Rebuild every rollup from the history table in one transaction."""
+    start = time.perf_counter()
+    with repository.transaction() as cursor:
+        repository.rebuild_rollups(cursor)
+    print(f"Rebuilt {', '.join(repository.ROLLUPS)} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="History analytics rollups")
+    parser.add_argument("command", choices=["backfill"])
+    args = parser.parse_args()
+    if args.command == "backfill":
+        backfill()
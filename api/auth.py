@@ -1,21 +1,34 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Request
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi import FastAPI, Depends, HTTPException, Query, status, Request, BackgroundTasks
+from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel, EmailStr, validator
 from typing import Optional, List
 import mysql.connector
 from mysql.connector import Error
-from werkzeug.security import generate_password_hash, check_password_hash
-from jose import jwt
 import os
+import base64
+import binascii
+import json
 import logging
 import re
 from dotenv import load_dotenv
-from datetime import datetime, timedelta
+from analytics import router as analytics_router
 from history import router as history_router
-from config import DB_CONFIG, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
-from database import get_db_connection  # Import from database module
+from images import router as images_router
+from config import (
+    DB_CONFIG,
+    LOGIN_RATE_PER_IP, LOGIN_RATE_PER_USERNAME,
+    ADMIN_USERS_PAGE_SIZE, ADMIN_USERS_MAX_PAGE_SIZE, ADMIN_USERS_CACHE_TTL_SECONDS,
+)
+from cache import ResponseCache
+from executors import Overloaded, overloaded_handler
+from metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from ratelimit import RateLimiter
+import passwords
+from security import CurrentUser, create_access_token, require_admin
+from uploads import UploadLimitMiddleware
+import repository
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
@@ -31,7 +44,20 @@ app = FastAPI()
 
 # Include the history router
 app.include_router(history_router)
+# Content-addressed history images and thumbnails
+app.include_router(images_router)
+# Admin disease analytics from the history rollups
+app.include_router(analytics_router)
+
+# Password hashing pool full -> 503 with Retry-After
+app.add_exception_handler(Overloaded, overloaded_handler)
+
+# Throttle login attempts so a flood can't tie up the hashing threads
+LOGIN_IP_LIMITER = RateLimiter("login_ip", LOGIN_RATE_PER_IP, burst=LOGIN_RATE_PER_IP)
+LOGIN_USER_LIMITER = RateLimiter("login_username", LOGIN_RATE_PER_USERNAME, burst=LOGIN_RATE_PER_USERNAME)
 
+# Oversized uploads (POST /history) are refused while the body streams in
+app.add_middleware(UploadLimitMiddleware)
 # CORS Middleware
 app.add_middleware(
     CORSMiddleware,
@@ -39,10 +65,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allows all methods
     allow_headers=["*"],  # Allows all headers
+    expose_headers=["X-Next-Cursor"],  # History and user list pagination cursor
 )
-
-# OAuth2 scheme
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Per-route latency and status counts for /stats and /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Pydantic Models with Validation
 class UserCreate(BaseModel):
@@ -79,29 +105,23 @@ class UserResponse(BaseModel):
     email: str
     is_admin: bool
 
-# Token Generation
-def create_access_token(data: dict):
-    to_encode = data.copy()
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+@app.get("/ping")
+async def ping():
+    return "Hello, I am alive"
 
 # User Signup
 @app.post("/signup")
-async def signup(user: UserCreate):
-    conn = None
-    cursor = None
+async def signup(user: UserCreate, request: Request):
     try:
+        # Signups hash a password too, so they share the per-IP budget
+        LOGIN_IP_LIMITER.check(request.client.host if request.client else "unknown")
+
         # Log detailed signup attempt
         logger.info(f"Signup attempt: username={user.username}, email={user.email}")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
 
         # Check if username or email already exists
-        cursor.execute("SELECT * FROM users WHERE username = %s OR email = %s", 
-                       (user.username, user.email))
-        existing_user = cursor.fetchone()
+        existing_user = await repository.find_user_by_username_or_email(
+            user.username, user.email)
         
         if existing_user:
             if existing_user['username'] == user.username:
@@ -116,19 +136,17 @@ async def signup(user: UserCreate):
                 )
 
         # Hash the password
-        hashed_password = generate_password_hash(user.password)
+        hashed_password = await passwords.hash_password(user.password)
 
         # Insert new user
-        cursor.execute(
-            "INSERT INTO users (username, email, password_hash, is_admin) VALUES (%s, %s, %s, %s)", 
-            (user.username, user.email, hashed_password, user.is_admin)
-        )
-        conn.commit()
+        await repository.create_user(
+            user.username, user.email, hashed_password, user.is_admin)
+        USERS_CACHE.clear()
         
         logger.info(f"User {user.username} created successfully")
         return {"message": "User created successfully", "is_admin": user.is_admin}
     
-    except HTTPException:
+    except (HTTPException, Overloaded):
         # Re-raise HTTP exceptions
         raise
     except Error as e:
@@ -144,19 +162,15 @@ async def signup(user: UserCreate):
             status_code=500, 
             detail=f"Unexpected error: {str(e)}"
         )
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 # User Login
 @app.post("/login")
-async def login(user: UserLogin):
-    conn = None
-    cursor = None
+async def login(user: UserLogin, request: Request, background_tasks: BackgroundTasks):
     try:
         logger.info(f"Login attempt for username: {user.username}")
+
+        LOGIN_IP_LIMITER.check(request.client.host if request.client else "unknown")
+        LOGIN_USER_LIMITER.check(user.username.lower())
         
         # Validate input
         if not user.username or not user.password:
@@ -166,12 +180,8 @@ async def login(user: UserLogin):
                 detail="Username and password are required"
             )
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-
         # Fetch user by username
-        cursor.execute("SELECT * FROM users WHERE username = %s", (user.username,))
-        db_user = cursor.fetchone()
+        db_user = await repository.get_user_by_username(user.username)
 
         if not db_user:
             logger.warning(f"Login failed: User not found - {user.username}")
@@ -182,7 +192,8 @@ async def login(user: UserLogin):
             )
 
         # Verify password
-        if not check_password_hash(db_user['password_hash'], user.password):
+        matches, new_hash = await passwords.verify_password(db_user['password_hash'], user.password)
+        if not matches:
             logger.warning(f"Login failed: Incorrect password for user - {user.username}")
             raise HTTPException(
                 status_code=401,
@@ -190,9 +201,14 @@ async def login(user: UserLogin):
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+        # Stored with outdated hashing parameters; upgrade after responding
+        if new_hash:
+            background_tasks.add_task(
+                repository.update_password_hash.sync, db_user['id'], new_hash)
+
         # Create access token
         access_token = create_access_token(
-            data={"sub": db_user['username'], "is_admin": db_user['is_admin']}
+            data={"sub": db_user['username'], "uid": db_user['id'], "is_admin": db_user['is_admin']}
         )
 
         logger.info(f"Successful login for user: {user.username}")
@@ -204,7 +220,7 @@ async def login(user: UserLogin):
             "is_admin": db_user['is_admin']
         }
     
-    except HTTPException:
+    except (HTTPException, Overloaded):
         raise
     except Error as e:
         logger.error(f"Database error during login: {e}")
@@ -212,38 +228,69 @@ async def login(user: UserLogin):
     except Exception as e:
         logger.error(f"Unexpected error during login: {e}")
         raise HTTPException(status_code=500, detail="An unexpected error occurred")
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
-# Admin-only route to get all users
-@app.get("/admin/users", response_model=List[UserResponse])
-async def get_all_users(token: str = Depends(oauth2_scheme)):
+# Rendered /admin/users pages, reused for a few seconds across dashboard refreshes
+USERS_CACHE = ResponseCache("admin_users_cache", ttl_seconds=ADMIN_USERS_CACHE_TTL_SECONDS)
+
+def encode_user_cursor(value) -> str:
+    return base64.urlsafe_b64encode(str(value).encode()).decode()
+
+def decode_user_cursor(cursor: str, search_by: Optional[str]):
     try:
-        # Decode and verify token
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        is_admin = payload.get("is_admin")
-        
-        if not is_admin:
-            raise HTTPException(status_code=403, detail="Admin access required")
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+        return value if search_by else int(value)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("SELECT id, username, email, is_admin FROM users")
-        users = cursor.fetchall()
-        
-        return users
-    
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-    except Error as e:
-        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
-    finally:
-        cursor.close()
-        conn.close()
+# Admin-only route to list users, a page at a time
+@app.get("/admin/users", response_model=List[UserResponse])
+async def get_all_users(
+    limit: int = Query(ADMIN_USERS_PAGE_SIZE, ge=1, le=ADMIN_USERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    q: Optional[str] = Query(None, min_length=1, max_length=255),
+    search_by: str = Query("username", regex="^(username|email)$"),
+    admin: CurrentUser = Depends(require_admin)
+):
+    """
+    Users by id or, with `q`, those whose username (or email, with
+    search_by=email) starts with `q`, in that order. When more users follow,
+    the X-Next-Cursor response header holds the `cursor` for the next page.
+    """
+    key = (limit, cursor, q, search_by)
+    page = USERS_CACHE.get(key)
+    if page is None:
+        generation = USERS_CACHE.generation
+        sort_key = search_by if q else None
+        try:
+            users = await repository.list_users(
+                limit + 1, decode_user_cursor(cursor, sort_key) if cursor else None, q, search_by)
+        except Error as e:
+            raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
+        next_cursor = None
+        if len(users) > limit:
+            users = users[:limit]
+            next_cursor = encode_user_cursor(users[-1][sort_key or "id"])
+        # Rows already have UserResponse's fields; render them directly
+        # instead of validating every row through the model
+        for user in users:
+            user["is_admin"] = bool(user["is_admin"])
+        page = (json.dumps(users, separators=(",", ":")).encode(), next_cursor)
+        USERS_CACHE.put(key, page, generation)
+
+    body, next_cursor = page
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return Response(body, media_type="application/json", headers=headers)
+
+# Request and connection pool statistics
+@app.get("/stats")
+async def stats():
+    return REGISTRY.snapshot()
+
+# The same metrics in the Prometheus text format
+@app.get("/metrics")
+async def metrics():
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
 
 # Mount the uploads directory
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
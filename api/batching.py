@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from executors import STAGE_BUCKETS, Overloaded
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+QUEUE_DEPTH_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-image requests into batched forward passes.
+
+    Callers `await submit(image)` and get back the prediction row for their
+    image. A background task collects queued images until either
+    `max_batch_size` is reached or `max_wait_ms` has elapsed since the first
+    image of the batch arrived, then runs `predict_fn` once on the stacked
+    batch in `executor` (the default executor if None).
+
+    When `max_queue_size` images are already waiting, submit() raises
+    Overloaded instead of growing the queue.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=16, max_wait_ms=5.0,
+                 executor=None, name="predict", max_queue_size=0):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_queue_size = max_queue_size
+        self._queue = None
+        self._task = None
+        # Reused for every batch; safe because batches run one at a time
+        self._buffer = None
+
+        self.batch_sizes = REGISTRY.histogram(
+            f"{name}_batch_size", BATCH_SIZE_BUCKETS)
+        self.queue_depths = REGISTRY.histogram(
+            f"{name}_queue_depth", QUEUE_DEPTH_BUCKETS)
+        self.inference_seconds = REGISTRY.histogram(
+            f"{name}_inference_seconds", STAGE_BUCKETS)
+        REGISTRY.gauge(f"{name}_queue_size", self.qsize)
+
+    def qsize(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # Fail anything still waiting so callers don't hang forever
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, image: np.ndarray) -> np.ndarray:
+        if self._task is None:
+            raise RuntimeError("Batcher is not running")
+        if self.max_queue_size and self._queue.qsize() >= self.max_queue_size:
+            raise Overloaded("inference queue")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((image, future))
+        return await future
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            # Take whatever is already queued without yielding
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _fill_buffer(self, images):
+        first = images[0]
+        shape = (self.max_batch_size,) + first.shape
+        if (self._buffer is None or self._buffer.shape != shape
+                or self._buffer.dtype != first.dtype):
+            self._buffer = np.empty(shape, dtype=first.dtype)
+        for slot, image in zip(self._buffer, images):
+            slot[...] = image
+        return self._buffer[:len(images)]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.batch_sizes.observe(len(batch))
+            self.queue_depths.observe(self._queue.qsize())
+
+            # Requests cancelled while queued don't need a slot in the batch
+            batch = [(image, future) for image, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            try:
+                images = self._fill_buffer([image for image, _ in batch])
+                start = time.perf_counter()
+                predictions = await loop.run_in_executor(
+                    self.executor, self.predict_fn, images)
+                self.inference_seconds.observe(time.perf_counter() - start)
+            except Exception as e:
+                logger.error(f"Batched prediction failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), prediction in zip(batch, predictions):
+                if not future.done():
+                    future.set_result(prediction)
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(fileobj) -> str:
+    """SHA-256 of a file object's contents, leaving it rewound for the next reader."""
+    fileobj.seek(0)
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b""):
+        digest.update(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def model_fingerprint(path) -> str:
+    """Identifies a model file by content, so replacing it invalidates the cache."""
+    with open(path, "rb") as f:
+        return file_digest(f)[:16]
+
+
+class PredictionCache:
+    """
+    Two-tier cache of prediction responses keyed by image hash.
+
+    The memory tier is an LRU bounded by `max_entries`; the optional disk tier
+    is a SQLite file that several uvicorn workers can share. Entries expire
+    after `ttl_seconds` in both tiers. Keys include a model version, so only
+    entries computed by that exact model are returned. With a fixed
+    `model_version`, other versions are purged from disk on startup; pass
+    None when several versions are served side by side.
+    """
+
+    def __init__(self, model_version, max_entries=10000, ttl_seconds=3600,
+                 disk_path=None, name="prediction_cache"):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        if disk_path:
+            self._disk = self._open_disk(Path(disk_path))
+
+        self.hits = REGISTRY.counter(f"{name}_memory_hits")
+        self.disk_hits = REGISTRY.counter(f"{name}_disk_hits")
+        self.misses = REGISTRY.counter(f"{name}_misses")
+        REGISTRY.gauge(f"{name}_entries", lambda: len(self._entries))
+
+    def _open_disk(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(path), timeout=5, check_same_thread=False,
+                               isolation_level=None)
+        # WAL lets readers in other workers proceed while one of them writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS predictions (
+                key TEXT PRIMARY KEY,
+                model_version TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        expired = time.time() - self.ttl
+        if self.model_version is None:
+            conn.execute("DELETE FROM predictions WHERE created_at < ?", (expired,))
+        else:
+            conn.execute("DELETE FROM predictions WHERE model_version != ? OR created_at < ?",
+                         (self.model_version, expired))
+        return conn
+
+    def key(self, image_digest, model_version=None):
+        return f"{model_version or self.model_version}:{image_digest}"
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, created_at = entry
+                if now - created_at < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits.inc()
+                    return value
+                del self._entries[key]
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    "SELECT value, created_at FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] < self.ttl:
+                    value = json.loads(row[0])
+                    self._remember(key, value, row[1])
+                    self.disk_hits.inc()
+                    return value
+
+        self.misses.inc()
+        return None
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if self._disk is not None:
+                try:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO predictions VALUES (?, ?, ?, ?)",
+                        (key, key.split(":", 1)[0], json.dumps(value), now))
+                except sqlite3.Error as e:
+                    # The disk tier is best effort; the memory tier still works
+                    logger.warning(f"Could not write prediction cache entry: {e}")
+
+    def _remember(self, key, value, created_at):
+        self._entries[key] = (value, created_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class ResponseCache:
+    """
+    Small LRU of rendered responses that expire after `ttl_seconds`.
+
+    clear() drops everything when the underlying data changes. A response
+    computed before a clear() is not stored afterwards: read `generation`
+    before querying and pass it to put(), which ignores stale generations.
+    """
+
+    def __init__(self, name, max_entries=256, ttl_seconds=10):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = REGISTRY.counter(f"{name}_hits")
+        self.misses = REGISTRY.counter(f"{name}_misses")
+        REGISTRY.gauge(f"{name}_entries", lambda: len(self._entries))
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if now < expires_at:
+                    self._entries.move_to_end(key)
+                    self.hits.inc()
+                    return value
+                del self._entries[key]
+        self.misses.inc()
+        return None
+
+    def put(self, key, value, generation):
+        with self._lock:
+            if generation != self.generation or self.ttl <= 0:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
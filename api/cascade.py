@@ -0,0 +1,90 @@
+"""
+Confidence-gated cascade inference.
+
+Every image first gets the usual single forward pass of the routed model.
+Only when the top class's confidence is below `threshold` is the image
+escalated, so the extra compute is spent on the hard fraction of traffic
+(typically Brown spot vs Alternaria leaf spot):
+
+- "tta": the same model also scores flipped and rotated views of the image,
+  the augmentations the training notebooks use. The views are queued
+  together and share one batched forward pass; the answer is the mean of
+  the softmax over the original and its views.
+- "model": a larger model version, kept loaded as the registry's escalation
+  model, answers instead. The image is decoded again at that version's
+  input size if it differs.
+
+Results report the path taken: "single" (confident, or no escalation
+available), "tta" or "escalated".
+"""
+import logging
+
+import numpy as np
+
+from executors import StageTimer
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MODES = ("tta", "model")
+
+
+def tta_views(image: np.ndarray, count: int):
+    """
+    Up to `count` augmented views of an HxWxC image: flips first, then
+    rotations. Quarter turns and transposes are only used for square images.
+    """
+    views = [np.fliplr(image), np.flipud(image), np.rot90(image, 2)]
+    if image.shape[0] == image.shape[1]:
+        views += [np.rot90(image, 1), np.rot90(image, 3),
+                  np.transpose(image, (1, 0, 2)), np.rot90(np.fliplr(image), 1)]
+    return views[:count]
+
+
+class Cascade:
+    """Escalates low-confidence predictions; see the module docstring."""
+
+    def __init__(self, registry, mode, threshold, views=4):
+        if mode not in MODES:
+            raise ValueError(f"Unknown cascade mode {mode!r}, expected one of {MODES}")
+        self.registry = registry
+        self.mode = mode
+        self.threshold = threshold
+        self.views = views
+        self.paths = {path: REGISTRY.counter("cascade_requests", labels={"path": path})
+                      for path in ("single", "tta", "escalated")}
+
+    @property
+    def key(self):
+        """Identifies the settings in prediction cache keys, so changing them invalidates entries."""
+        if self.mode == "tta":
+            return f"tta{self.views}@{self.threshold}"
+        escalation = self.registry.escalation
+        return f"model{escalation.fingerprint if escalation else '-'}@{self.threshold}"
+
+    async def classify(self, model, image, prediction, decode, timer: StageTimer):
+        """
+        Given the first pass's `prediction` of `image` on `model`, return
+        (prediction, model that answered, path). `decode(size)` is awaited for
+        the image at another input size when the escalation model needs it.
+        """
+        if float(np.max(prediction)) >= self.threshold:
+            self.paths["single"].inc()
+            return prediction, model, "single"
+
+        if self.mode == "tta":
+            with timer.stage("tta"):
+                predictions = await model.predict_many(tta_views(image, self.views))
+            self.paths["tta"].inc()
+            return np.vstack([prediction, predictions]).mean(axis=0), model, "tta"
+
+        escalation = self.registry.escalation
+        if escalation is None or escalation is model:
+            self.paths["single"].inc()
+            return prediction, model, "single"
+        with escalation.lease(), timer.stage("escalation"):
+            if escalation.input_size != tuple(image.shape[:2]):
+                image = await decode(escalation.input_size)
+            prediction = await escalation.predict(image)
+        self.paths["escalated"].inc()
+        return prediction, escalation, "escalated"
@@ -13,11 +13,132 @@ DB_CONFIG = {
     'database': os.getenv('DB_NAME', 'apple_disease_detection')
 }
 
+# Connection pool shared by all requests in a worker. mysql-connector caps
+# a pool at 32 connections.
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '5'))
+# Threads that run blocking queries off the event loop; one per pooled
+# connection so no query waits on the pool. 0 runs queries inline.
+DB_THREADS = int(os.getenv('DB_THREADS', str(DB_POOL_SIZE)))
+
 # Security Configuration
 SECRET_KEY = os.getenv('SECRET_KEY', 'your_secret_key')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Password hashing. Any werkzeug method string works, e.g.
+# "pbkdf2:sha256:600000" or "scrypt:32768:8:1"; stored hashes using other
+# parameters are upgraded the next time their owner logs in.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', '2'))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '16'))
+# Login attempts allowed per minute, per client IP and per username (0 disables)
+LOGIN_RATE_PER_IP = int(os.getenv('LOGIN_RATE_PER_IP', '30'))
+LOGIN_RATE_PER_USERNAME = int(os.getenv('LOGIN_RATE_PER_USERNAME', '10'))
+# Verified tokens remembered per worker, so repeat requests skip JWT decoding
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', '10000'))
 
 # Upload Configuration
 UPLOAD_DIR = Path("uploads/images")
-UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
\ No newline at end of file
+UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+# Largest request body accepted for an upload (whole multipart body), the
+# most pixels an uploaded image may have (checked from its header, before
+# decoding), and how much of each uploaded file is held in memory before it
+# is spooled to a temporary file
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(20 * 2**20)))
+UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', str(64 * 10**6)))
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', str(2**20)))
+# Content-addressed image store for history uploads (see images.py), and the
+# longest side and WebP quality of the thumbnails made for each image
+IMAGE_STORE_DIR = Path(os.getenv('IMAGE_STORE_DIR', 'uploads/store'))
+THUMBNAIL_SIZE = int(os.getenv('THUMBNAIL_SIZE', '256'))
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', '80'))
+
+# History pagination
+HISTORY_PAGE_SIZE = int(os.getenv('HISTORY_PAGE_SIZE', '50'))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv('HISTORY_MAX_PAGE_SIZE', '200'))
+
+# Admin analytics: users per page of /admin/analytics/users, and the days
+# covered by the per-class and per-day reports when no range is given
+ANALYTICS_PAGE_SIZE = int(os.getenv('ANALYTICS_PAGE_SIZE', '100'))
+ANALYTICS_MAX_PAGE_SIZE = int(os.getenv('ANALYTICS_MAX_PAGE_SIZE', '1000'))
+ANALYTICS_DEFAULT_DAYS = int(os.getenv('ANALYTICS_DEFAULT_DAYS', '30'))
+
+# GET /admin/users: users per page, and how long a rendered page is reused
+# (signups clear it at once on the worker that took them; 0 disables)
+ADMIN_USERS_PAGE_SIZE = int(os.getenv('ADMIN_USERS_PAGE_SIZE', '100'))
+ADMIN_USERS_MAX_PAGE_SIZE = int(os.getenv('ADMIN_USERS_MAX_PAGE_SIZE', '1000'))
+ADMIN_USERS_CACHE_TTL_SECONDS = float(os.getenv('ADMIN_USERS_CACHE_TTL_SECONDS', '10'))
+
+# Model Configuration
+# Versions are discovered as MODEL_DIR/N.keras. MODEL_VERSION is served
+# (default: the highest N); MODEL_CANDIDATE, if set, is loaded alongside and
+# gets MODEL_CANARY_PERCENT of requests, or runs in shadow on
+# MODEL_SHADOW_PERCENT of them. With MODEL_WATCH_SECONDS set, new versions
+# dropped into MODEL_DIR are picked up without a restart.
+MODEL_DIR = os.getenv('MODEL_DIR', '../models')
+MODEL_VERSION = os.getenv('MODEL_VERSION', '')
+MODEL_CANDIDATE = os.getenv('MODEL_CANDIDATE', '')
+MODEL_CANARY_PERCENT = float(os.getenv('MODEL_CANARY_PERCENT', '0'))
+MODEL_SHADOW_PERCENT = float(os.getenv('MODEL_SHADOW_PERCENT', '0'))
+MODEL_WATCH_SECONDS = float(os.getenv('MODEL_WATCH_SECONDS', '0'))
+MODEL_MAX_LOADED = int(os.getenv('MODEL_MAX_LOADED', '3'))
+# Class names for versions without a models/N.json (training/archive1 order)
+MODEL_CLASS_NAMES = os.getenv(
+    'MODEL_CLASS_NAMES', 'Alternaria leaf spot,Brown spot,Gray spot,Healthy leaf,Rust').split(',')
+# MODEL_BACKEND picks the runtime: "keras", or the TFLite export of the same
+# model made by export_model.py ("tflite", "tflite-float16", "tflite-int8").
+MODEL_BACKEND = os.getenv('MODEL_BACKEND', 'keras')
+# Interpreter threads for TFLite backends (unset lets TFLite decide)
+MODEL_THREADS = int(os.getenv('MODEL_THREADS', '0')) or None
+
+# Confidence-gated cascade (see cascade.py): predictions whose confidence is
+# below CASCADE_THRESHOLD are escalated, either to CASCADE_TTA_VIEWS flipped
+# and rotated views in one batched pass ("tta"), or to the larger version
+# CASCADE_MODEL_VERSION ("model"). Empty CASCADE_MODE turns it off.
+CASCADE_MODE = os.getenv('CASCADE_MODE', '')
+CASCADE_THRESHOLD = float(os.getenv('CASCADE_THRESHOLD', '0.8'))
+CASCADE_TTA_VIEWS = int(os.getenv('CASCADE_TTA_VIEWS', '4'))
+CASCADE_MODEL_VERSION = os.getenv('CASCADE_MODEL_VERSION', '')
+
+# Inference Configuration
+# Concurrent /predict calls are coalesced into one forward pass of at most
+# BATCH_MAX_SIZE images, waiting at most BATCH_MAX_WAIT_MS for stragglers.
+BATCH_MAX_SIZE = int(os.getenv('BATCH_MAX_SIZE', '16'))
+BATCH_MAX_WAIT_MS = float(os.getenv('BATCH_MAX_WAIT_MS', '5'))
+# POST /predict/batch: images accepted per request (zip members included),
+# the request's largest body, and how many images are decoded / queued for
+# the model at once
+PREDICT_BATCH_MAX_IMAGES = int(os.getenv('PREDICT_BATCH_MAX_IMAGES', '5000'))
+PREDICT_BATCH_MAX_BYTES = int(os.getenv('PREDICT_BATCH_MAX_BYTES', str(2 * 2**30)))
+PREDICT_BATCH_WINDOW = int(os.getenv('PREDICT_BATCH_WINDOW', str(2 * BATCH_MAX_SIZE)))
+# Batch sizes run through the model before the service reports ready, so the
+# first requests don't pay for graph tracing (comma-separated)
+WARMUP_BATCH_SIZES = [int(size) for size in
+                      os.getenv('WARMUP_BATCH_SIZES', f'1,{BATCH_MAX_SIZE}').split(',') if size.strip()]
+
+# Worker pools for CPU-bound work. Decoding runs on a thread pool; the model
+# gets its own pool (a single thread by default, TensorFlow parallelises ops
+# internally). Requests beyond MAX_PENDING_DECODES / MAX_QUEUED_PREDICTIONS
+# are rejected with 503 and a Retry-After header.
+DECODE_WORKERS = int(os.getenv('DECODE_WORKERS', str(os.cpu_count() or 4)))
+MAX_PENDING_DECODES = int(os.getenv('MAX_PENDING_DECODES', '64'))
+INFERENCE_WORKERS = int(os.getenv('INFERENCE_WORKERS', '1'))
+MAX_QUEUED_PREDICTIONS = int(os.getenv('MAX_QUEUED_PREDICTIONS', '256'))
+RETRY_AFTER_SECONDS = int(os.getenv('RETRY_AFTER_SECONDS', '1'))
+
+# Model host (see model_host.py). With MODEL_HOST_SOCKET set, workers hand
+# preprocessed batches to the model host listening there through shared
+# memory instead of loading models themselves, so `uvicorn --workers N`
+# keeps one copy of the weights. Up to MODEL_HOST_SLOTS batches per worker
+# and version are in flight; the host merges queued batches from all workers
+# into forward passes of at most MODEL_HOST_MAX_BATCH images.
+MODEL_HOST_SOCKET = os.getenv('MODEL_HOST_SOCKET', '')
+MODEL_HOST_SLOTS = int(os.getenv('MODEL_HOST_SLOTS', str(max(2, INFERENCE_WORKERS))))
+MODEL_HOST_MAX_BATCH = int(os.getenv('MODEL_HOST_MAX_BATCH', str(4 * BATCH_MAX_SIZE)))
+
+# Prediction cache, keyed by image hash and model version. Set
+# PREDICTION_CACHE_DISK_PATH to share results between uvicorn workers.
+PREDICTION_CACHE_ENABLED = os.getenv('PREDICTION_CACHE_ENABLED', 'True').lower() in ('true', '1', 'yes')
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv('PREDICTION_CACHE_MAX_ENTRIES', '10000'))
+PREDICTION_CACHE_TTL_SECONDS = int(os.getenv('PREDICTION_CACHE_TTL_SECONDS', '3600'))
+PREDICTION_CACHE_DISK_PATH = os.getenv('PREDICTION_CACHE_DISK_PATH', '')
@@ -1,28 +1,128 @@
-import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
 from fastapi import HTTPException
 import logging
-from config import DB_CONFIG
+import threading
+import time
+from config import DB_CONFIG, DB_POOL_SIZE, DB_POOL_TIMEOUT
+from metrics import REGISTRY
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PooledConnection:
+    """
+    Proxy around a pooled MySQL connection. close() hands the connection back
+    to the pool instead of closing the socket, so existing call sites keep
+    their `conn.close()` cleanup unchanged.
+    """
+
+    def __init__(self, pool, cnx):
+        self._pool = pool
+        self._cnx = cnx
+
+    def close(self):
+        if self._cnx is not None:
+            cnx, self._cnx = self._cnx, None
+            self._pool.release(cnx)
+
+    def __getattr__(self, name):
+        if self._cnx is None:
+            raise Error("Connection already returned to the pool")
+        return getattr(self._cnx, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Fixed-size MySQL connection pool.
+
+    Connections are opened lazily on first use. Callers that find every
+    connection checked out wait up to `timeout` seconds for one to be
+    returned. mysql-connector pings each connection on checkout and
+    reconnects it if the server dropped it while it sat idle.
+    """
+
+    def __init__(self, config, size, timeout):
+        self.config = config
+        self.size = size
+        self.timeout = timeout
+        self._pool = None
+        self._init_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._in_use = 0
+        self._count_lock = threading.Lock()
+
+        self.wait_seconds = REGISTRY.histogram("db_pool_wait_seconds", WAIT_BUCKETS)
+        self.timeouts = REGISTRY.counter("db_pool_timeouts")
+        REGISTRY.gauge("db_pool_size", lambda: self.size)
+        REGISTRY.gauge("db_pool_in_use", lambda: self._in_use)
+        REGISTRY.gauge("db_pool_utilization", lambda: self._in_use / self.size)
+
+    def _get_pool(self):
+        with self._init_lock:
+            if self._pool is None:
+                logger.info(
+                    f"Opening database pool of {self.size} connections to "
+                    f"{self.config['user']}@{self.config['host']}/{self.config['database']}"
+                )
+                self._pool = pooling.MySQLConnectionPool(
+                    pool_name="api", pool_size=self.size, **self.config)
+            return self._pool
+
+    def acquire(self) -> PooledConnection:
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            self.timeouts.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="Database is busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.wait_seconds.observe(time.perf_counter() - start)
+
+        try:
+            cnx = self._get_pool().get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._count_lock:
+            self._in_use += 1
+        return PooledConnection(self, cnx)
+
+    def release(self, cnx):
+        with self._count_lock:
+            self._in_use -= 1
+        try:
+            cnx.close()
+        finally:
+            self._slots.release()
+
+
+POOL = ConnectionPool(DB_CONFIG, DB_POOL_SIZE, DB_POOL_TIMEOUT)
+
+
 def get_db_connection():
     """
-    Create and return a MySQL database connection.
+    Check out a MySQL connection from the shared pool.
+    Calling close() on it returns it to the pool.
     Raises HTTPException if connection fails.
     """
     try:
-        logger.info(f"Attempting to connect to database with config: {DB_CONFIG}")
-        connection = mysql.connector.connect(**DB_CONFIG)
-        logger.info("Database connection successful")
-        return connection
+        return POOL.acquire()
     except Error as e:
         logger.error(f"Database connection error: {e}")
         raise HTTPException(
-            status_code=500, 
+            status_code=500,
             detail=f"Database connection error: {str(e)}. "
                    f"Please check your database configuration. "
                    f"Host: {DB_CONFIG['host']}, User: {DB_CONFIG['user']}, "
                    f"Database: {DB_CONFIG['database']}"
-        )
\ No newline at end of file
+        )
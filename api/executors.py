@@ -0,0 +1,127 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Request
+from fastapi.responses import JSONResponse
+
+from metrics import REGISTRY
+
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Overloaded(Exception):
+    """Raised when a bounded pool or queue is full and the request should be shed."""
+
+    def __init__(self, resource, retry_after=1):
+        super().__init__(f"{resource} is at capacity")
+        self.resource = resource
+        self.retry_after = retry_after
+
+
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Exception handler turning Overloaded into a 503 with Retry-After."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy: {exc.resource} is at capacity, please retry"},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+class BoundedExecutor:
+    """
+    Thread pool that refuses work instead of queueing it without limit.
+
+    At most `max_pending` calls may be running or waiting in the pool; further
+    calls to `run()` raise Overloaded immediately so the caller can answer
+    with a 503 rather than letting latency grow unbounded.
+    """
+
+    def __init__(self, name, max_workers, max_pending, retry_after=1):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending, max_workers)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        thread_name_prefix=name)
+        self._pending = 0
+        REGISTRY.gauge(f"{name}_pending", lambda: self._pending)
+        REGISTRY.gauge(f"{name}_max_pending", lambda: self.max_pending)
+        # Share of the worker threads busy (above 1 means calls are queueing)
+        REGISTRY.gauge(f"{name}_utilization", lambda: self._pending / self.max_workers)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def acquire(self):
+        """Reserve a slot or raise Overloaded; pair with release()."""
+        if self._pending >= self.max_pending:
+            raise Overloaded(self.name, self.retry_after)
+        self._pending += 1
+
+    def release(self):
+        self._pending -= 1
+
+    async def run(self, fn, *args):
+        self.acquire()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+        finally:
+            self.release()
+
+    def submit(self, fn, *args):
+        """
+        Run without admission control, for work that was already admitted.
+        This also lets the pool be passed to loop.run_in_executor().
+        """
+        return self._pool.submit(fn, *args)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+
+class StageTimer:
+    """
+    Records how long each stage of a request takes, both into per-stage
+    histograms and into a Server-Timing header for the response.
+    """
+
+    # (prefix, stage) -> histogram, so recording a stage skips the registry lookup
+    _histograms = {}
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.timings = {}
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def record(self, name, elapsed):
+        """Record a stage timed elsewhere (e.g. from the request's start)."""
+        self.timings[name] = elapsed
+        histogram = self._histograms.get((self.prefix, name))
+        if histogram is None:
+            histogram = self._histograms[self.prefix, name] = REGISTRY.histogram(
+                f"{self.prefix}_{name}_seconds", STAGE_BUCKETS)
+        histogram.observe(elapsed)
+
+    def server_timing(self):
+        return ", ".join(f"{name};dur={elapsed * 1000:.2f}"
+                         for name, elapsed in self.timings.items())
+
+
+class _Stage:
+    """Context manager for StageTimer.stage(); a class because it runs several times per request."""
+
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timer.record(self.name, time.perf_counter() - self.start)
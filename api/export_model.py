@@ -0,0 +1,99 @@
+"""
+Export a versioned Keras model to a TFLite flatbuffer.
+
+    python export_model.py ../models/1.keras                          # float32
+    python export_model.py ../models/1.keras --quantization float16
+    python export_model.py ../models/1.keras --quantization int8 --calibration-images 300
+
+The output is written next to the model as N.tflite, N-float16.tflite or
+N-int8.tflite, which is where MODEL_BACKEND=tflite[-float16|-int8] looks for
+it. int8 post-training quantization is calibrated on a stratified sample of
+the training images; input and output stay float32 so the service feeds the
+same batches to every backend.
+"""
+import argparse
+import random
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from preprocessing import decode_image
+from runtimes import tflite_path
+
+DATASET_DIR = Path(__file__).resolve().parent.parent / "training" / "archive1"
+QUANTIZATIONS = ("none", "float16", "int8")
+
+
+def calibration_images(dataset_dir, count, seed=0):
+    """Up to `count` image paths, taken round-robin across class folders."""
+    rng = random.Random(seed)
+    per_class = []
+    for class_dir in sorted(p for p in Path(dataset_dir).iterdir() if p.is_dir()):
+        paths = sorted(p for p in class_dir.iterdir()
+                       if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+        rng.shuffle(paths)
+        per_class.append(paths)
+
+    sample = []
+    for i in range(max(map(len, per_class), default=0)):
+        for paths in per_class:
+            if i < len(paths) and len(sample) < count:
+                sample.append(paths[i])
+    return sample
+
+
+def convert(model, quantization, dataset_dir=DATASET_DIR, calibration_count=200):
+    height, width = model.input_shape[1:3]
+
+    # Saved models have a fixed batch dimension; export with a dynamic one so
+    # the runtime can resize it to whatever the batcher hands over
+    @tf.function(input_signature=[tf.TensorSpec([None, height, width, 3], tf.float32)])
+    def serve(images):
+        return model(images, training=False)
+
+    converter = tf.lite.TFLiteConverter.from_concrete_functions(
+        [serve.get_concrete_function()], model)
+
+    if quantization == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        paths = calibration_images(dataset_dir, calibration_count)
+        if not paths:
+            raise SystemExit(f"No calibration images found in {dataset_dir}")
+        print(f"Calibrating on {len(paths)} images from {dataset_dir}")
+
+        def representative_dataset():
+            for path in paths:
+                image = decode_image(path, (height, width)).astype(np.float32)
+                yield [image[np.newaxis]]
+
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = representative_dataset
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    return converter.convert()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("model", help="path to a versioned model, e.g. ../models/1.keras")
+    parser.add_argument("--quantization", choices=QUANTIZATIONS, default="none")
+    parser.add_argument("--calibration-images", type=int, default=200,
+                        help="images sampled from the dataset for int8 calibration")
+    parser.add_argument("--dataset", default=str(DATASET_DIR))
+    parser.add_argument("--output", help="defaults to the model path with a .tflite suffix")
+    args = parser.parse_args()
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    flatbuffer = convert(model, args.quantization, args.dataset, args.calibration_images)
+
+    quantization = None if args.quantization == "none" else args.quantization
+    output = Path(args.output) if args.output else tflite_path(args.model, quantization)
+    output.write_bytes(flatbuffer)
+    print(f"Wrote {output} ({len(flatbuffer) / 1e6:.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,164 +1,141 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from fastapi.security import OAuth2PasswordBearer
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
 from mysql.connector import Error
-from jose import jwt
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
-from datetime import datetime
-from config import SECRET_KEY, ALGORITHM, UPLOAD_DIR
-from database import get_db_connection
+from datetime import datetime, date, timedelta
+from config import HISTORY_PAGE_SIZE, HISTORY_MAX_PAGE_SIZE
+from images import IMAGES, StoredImage
+from security import CurrentUser, get_current_user
+from uploads import check_image
+from starlette.concurrency import run_in_threadpool
+import repository
 import os
+import base64
 import logging
-from pathlib import Path
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-UPLOAD_DIR = "uploads/images"
-if not os.path.exists(UPLOAD_DIR):
-    os.makedirs(UPLOAD_DIR)
+def encode_cursor(entry) -> str:
+    """Opaque cursor pointing just past `entry` in (timestamp, id) order."""
+    raw = f"{entry['timestamp'].isoformat()}|{entry['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, history_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(history_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def save_history_entry(user_id: int, result: str, confidence: float, fileobj):
+    """
+    Store an uploaded image (a binary file, read from its start) in the
+    image store and record its prediction in the history table. An image
+    uploaded before is referenced, not stored again. Raises ValueError if
+    the upload is not an image. Blocking; call it from a thread.
+    """
+    with repository.transaction() as cursor:
+        stored = IMAGES.add(cursor, fileobj)
+        repository.insert_history_image(cursor, user_id, result, confidence,
+                                        stored.path, stored.digest)
+
+def delete_history_with_image(history_id: int, image_digest: str):
+    with repository.transaction() as cursor:
+        repository.delete_history_row(cursor, history_id)
+        IMAGES.release(cursor, image_digest)
+
+def with_thumbnail(entry):
+    """Add the URL path of the entry's thumbnail; uploads from before the image store have none."""
+    entry["thumbnail_path"] = (StoredImage(entry["image_digest"], "").thumbnail_path
+                               if entry["image_digest"] else entry["image_path"])
+    return entry
 
 @router.post("/history")
 async def create_history(
     file: UploadFile = File(...),
     result: str = Form(...),
     confidence: float = Form(...),
-    token: str = Depends(oauth2_scheme)
+    user: CurrentUser = Depends(get_current_user)
 ):
-    conn = None
-    cursor = None
     try:
-        # Verify token and get user_id
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        
-        if not username:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        # Save uploaded file using pathlib for consistent path handling
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{file.filename}"
-        file_path = Path(UPLOAD_DIR) / filename
-        
-        # Save the file
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        file_content = await file.read()
-        file_path.write_bytes(file_content)
-        
-        # Store relative path with forward slashes in database
-        db_path = str(Path("uploads/images") / filename).replace("\\", "/")
-        
-        # Save to database
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        # Get user_id
-        cursor.execute("SELECT id FROM users WHERE username = %s", (username,))
-        user = cursor.fetchone()
-        
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        cursor.execute(
-            """
-            INSERT INTO history (user_id, disease_name, confidence, image_path) 
-            VALUES (%s, %s, %s, %s)
-            """,
-            (user['id'], result, confidence, db_path)
-        )
-        conn.commit()
-        
+        await run_in_threadpool(check_image, file.file)
+        await run_in_threadpool(save_history_entry, user.id, result, confidence, file.file)
+
         return {"message": "History entry created successfully"}
         
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Error as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     except Exception as e:
         logger.error(f"Error creating history: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 @router.get("/history")
-async def get_history(token: str = Depends(oauth2_scheme)):
-    conn = None
-    cursor = None
+async def get_history(
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    disease: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Newest-first page of the caller's history, optionally filtered by disease
+    and an inclusive date range. When more entries exist, the X-Next-Cursor
+    response header holds the `cursor` value for the next page.
+    """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
-        cursor.execute("""
-            SELECT h.* FROM history h
-            JOIN users u ON h.user_id = u.id
-            WHERE u.username = %s
-            ORDER BY h.timestamp DESC
-        """, (username,))
-        
-        history = cursor.fetchall()
-        return history
-        
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+        # Fetch one extra row to learn whether another page follows
+        history = await repository.list_history(
+            user.id,
+            limit + 1,
+            after=decode_cursor(cursor) if cursor else None,
+            disease_name=disease,
+            since=datetime.combine(date_from, datetime.min.time()) if date_from else None,
+            until=datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None,
+        )
+        if len(history) > limit:
+            history = history[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(history[-1])
+        return [with_thumbnail(entry) for entry in history]
+
     except Error as e:
         logger.error(f"Database error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
 
 @router.delete("/history/{history_id}")
-async def delete_history(history_id: int, token: str = Depends(oauth2_scheme)):
-    conn = None
-    cursor = None
+async def delete_history(history_id: int, user: CurrentUser = Depends(get_current_user)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        
-        conn = get_db_connection()
-        cursor = conn.cursor(dictionary=True)
-        
         # Verify ownership
-        cursor.execute("""
-            SELECT h.* FROM history h
-            JOIN users u ON h.user_id = u.id
-            WHERE h.id = %s AND u.username = %s
-        """, (history_id, username))
-        
-        history_item = cursor.fetchone()
+        history_item = await repository.get_history_item(history_id, user.id)
         if not history_item:
             raise HTTPException(status_code=404, detail="History item not found")
             
-        # Delete image file if it exists
-        if history_item['image_path']:
-            try:
-                os.remove(history_item['image_path'])
-            except OSError:
-                logger.warning(f"Could not delete image file: {history_item['image_path']}")
-        
-        # Delete database record
-        cursor.execute("DELETE FROM history WHERE id = %s", (history_id,))
-        conn.commit()
+        if history_item['image_digest']:
+            # The image's files go with its last reference
+            await run_in_threadpool(delete_history_with_image, history_id,
+                                    history_item['image_digest'])
+        else:
+            # Uploads from before the image store have a file of their own
+            if history_item['image_path']:
+                try:
+                    os.remove(history_item['image_path'])
+                except OSError:
+                    logger.warning(f"Could not delete image file: {history_item['image_path']}")
+
+            # Delete database record
+            await repository.delete_history_item(history_id)
         
         return {"message": "History item deleted successfully"}
         
-    except jwt.JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting history: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -0,0 +1,219 @@
+"""
+Content-addressed storage for uploaded images.
+
+Each image is stored once, under the SHA-256 of its bytes, in a directory
+sharded by the first two byte pairs of the hash so no directory grows
+unbounded:
+
+    uploads/store/originals/3f/a2/3fa2...e1.jpg
+    uploads/store/thumbnails/3f/a2/3fa2...e1.webp
+
+Uploads are streamed into the store in chunks, hashed on the way, and moved
+into place once their hash is known, so an upload is never held in memory
+whole. A WebP thumbnail is made when the image is first stored, so history
+pages list small thumbnails instead of full-size uploads. The `images` table
+counts how many history rows reference each hash; the files are deleted with
+the last reference. Adding and releasing a reference both lock the image's
+row, so a delete can never remove files that a concurrent upload of the same
+image has just referenced.
+
+Files are served at /images/<hash>.<ext> and /thumbnails/<hash>.webp. The
+hash is the content, so the ETag is the hash and responses may be cached
+forever.
+"""
+import hashlib
+import io
+import os
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.responses import FileResponse
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from config import IMAGE_STORE_DIR, THUMBNAIL_QUALITY, THUMBNAIL_SIZE
+import repository
+
+# PIL format -> stored file extension and Content-Type
+FORMATS = {
+    "JPEG": ("jpg", "image/jpeg"),
+    "PNG": ("png", "image/png"),
+    "WEBP": ("webp", "image/webp"),
+    "GIF": ("gif", "image/gif"),
+    "BMP": ("bmp", "image/bmp"),
+    "TIFF": ("tif", "image/tiff"),
+}
+CONTENT_TYPES = dict(FORMATS.values())
+CHUNK_BYTES = 2**20
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+router = APIRouter()
+
+
+@dataclass
+class StoredImage:
+    digest: str
+    extension: str
+
+    @property
+    def path(self):
+        """URL path of the original, relative to the server root (as history rows store it)."""
+        return f"images/{self.digest}.{self.extension}"
+
+    @property
+    def thumbnail_path(self):
+        return f"thumbnails/{self.digest}.webp"
+
+
+def shard(root, digest, name):
+    return Path(root) / digest[:2] / digest[2:4] / name
+
+
+def write_atomic(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE, quality=THUMBNAIL_QUALITY) -> bytes:
+    """WebP no larger than size x size, EXIF orientation applied."""
+    image.draft("RGB", (size, size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+    image.thumbnail((size, size), Image.BILINEAR, reducing_gap=2.0)
+    out = io.BytesIO()
+    image.save(out, "WEBP", quality=quality, method=4)
+    return out.getvalue()
+
+
+class ImageStore:
+    """Image files on disk; reference counts live in the `images` table."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.originals = self.root / "originals"
+        self.thumbnails = self.root / "thumbnails"
+        self.incoming = self.root / "incoming"
+
+    def original_path(self, digest, extension):
+        return shard(self.originals, digest, f"{digest}.{extension}")
+
+    def thumbnail_path(self, digest):
+        return shard(self.thumbnails, digest, f"{digest}.webp")
+
+    def stage(self, fileobj):
+        """
+        Copy a binary file, from its start, into incoming/ in chunks while
+        hashing it. Returns (StoredImage, temporary path, size); raises
+        ValueError if it is not an image in a supported format.
+        """
+        fileobj.seek(0)
+        try:
+            image_format = Image.open(fileobj).format
+        except UnidentifiedImageError:
+            raise ValueError("Not a supported image file")
+        if image_format not in FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        fileobj.seek(0)
+
+        self.incoming.mkdir(parents=True, exist_ok=True)
+        tmp = self.incoming / uuid.uuid4().hex
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp, "wb") as out:
+            while chunk := fileobj.read(CHUNK_BYTES):
+                digest.update(chunk)
+                out.write(chunk)
+                size += len(chunk)
+        return StoredImage(digest.hexdigest(), FORMATS[image_format][0]), tmp, size
+
+    def place(self, stored: StoredImage, tmp: Path):
+        """
+        Move a staged file to its place (or drop it if the image is already
+        stored) and make the thumbnail if missing; returns bytes written.
+        """
+        written = 0
+        original = self.original_path(stored.digest, stored.extension)
+        if original.exists():
+            tmp.unlink()
+        else:
+            original.parent.mkdir(parents=True, exist_ok=True)
+            written += tmp.stat().st_size
+            os.replace(tmp, original)
+        thumbnail = self.thumbnail_path(stored.digest)
+        if not thumbnail.exists():
+            with Image.open(original) as image:
+                thumbnail_data = make_thumbnail(image)
+            write_atomic(thumbnail, thumbnail_data)
+            written += len(thumbnail_data)
+        return written
+
+    def delete_files(self, stored: StoredImage):
+        for path in (self.original_path(stored.digest, stored.extension),
+                     self.thumbnail_path(stored.digest)):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def add(self, cursor, fileobj) -> StoredImage:
+        """
+        Store a binary file and take a reference to it. Runs inside a
+        repository.transaction(); the image's row stays locked until commit.
+        """
+        stored, tmp, size = self.stage(fileobj)
+        try:
+            repository.acquire_image(cursor, stored.digest, stored.extension, size)
+            # Placed while holding the row lock, so files removed by a racing
+            # release of the last reference are put back
+            self.place(stored, tmp)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+        return stored
+
+    def release(self, cursor, digest):
+        """Drop a reference inside a repository.transaction(), deleting the files with the last one."""
+        row = repository.release_image(cursor, digest)
+        if row is not None and row["refcount"] == 0:
+            self.delete_files(StoredImage(digest, row["extension"]))
+
+
+IMAGES = ImageStore(IMAGE_STORE_DIR)
+
+
+def serve(path, digest, content_type, request: Request):
+    etag = f'"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": IMMUTABLE}
+    if request.headers.get("if-none-match") in (etag, f"W/{etag}", "*"):
+        return Response(status_code=304, headers=headers)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Image not found")
+    return FileResponse(path, media_type=content_type, headers=headers, method=request.method)
+
+
+def parse_name(name):
+    digest, _, extension = name.partition(".")
+    if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise HTTPException(status_code=404, detail="Image not found")
+    return digest, extension
+
+
+@router.api_route("/images/{name}", methods=["GET", "HEAD"])
+async def get_image(name: str, request: Request):
+    digest, extension = parse_name(name)
+    if extension not in CONTENT_TYPES:
+        raise HTTPException(status_code=404, detail="Image not found")
+    return serve(IMAGES.original_path(digest, extension), digest,
+                 CONTENT_TYPES[extension], request)
+
+
+@router.api_route("/thumbnails/{name}", methods=["GET", "HEAD"])
+async def get_thumbnail(name: str, request: Request):
+    digest, extension = parse_name(name)
+    if extension != "webp":
+        raise HTTPException(status_code=404, detail="Image not found")
+    return serve(IMAGES.thumbnail_path(digest), digest, "image/webp", request)
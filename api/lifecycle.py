@@ -0,0 +1,77 @@
+import time
+from contextlib import contextmanager
+
+from metrics import REGISTRY
+
+# Imported first by main.py, so this is as close to process start as the
+# service can observe without platform-specific calls
+PROCESS_START = time.perf_counter()
+
+
+class StartupPhases:
+    """
+    Tracks the startup of a worker as a sequence of timed phases.
+
+    The service is live as soon as it accepts connections and ready once
+    mark_ready() is called after the last phase. Phase durations, time to
+    ready and time to the first served prediction (all measured from
+    PROCESS_START) are exposed as gauges and through report().
+    """
+
+    def __init__(self, name="startup"):
+        self.name = name
+        self.state = "starting"
+        self.phases = {}
+        self.error = None
+        self.ready_after = None
+        self.first_prediction_after = None
+        REGISTRY.gauge(f"{name}_ready", lambda: int(self.ready))
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    @contextmanager
+    def phase(self, name):
+        self.state = name
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"{name}: {e!r}"
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phases[name] = elapsed
+            REGISTRY.gauge(f"{self.name}_{name}_seconds").set(elapsed)
+
+    def record(self, name, elapsed):
+        """Record a phase that was timed elsewhere (e.g. module import)."""
+        self.phases[name] = elapsed
+        REGISTRY.gauge(f"{self.name}_{name}_seconds").set(elapsed)
+
+    def mark_failed(self, error):
+        """Record a startup failure that happened outside any phase."""
+        self.state = "failed"
+        self.error = error
+
+    def mark_ready(self):
+        self.ready_after = time.perf_counter() - PROCESS_START
+        self.state = "ready"
+        REGISTRY.gauge(f"{self.name}_time_to_ready_seconds").set(self.ready_after)
+
+    def prediction_served(self):
+        if self.first_prediction_after is None:
+            self.first_prediction_after = time.perf_counter() - PROCESS_START
+            REGISTRY.gauge(f"{self.name}_time_to_first_prediction_seconds").set(
+                self.first_prediction_after)
+
+    def report(self):
+        return {
+            "status": self.state,
+            "phases_seconds": dict(self.phases),
+            "time_to_ready_seconds": self.ready_after,
+            "time_to_first_prediction_seconds": self.first_prediction_after,
+            "error": self.error,
+        }
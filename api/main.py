@@ -1,10 +1,41 @@
-from fastapi import FastAPI, File, UploadFile
+# Imported first so startup phases are timed from as early as possible
+from lifecycle import PROCESS_START, StartupPhases
+import asyncio
+import functools
+import io
+import json
+import logging
+import time
+import zipfile
+from typing import List, Optional
+from fastapi import FastAPI, File, HTTPException, UploadFile, Request, Response, Depends, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import uvicorn
 import numpy as np
-from io import BytesIO
-from PIL import Image
-import tensorflow as tf
+from PIL import UnidentifiedImageError
+from cache import PredictionCache, file_digest
+from cascade import Cascade
+from config import (
+    MODEL_DIR, MODEL_VERSION, MODEL_CANDIDATE, MODEL_CANARY_PERCENT,
+    MODEL_SHADOW_PERCENT, MODEL_WATCH_SECONDS, MODEL_MAX_LOADED, MODEL_CLASS_NAMES,
+    MODEL_BACKEND, MODEL_THREADS, WARMUP_BATCH_SIZES,
+    CASCADE_MODE, CASCADE_THRESHOLD, CASCADE_TTA_VIEWS, CASCADE_MODEL_VERSION,
+    BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS, PREDICT_BATCH_MAX_IMAGES, PREDICT_BATCH_MAX_BYTES, PREDICT_BATCH_WINDOW, DECODE_WORKERS, MAX_PENDING_DECODES,
+    INFERENCE_WORKERS, MAX_QUEUED_PREDICTIONS, RETRY_AFTER_SECONDS,
+    MODEL_HOST_SOCKET, MODEL_HOST_SLOTS,
+    PREDICTION_CACHE_ENABLED, PREDICTION_CACHE_MAX_ENTRIES,
+    PREDICTION_CACHE_TTL_SECONDS, PREDICTION_CACHE_DISK_PATH, UPLOAD_MAX_BYTES,
+)
+from executors import BoundedExecutor, Overloaded, StageTimer, overloaded_handler
+from history import save_history_entry
+from metrics import PROMETHEUS_CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from preprocessing import decode_image
+from registry import ModelRegistry
+from security import CurrentUser, get_current_user, require_admin
+from uploads import UploadLimitMiddleware, check_image
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 print("FastAPI server is starting...")
@@ -15,6 +46,10 @@ origins = [
     # "http://localhost:5173",  #this is line for Vite
 
 ]
+# Oversized uploads are refused while the body streams in. Added before CORS
+# so it runs inside it and the 413 still carries the CORS headers
+app.add_middleware(UploadLimitMiddleware,
+                   limits={"/predict/batch": PREDICT_BATCH_MAX_BYTES})
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all domains temporarily
@@ -22,27 +57,112 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-route latency and status counts for /stats and /metrics
+app.add_middleware(MetricsMiddleware)
+
+
+# The model is loaded and warmed up in the background after the server starts
+# accepting connections: /live answers immediately, /ready once the model can
+# serve. TensorFlow is only imported by the runtime that needs it.
+STARTUP = StartupPhases()
+STARTUP_TASKS = []
+
+# CPU-bound work runs off the event loop so /ping and other requests stay responsive
+DECODE_EXECUTOR = BoundedExecutor(
+    "decode", DECODE_WORKERS, MAX_PENDING_DECODES, retry_after=RETRY_AFTER_SECONDS)
+INFERENCE_EXECUTOR = BoundedExecutor(
+    "inference", INFERENCE_WORKERS, INFERENCE_WORKERS, retry_after=RETRY_AFTER_SECONDS)
+
+# Every version in MODEL_DIR can be served; each loaded version gets its own
+# batcher, and all of them share the inference pool. With MODEL_HOST_SOCKET
+# set the versions are loaded in the model host and this worker only decodes
+# and batches images for it.
+MODELS = ModelRegistry(
+    MODEL_DIR,
+    backend=MODEL_BACKEND,
+    num_threads=MODEL_THREADS,
+    executor=INFERENCE_EXECUTOR,
+    default_class_names=MODEL_CLASS_NAMES,
+    warmup_batch_sizes=WARMUP_BATCH_SIZES,
+    max_loaded=MODEL_MAX_LOADED,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    max_queue_size=MAX_QUEUED_PREDICTIONS,
+    model_host=MODEL_HOST_SOCKET or None,
+    host_slots=MODEL_HOST_SLOTS,
+)
+
+# Low-confidence predictions are escalated to TTA views or a larger version
+CASCADE = None
+if CASCADE_MODE:
+    CASCADE = Cascade(MODELS, CASCADE_MODE, CASCADE_THRESHOLD, views=CASCADE_TTA_VIEWS)
 
+# Re-uploads of the same image are answered without running the model. Keys
+# include the fingerprint of the model file that answered, so versions and
+# backends never share entries.
+PREDICTION_CACHE = None
+if PREDICTION_CACHE_ENABLED:
+    PREDICTION_CACHE = PredictionCache(
+        None,
+        max_entries=PREDICTION_CACHE_MAX_ENTRIES,
+        ttl_seconds=PREDICTION_CACHE_TTL_SECONDS,
+        disk_path=PREDICTION_CACHE_DISK_PATH or None,
+    )
 
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
 
-# Load your trained model
+# Shadow predictions run after the response; keep references until they finish
+SHADOW_TASKS = set()
 
 
-# Load your trained model
-MODEL_PATH = "../models/1.keras"  # Update with the correct absolute path
-# MODEL_PATH = "../models/2.keras"
-try:
-    MODEL = tf.keras.models.load_model(MODEL_PATH, compile=False)
-    print("Model loaded successfully!")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    raise
+async def prepare_model():
+    version = MODEL_VERSION or MODELS.latest()
+    try:
+        if version is None:
+            raise FileNotFoundError(f"No models found in {MODEL_DIR}")
+        model = await MODELS.promote(version, phases=STARTUP)
+    except Exception as e:
+        # Errors inside a phase already failed STARTUP; this also covers the rest
+        if STARTUP.state != "failed":
+            STARTUP.mark_failed(repr(e))
+        logger.error(f"Error loading model: {e!r}")
+        return
+    print(f"Model {version} loaded successfully! ({MODEL_BACKEND}: {model.runtime.path})")
+    STARTUP.mark_ready()
+    print(f"Model ready after {STARTUP.ready_after:.2f}s: {STARTUP.phases}")
 
-CLASS_NAMES = ['Alternaria leaf spot', 'Brown spot', 'Gray spot', 'Healthy leaf', 'Rust']# Update with your actual classes
+    if MODEL_CANDIDATE:
+        try:
+            await MODELS.set_candidate(MODEL_CANDIDATE, MODEL_CANARY_PERCENT, MODEL_SHADOW_PERCENT)
+        except Exception as e:
+            print(f"Error loading candidate model {MODEL_CANDIDATE}: {e}")
+    if CASCADE_MODE == "model" and CASCADE_MODEL_VERSION:
+        try:
+            await MODELS.set_escalation(CASCADE_MODEL_VERSION)
+        except Exception as e:
+            print(f"Error loading escalation model {CASCADE_MODEL_VERSION}: {e}")
+    if MODEL_WATCH_SECONDS:
+        STARTUP_TASKS.append(asyncio.create_task(MODELS.watch(
+            MODEL_WATCH_SECONDS, MODEL_CANARY_PERCENT, MODEL_SHADOW_PERCENT)))
 
 
 # CLASS_NAMES = ['Rust','Brown spot','Healt','Gray spot']
 
+@app.on_event("startup")
+async def start_models():
+    STARTUP.record("import", time.perf_counter() - PROCESS_START)
+    STARTUP_TASKS.append(asyncio.create_task(prepare_model()))
+
+@app.on_event("shutdown")
+async def stop_models():
+    for task in STARTUP_TASKS:
+        task.cancel()
+    await MODELS.stop()
+    DECODE_EXECUTOR.shutdown(wait=False)
+    INFERENCE_EXECUTOR.shutdown(wait=False)
+
+app.add_exception_handler(Overloaded, overloaded_handler)
+
 @app.get("/")
 async def home():
     return {"message": "Welcome to Apple Disease Detection API"}
@@ -53,25 +173,276 @@ async def home():
 async def ping():
     return "Hello, I am alive"
 
-def read_file_as_image(data) -> np.ndarray:
-    image = np.array(Image.open(BytesIO(data)))
-    return image
+@app.get("/live")
+async def live():
+    """Liveness: the process is up. Fails only if the model could not be loaded."""
+    status_code = 503 if STARTUP.state == "failed" else 200
+    return JSONResponse(STARTUP.report(), status_code=status_code)
+
+@app.get("/ready")
+async def ready():
+    """Readiness: the model is loaded and warmed up, with per-phase timings."""
+    status_code = 200 if STARTUP.ready else 503
+    return JSONResponse(STARTUP.report(), status_code=status_code)
+
+@app.get("/stats")
+async def stats():
+    return REGISTRY.snapshot()
+
+@app.get("/metrics")
+async def metrics():
+    """The same metrics as /stats, in the Prometheus text format."""
+    return Response(REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+def read_file_as_image(source, size, timer=None) -> np.ndarray:
+    return decode_image(source, size, timer=timer)
+
+def request_timer(request: Request, prefix="predict") -> StageTimer:
+    """
+    StageTimer for a request, with everything before the handler ran
+    (receiving and parsing the multipart upload, authentication) recorded
+    as the "upload" stage.
+    """
+    timer = StageTimer(prefix)
+    start = request.scope.get("metrics_start")
+    if start is not None:
+        timer.record("upload", time.perf_counter() - start)
+    return timer
+
+def lookup_cached_prediction(fileobj, model_version):
+    if CASCADE is not None:
+        model_version = f"{model_version}+{CASCADE.key}"
+    key = PREDICTION_CACHE.key(file_digest(fileobj), model_version)
+    return key, PREDICTION_CACHE.get(key)
+
+def require_ready():
+    if not STARTUP.ready:
+        raise HTTPException(status_code=503, detail="Model is loading, please retry",
+                            headers={"Retry-After": str(RETRY_AFTER_SECONDS)})
+
+async def classify_file(model, fileobj, timer: StageTimer):
+    """Classify one image file with `model`; returns (result, decoded image or None)."""
+    # Type and pixel count from the header, before anything is hashed or decoded
+    with timer.stage("check"):
+        await DECODE_EXECUTOR.run(check_image, fileobj)
+
+    cache_key = None
+    if PREDICTION_CACHE is not None:
+        with timer.stage("cache"):
+            cache_key, cached = await DECODE_EXECUTOR.run(
+                lookup_cached_prediction, fileobj, model.fingerprint)
+        if cached is not None:
+            # The answering version may be another one (escalation), or not
+            # loaded here at all (a disk-tier hit from another worker); its
+            # per-class metrics are only kept while it is loaded
+            record_served(MODELS.loaded.get(cached['model_version']), cached)
+            return cached, None
+
+    # Decode straight from the spooled upload instead of reading it into memory.
+    # "image" covers the wait for a decode thread plus "decode" and "preprocess".
+    with timer.stage("image"):
+        image = await DECODE_EXECUTOR.run(read_file_as_image, fileobj, model.input_size, timer)
+
+    # Concurrent requests share a single forward pass
+    with timer.stage("inference"):
+        prediction = await model.predict(image)
+
+    answered_by, path = model, "single"
+    if CASCADE is not None:
+        prediction, answered_by, path = await CASCADE.classify(
+            model, image, prediction,
+            lambda size: DECODE_EXECUTOR.run(read_file_as_image, fileobj, size), timer)
+
+    predicted_class, confidence = answered_by.label(prediction)
+    result = {
+        'class': predicted_class,
+        'confidence': confidence,
+        'model_version': answered_by.version,
+        'path': path,
+    }
+    if cache_key is not None:
+        DECODE_EXECUTOR.submit(PREDICTION_CACHE.put, cache_key, result)
+    record_served(answered_by, result)
+    return result, image
+
+def record_served(model, result):
+    """Count a prediction served to a client, from `model` or the cache (model may be None)."""
+    if model is not None:
+        model.record(result['class'], result['confidence'])
+    STARTUP.prediction_served()
+
+async def classify_upload(file: UploadFile, timer: StageTimer,
+                          version: Optional[str] = None) -> dict:
+    require_ready()
+    model, shadow = MODELS.route(version)
+    with model.lease():
+        result, image = await classify_file(model, file.file, timer)
+
+    if shadow is not None and image is not None:
+        task = asyncio.create_task(MODELS.shadow(shadow, image, result['class']))
+        SHADOW_TASKS.add(task)
+        task.add_done_callback(SHADOW_TASKS.discard)
+    return result
+
+def list_batch_items(files):
+    """
+    Expand a batch upload into (name, open) pairs, one per image. Zip
+    archives contribute every image they contain; open() returns a
+    seekable file for the image.
+    """
+    items = []
+    for upload in files:
+        if zipfile.is_zipfile(upload.file):
+            archive = zipfile.ZipFile(upload.file)
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(IMAGE_SUFFIXES):
+                    items.append((info.filename,
+                                  functools.partial(read_zip_member, archive, info)))
+        else:
+            upload.file.seek(0)
+            items.append((upload.filename, lambda upload=upload: upload.file))
+    if len(items) > PREDICT_BATCH_MAX_IMAGES:
+        raise HTTPException(status_code=413,
+                            detail=f"At most {PREDICT_BATCH_MAX_IMAGES} images per batch request")
+    return items
+
+def read_zip_member(archive, info):
+    if info.file_size > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413,
+                            detail=f"Image is larger than {UPLOAD_MAX_BYTES} bytes")
+    # Members are read whole (one image at a time per decode thread) since
+    # PIL needs a seekable file; the archive itself stays on disk
+    return io.BytesIO(archive.read(info))
+
+async def stream_batch_predictions(model, items):
+    """
+    Classify `items` concurrently and yield one NDJSON line per image in
+    completion order. At most PREDICT_BATCH_WINDOW images are in flight, enough
+    to fill the model's batches without one request monopolising the pools.
+    """
+    window = asyncio.Semaphore(PREDICT_BATCH_WINDOW)
+    results = asyncio.Queue()
+
+    async def score(index, name, open_item):
+        async with window:
+            line = {'index': index, 'filename': name}
+            try:
+                fileobj = await DECODE_EXECUTOR.run(open_item)
+                result, _ = await classify_file(model, fileobj, StageTimer("predict_batch"))
+                line.update(result)
+            except Overloaded as e:
+                line['error'] = f"Server busy: {e.resource} is at capacity"
+            except HTTPException as e:
+                line['error'] = e.detail
+            except UnidentifiedImageError:
+                line['error'] = "Not a supported image file"
+            except Exception as e:
+                line['error'] = f"Could not process image: {e}"
+        await results.put(line)
+
+    with model.lease():
+        tasks = [asyncio.create_task(score(index, name, open_item))
+                 for index, (name, open_item) in enumerate(items)]
+        try:
+            for _ in range(len(tasks)):
+                yield json.dumps(await results.get()) + "\n"
+        finally:
+            # Client went away: stop scoring what's left
+            for task in tasks:
+                task.cancel()
+
+@app.get("/models")
+async def list_models(admin: CurrentUser = Depends(require_admin)):
+    """Available and loaded versions, rollout state and shadow agreement."""
+    return MODELS.status()
+
+@app.post("/models/{version}/promote")
+async def promote_model(version: str, admin: CurrentUser = Depends(require_admin)):
+    """Load `version` if needed, then make it the serving version."""
+    await load_or_404(MODELS.promote, version)
+    return MODELS.status()
+
+@app.post("/models/{version}/candidate")
+async def set_candidate_model(
+    version: str,
+    canary_percent: float = 0.0,
+    shadow_percent: float = 0.0,
+    admin: CurrentUser = Depends(require_admin)
+):
+    """Load `version` next to the serving one and send it canary or shadow traffic."""
+    if not (0 <= canary_percent <= 100 and 0 <= shadow_percent <= 100):
+        raise HTTPException(status_code=400, detail="Percentages must be between 0 and 100")
+    await load_or_404(MODELS.set_candidate, version, canary_percent, shadow_percent)
+    return MODELS.status()
+
+async def load_or_404(action, version, *args):
+    if version not in MODELS.versions():
+        raise HTTPException(status_code=404, detail=f"Unknown model version {version}")
+    try:
+        await action(version, *args)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Could not load model {version}: {e}")
 
 @app.post("/predict")
 async def predict(
-    file: UploadFile = File(...)
+    request: Request,
+    response: Response,
+    file: UploadFile = File(...),
+    version: Optional[str] = None
 ):
-    image = read_file_as_image(await file.read())
-    img_batch = np.expand_dims(image, 0)
-    
-    predictions = MODEL.predict(img_batch)
-
-    predicted_class = CLASS_NAMES[np.argmax(predictions[0])]
-    confidence = np.max(predictions[0])
-    return {
-        'class': predicted_class,
-        'confidence': float(confidence)
-    }
+    timer = request_timer(request)
+    result = await classify_upload(file, timer, version)
+    response.headers["Server-Timing"] = timer.server_timing()
+    return result
+
+@app.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    version: Optional[str] = None
+):
+    """
+    Classify many images in one request. Accepts any number of image files
+    and/or zip archives of images, and streams back one JSON object per line
+    (`index`, `filename`, then `class`/`confidence`/`model_version`/`path` or
+    `error`) as each image finishes, so results arrive in completion order.
+    """
+    require_ready()
+    model, _ = MODELS.route(version)
+    items = await DECODE_EXECUTOR.run(list_batch_items, files)
+    return StreamingResponse(stream_batch_predictions(model, items),
+                             media_type="application/x-ndjson",
+                             headers={"X-Batch-Size": str(len(items))})
+
+@app.post("/predict/record")
+async def predict_and_record(
+    request: Request,
+    response: Response,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    version: Optional[str] = None,
+    user: CurrentUser = Depends(get_current_user)
+):
+    """
+    Classify an upload and record it in the user's history in one request.
+    The prediction is returned right away; saving the image and writing the
+    history row happen in a background task after the response is sent.
+    """
+    timer = request_timer(request)
+    result = await classify_upload(file, timer, version)
+    response.headers["Server-Timing"] = timer.server_timing()
+
+    # The spooled upload is handed over as is: FastAPI closes form files only
+    # after the background tasks have run
+    background_tasks.add_task(record_prediction, user, result, file.file)
+    return result
+
+def record_prediction(user, result, fileobj):
+    try:
+        # Image store write (thumbnail included) plus history row
+        with StageTimer("predict").stage("record"):
+            save_history_entry(user.id, result['class'], result['confidence'], fileobj)
+    except Exception as e:
+        print(f"Error recording prediction for {user.username}: {e!r}")
 
 if __name__ == "__main__":
     uvicorn.run(app, host='localhost', port=8000)
\ No newline at end of file
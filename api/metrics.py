@@ -0,0 +1,247 @@
+"""
+In-process metrics shared by the API modules.
+
+Metrics are plain Python objects updated under a lock, cheap enough to
+record on every request. REGISTRY.snapshot() is served as JSON on /stats
+and REGISTRY.render() in the Prometheus text format on /metrics. A metric
+may carry labels, e.g. REGISTRY.counter("model_predictions", labels={"class": name});
+each label combination is its own series.
+"""
+import bisect
+import threading
+import time
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram. Each bucket counts observations <= its bound,
+    with a final implicit +Inf bucket.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name, buckets, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        buckets = {str(bound): n for bound, n in zip(self.buckets, counts)}
+        buckets["+Inf"] = counts[-1]
+        return {"count": count, "sum": total, "buckets": buckets}
+
+
+class Counter:
+    """Monotonically increasing count."""
+
+    type = "counter"
+
+    def __init__(self, name, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def value(self):
+        return self._value
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback."""
+
+    type = "gauge"
+
+    def __init__(self, name, callback=None, labels=None):
+        self.name = name
+        self.labels = labels or {}
+        self._value = 0
+        self._callback = callback
+
+    def set(self, value):
+        self._value = value
+
+    def value(self):
+        if self._callback is not None:
+            return self._callback()
+        return self._value
+
+
+def series_key(name, labels=None):
+    """`name{label="value",...}`, the series' key in snapshots and the exposition format."""
+    if not labels:
+        return name
+    pairs = ",".join(f'{key}="{escape_label(value)}"' for key, value in sorted(labels.items()))
+    return f"{name}{{{pairs}}}"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, buckets, labels=None):
+        return self._get_or_create(name, labels, lambda: Histogram(name, buckets, labels))
+
+    def counter(self, name, labels=None):
+        return self._get_or_create(name, labels, lambda: Counter(name, labels))
+
+    def gauge(self, name, callback=None, labels=None):
+        gauge = self._get_or_create(name, labels, lambda: Gauge(name, callback, labels))
+        # A component recreated under the same name (e.g. a reloaded model
+        # version) takes over its gauge
+        if callback is not None:
+            gauge._callback = callback
+        return gauge
+
+    def _get_or_create(self, name, labels, factory):
+        key = series_key(name, labels)
+        # Lock-free fast path for the common case, a metric that already exists
+        metric = self._metrics.get(key)
+        if metric is not None:
+            return metric
+        with self._lock:
+            if key not in self._metrics:
+                self._metrics[key] = factory()
+            return self._metrics[key]
+
+    def snapshot(self):
+        with self._lock:
+            metrics = dict(self._metrics)
+        result = {}
+        for key, metric in metrics.items():
+            if isinstance(metric, Histogram):
+                result[key] = metric.snapshot()
+            else:
+                result[key] = metric.value()
+        return result
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: (m.name, series_key("", m.labels)))
+        lines = []
+        previous = None
+        for metric in metrics:
+            if metric.name != previous:
+                lines.append(f"# TYPE {metric.name} {metric.type}")
+                previous = metric.name
+            if isinstance(metric, Histogram):
+                snapshot = metric.snapshot()
+                # Prometheus buckets are cumulative
+                cumulative = 0
+                for bound, count in snapshot["buckets"].items():
+                    cumulative += count
+                    key = series_key(f"{metric.name}_bucket", {**metric.labels, "le": bound})
+                    lines.append(f"{key} {cumulative}")
+                lines.append(f"{series_key(metric.name + '_sum', metric.labels)} {snapshot['sum']}")
+                lines.append(f"{series_key(metric.name + '_count', metric.labels)} {snapshot['count']}")
+            else:
+                value = metric.value()
+                # Gauges without a value yet (e.g. no serving model) read as None
+                if value is None:
+                    value = "NaN"
+                elif not isinstance(value, int) or isinstance(value, bool):
+                    value = float(value)
+                lines.append(f"{series_key(metric.name, metric.labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by the API modules
+REGISTRY = Registry()
+
+
+# Content type of REGISTRY.render() for a /metrics endpoint
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+HTTP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording every request's latency per route and method
+    (http_request_seconds), responses per route and status
+    (http_responses) and requests in progress.
+
+    Routes are labelled by their path template (/models/{version}/promote),
+    never the raw path, so the number of series stays bounded; mounted apps
+    by their mount path, and requests that match nothing "unmatched".
+    Written as plain ASGI rather than BaseHTTPMiddleware so streaming
+    responses pass straight through and the per-request cost is a few
+    dictionary lookups. The request's start time is left in
+    scope["metrics_start"] for handlers that time their own stages from it.
+    """
+
+    def __init__(self, app, registry=REGISTRY):
+        self.app = app
+        self.registry = registry
+        self.in_progress = 0
+        registry.gauge("http_requests_in_progress", lambda: self.in_progress)
+        self._latencies = {}
+        self._responses = {}
+
+    def _histogram(self, method, route):
+        key = (method, route)
+        histogram = self._latencies.get(key)
+        if histogram is None:
+            histogram = self._latencies[key] = self.registry.histogram(
+                "http_request_seconds", HTTP_BUCKETS, labels={"method": method, "route": route})
+        return histogram
+
+    @staticmethod
+    def route_label(scope, root_path):
+        # The router adds the matched route to the scope; a Mount extends root_path
+        if "route" in scope:
+            return scope["route"].path
+        if scope.get("root_path", "") != root_path:
+            return scope["root_path"][len(root_path):]
+        return "unmatched"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start = scope["metrics_start"] = time.perf_counter()
+        root_path = scope.get("root_path", "")
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        self.in_progress += 1
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.in_progress -= 1
+            route = self.route_label(scope, root_path)
+            self._histogram(scope["method"], route).observe(time.perf_counter() - start)
+            key = (route, status)
+            counter = self._responses.get(key)
+            if counter is None:
+                counter = self._responses[key] = self.registry.counter(
+                    "http_responses", labels={"route": route, "status": status})
+            counter.inc()
@@ -0,0 +1,124 @@
+"""
+Schema changes applied on top of the tables created by setup_database.py.
+
+Each migration is a table, column or index that must exist;
+apply_migrations() creates the ones that are missing, so it is safe to run
+against new and existing databases alike.
+
+    python migrations.py
+"""
+import mysql.connector
+from mysql.connector import Error
+from config import DB_CONFIG
+
+# (table, definition)
+TABLES = [
+    # Reference counts of the content-addressed image store (images.py)
+    ("images", """
+        digest CHAR(64) NOT NULL PRIMARY KEY,
+        extension VARCHAR(8) NOT NULL,
+        bytes INT NOT NULL,
+        refcount INT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    """),
+    # History rollups (repository.update_rollups); filled from history when
+    # created, rebuilt with `python analytics.py backfill`
+    ("analytics_user_disease", """
+        user_id INT NOT NULL,
+        disease_name VARCHAR(100) NOT NULL,
+        predictions INT NOT NULL,
+        confidence_sum DOUBLE NOT NULL,
+        PRIMARY KEY (user_id, disease_name),
+        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+    """),
+    ("analytics_daily", """
+        day DATE NOT NULL,
+        disease_name VARCHAR(100) NOT NULL,
+        predictions INT NOT NULL,
+        confidence_sum DOUBLE NOT NULL,
+        PRIMARY KEY (day, disease_name)
+    """),
+]
+
+# (table, column, definition)
+COLUMNS = [
+    # Image store hash of the row's image; NULL for uploads saved before it
+    ("history", "image_digest", "CHAR(64) NULL"),
+]
+
+# (table, index name, columns)
+INDEXES = [
+    # Keyset pagination of a user's history, newest first
+    ("history", "idx_history_user_time", "user_id, timestamp, id"),
+    # Same, filtered by disease
+    ("history", "idx_history_user_disease_time", "user_id, disease_name, timestamp, id"),
+]
+
+
+def table_exists(cursor, database, table):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.tables
+        WHERE table_schema = %s AND table_name = %s
+    """, (database, table))
+    return cursor.fetchone()[0] > 0
+
+
+def column_exists(cursor, database, table, column):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.columns
+        WHERE table_schema = %s AND table_name = %s AND column_name = %s
+    """, (database, table, column))
+    return cursor.fetchone()[0] > 0
+
+
+def index_exists(cursor, database, table, index):
+    cursor.execute("""
+        SELECT COUNT(*) FROM information_schema.statistics
+        WHERE table_schema = %s AND table_name = %s AND index_name = %s
+    """, (database, table, index))
+    return cursor.fetchone()[0] > 0
+
+
+def apply_migrations(cursor, database):
+    created = []
+    for table, definition in TABLES:
+        if not table_exists(cursor, database, table):
+            cursor.execute(f"CREATE TABLE {table} ({definition})")
+            created.append(table)
+            print(f"Created table {table}")
+    for table, column, definition in COLUMNS:
+        if not column_exists(cursor, database, table, column):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+            print(f"Added column {table}.{column}")
+    for table, index, columns in INDEXES:
+        if index_exists(cursor, database, table, index):
+            continue
+        cursor.execute(f"CREATE INDEX {index} ON {table} ({columns})")
+        print(f"Created index {index} on {table}({columns})")
+
+    # Rollups added to a database that already has history start out complete
+    from repository import ROLLUPS, rebuild_rollups
+    rollups = [table for table in created if table in ROLLUPS]
+    if rollups:
+        rebuild_rollups(cursor, rollups)
+        print(f"Filled {', '.join(rollups)} from history")
+
+
+def main():
+    conn = None
+    try:
+        conn = mysql.connector.connect(**DB_CONFIG)
+        cursor = conn.cursor()
+        apply_migrations(cursor, DB_CONFIG['database'])
+        conn.commit()
+        print("Migrations applied successfully!")
+    except Error as e:
+        print(f"Error: {e}")
+    finally:
+        if conn and conn.is_connected():
+            cursor.close()
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
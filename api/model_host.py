@@ -0,0 +1,433 @@
+"""
+Model host: one process owns the model weights for every HTTP worker.
+
+Run `python model_host.py` and start the prediction service with
+MODEL_HOST_SOCKET pointing at the host's socket. Workers then load versions
+as HostedRuntime instead of load_runtime(), so TensorFlow and the weights
+are held once by the host however many uvicorn workers run.
+
+Each HostedRuntime opens its own connection and names the model it wants
+(backend and .keras path). The host loads it once for all connections and
+creates a shared-memory ring for the connection: `slots` slots, each with
+room for an input batch of up to `max_batch` uint8 images and their output
+rows. A prediction copies the preprocessed batch into a free slot and sends
+only the slot number and image count over the socket. The host runs the
+forward pass and writes the probabilities back into the same slot before
+answering. Tensors never go through pickle or the socket.
+
+Batches from all workers queue up per model. The model's inference thread
+merges whatever is waiting into one forward pass of at most
+MODEL_HOST_MAX_BATCH images. A model is unloaded when its last connection
+closes.
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+import numpy as np
+
+from runtimes import load_runtime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET = "/tmp/apple-disease-model-host.sock"
+CONNECT_TIMEOUT_SECONDS = 30
+
+# Every message is a (kind, payload length) header followed by the payload
+FRAME = struct.Struct("!BI")
+HELLO, READY, PREDICT, RESULT, ERROR = range(1, 6)
+# PREDICT payload: slot, images in the slot. RESULT and ERROR start with the slot.
+BATCH = struct.Struct("!II")
+SLOT = struct.Struct("!I")
+
+# Marks the end of a model's queue
+STOP = object()
+
+
+def send_frame(sock, kind, payload=b""):
+    sock.sendall(FRAME.pack(kind, len(payload)) + payload)
+
+
+def recv_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError("Model host connection closed")
+        data += chunk
+    return bytes(data)
+
+
+def recv_frame(sock):
+    kind, length = FRAME.unpack(recv_exact(sock, FRAME.size))
+    return kind, recv_exact(sock, length)
+
+
+class Ring:
+    """
+    Slots in a shared-memory block: `inputs[slot]` is a (max_batch, h, w, 3)
+    uint8 batch and `outputs[slot]` its (max_batch, num_classes) float32 rows.
+    """
+
+    def __init__(self, shm, slots, max_batch, input_size, num_classes):
+        self.shm = shm
+        self.inputs = np.ndarray((slots, max_batch, *input_size, 3), np.uint8, shm.buf)
+        self.outputs = np.ndarray((slots, max_batch, num_classes), np.float32, shm.buf,
+                                  offset=self.outputs_offset(self.inputs.nbytes))
+
+    @staticmethod
+    def outputs_offset(inputs_nbytes):
+        return -(-inputs_nbytes // 64) * 64
+
+    @classmethod
+    def nbytes(cls, slots, max_batch, input_size, num_classes):
+        inputs = slots * max_batch * input_size[0] * input_size[1] * 3
+        return cls.outputs_offset(inputs) + slots * max_batch * num_classes * 4
+
+    def close(self):
+        # The arrays export the buffer; it can only be released once they are gone
+        del self.inputs, self.outputs
+        self.shm.close()
+
+
+def attach(name):
+    """Map the host's shared-memory block `name` without taking ownership of it."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Before 3.13 attaching registers the block with this process's
+        # resource tracker, which would unlink it when the worker exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def connect(socket_path, timeout):
+    """Connect to the host, waiting up to `timeout` seconds for it to start listening."""
+    deadline = time.monotonic() + timeout
+    while True:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(socket_path)
+            return sock
+        except (FileNotFoundError, ConnectionRefusedError):
+            sock.close()
+            if time.monotonic() >= deadline:
+                raise
+            time.sleep(0.1)
+
+
+# Worker side
+
+class HostedRuntime:
+    """
+    Runtime whose model lives in the model host, with the same interface as
+    the runtimes in runtimes.py. Unlike those, predict() may be called from
+    several threads: up to `slots` batches are in flight at once.
+    """
+
+    def __init__(self, socket_path, backend, path, num_threads=None, slots=2, max_batch=16,
+                 connect_timeout=CONNECT_TIMEOUT_SECONDS):
+        self.sock = connect(socket_path, connect_timeout)
+        try:
+            send_frame(self.sock, HELLO, json.dumps({
+                "backend": backend, "path": str(Path(path).resolve()), "num_threads": num_threads,
+                "slots": slots, "max_batch": max_batch,
+            }).encode())
+            _, payload = recv_frame(self.sock)
+            reply = json.loads(payload)
+            if "error" in reply:
+                raise RuntimeError(f"Model host could not load {path}: {reply['error']}")
+        except Exception:
+            self.sock.close()
+            raise
+
+        self.path = Path(reply["path"])
+        self.input_size = tuple(reply["input_size"])
+        self.max_batch = max_batch
+        self.ring = Ring(attach(reply["ring"]), slots, max_batch, self.input_size,
+                         reply["num_classes"])
+        self._free = queue.Queue()
+        for slot in range(slots):
+            self._free.put(slot)
+        self._done = [threading.Event() for _ in range(slots)]
+        self._errors = [None] * slots
+        self._lost = None
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(target=self._read_replies, daemon=True,
+                                        name=f"model_host_{self.path.stem}")
+        self._reader.start()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if len(batch) > self.max_batch:
+            return np.concatenate([self.predict(batch[i:i + self.max_batch])
+                                   for i in range(0, len(batch), self.max_batch)])
+        slot = self._free.get()
+        try:
+            count = len(batch)
+            self.ring.inputs[slot, :count] = batch
+            self._done[slot].clear()
+            self._errors[slot] = None
+            if self._lost:
+                raise RuntimeError(self._lost)
+            with self._send_lock:
+                send_frame(self.sock, PREDICT, BATCH.pack(slot, count))
+            self._done[slot].wait()
+            if self._errors[slot] or self._lost:
+                raise RuntimeError(self._errors[slot] or self._lost)
+            return self.ring.outputs[slot, :count].copy()
+        finally:
+            self._free.put(slot)
+
+    def _read_replies(self):
+        try:
+            while True:
+                kind, payload = recv_frame(self.sock)
+                (slot,) = SLOT.unpack_from(payload)
+                if kind == ERROR:
+                    self._errors[slot] = payload[SLOT.size:].decode()
+                self._done[slot].set()
+        except OSError as e:
+            # Also raised after close(); either way nothing more will be answered
+            self._lost = f"Model host connection lost: {e!r}"
+            for done in self._done:
+                done.set()
+
+    def close(self):
+        """Disconnect; the host frees the ring and, if no one else uses it, the model."""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self._reader.join(timeout=1)
+        self.ring.close()
+
+
+# Host side
+
+class Connection:
+    """A worker's connection, bound to one model and one ring."""
+
+    def __init__(self, sock, model, ring):
+        self.sock = sock
+        self.model = model
+        self.ring = ring
+        self._send_lock = threading.Lock()
+
+    def reply(self, kind, payload):
+        with self._send_lock:
+            try:
+                send_frame(self.sock, kind, payload)
+            except OSError:
+                pass  # the worker went away; its connection is released in turn
+
+
+class HostedModel:
+    """A loaded runtime and the inference thread that serves its queue."""
+
+    def __init__(self, host, key, runtime, max_batch):
+        self.host = host
+        self.key = key
+        self.runtime = runtime
+        self.input_size = tuple(runtime.input_size)
+        self.max_batch = max_batch
+        self.connections = 0
+        # Also the first forward pass, so the graph is traced before any worker waits on it
+        self.num_classes = int(runtime.predict(
+            np.zeros((1, *self.input_size, 3), dtype=np.uint8)).shape[-1])
+        # (connection, slot, images) to predict, or (connection, None, 0) once
+        # the connection is closed
+        self.queue = queue.Queue()
+        self._buffer = np.empty((max_batch, *self.input_size, 3), dtype=np.uint8)
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=f"infer_{Path(key[1]).stem}")
+        self._thread.start()
+
+    def _run(self):
+        carry = None
+        while True:
+            item = carry if carry is not None else self.queue.get()
+            carry = None
+            if item is STOP:
+                return
+            items, images = [item], item[2]
+            # Merge what other workers have queued meanwhile, up to max_batch
+            while images < self.max_batch:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is STOP or images + item[2] > self.max_batch:
+                    carry = item
+                    break
+                items.append(item)
+                images += item[2]
+
+            self._predict([item for item in items if item[1] is not None])
+            # Requests queued before a release have been answered by now
+            for connection, slot, _ in items:
+                if slot is None:
+                    self.host.release(connection)
+
+    def _predict(self, requests):
+        if not requests:
+            return
+        if len(requests) == 1:
+            connection, slot, count = requests[0]
+            batch = connection.ring.inputs[slot, :count]
+        else:
+            batch = self._buffer[:sum(count for _, _, count in requests)]
+            np.concatenate([connection.ring.inputs[slot, :count]
+                            for connection, slot, count in requests], out=batch)
+        try:
+            predictions = self.runtime.predict(batch)
+        except Exception as e:
+            logger.error(f"Prediction on {self.runtime.path} failed: {e!r}")
+            for connection, slot, _ in requests:
+                connection.reply(ERROR, SLOT.pack(slot) + repr(e).encode())
+            return
+
+        offset = 0
+        for connection, slot, count in requests:
+            connection.ring.outputs[slot, :count] = predictions[offset:offset + count]
+            offset += count
+            connection.reply(RESULT, SLOT.pack(slot))
+
+
+class ModelHost:
+    """Accepts worker connections on `socket_path`; see the module docstring."""
+
+    def __init__(self, socket_path, max_batch=64):
+        self.socket_path = socket_path
+        self.max_batch = max_batch
+        self.models = {}
+        self._lock = threading.Lock()
+        # [lock, waiters] per model key being acquired, so a slow load only
+        # blocks workers asking for that model
+        self._loading = {}
+
+    def serve_forever(self):
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen()
+        logger.info(f"Model host listening on {self.socket_path}")
+        try:
+            while True:
+                sock, _ = server.accept()
+                threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+        finally:
+            server.close()
+            os.unlink(self.socket_path)
+
+    def acquire(self, backend, path, num_threads=None) -> HostedModel:
+        """The loaded model for (backend, path), loading it on first use."""
+        key = (backend, path, num_threads)
+        with self._lock:
+            loading = self._loading.setdefault(key, [threading.Lock(), 0])
+            loading[1] += 1
+        try:
+            with loading[0]:
+                with self._lock:
+                    model = self.models.get(key)
+                    if model is not None:
+                        model.connections += 1
+                        return model
+                start = time.perf_counter()
+                model = HostedModel(self, key, load_runtime(backend, path, num_threads=num_threads),
+                                    self.max_batch)
+                logger.info(f"Loaded {model.runtime.path} in {time.perf_counter() - start:.2f}s")
+                with self._lock:
+                    model.connections += 1
+                    self.models[key] = model
+                return model
+        finally:
+            # Dropped with its last waiter, once the model is registered or the load raised
+            with self._lock:
+                loading[1] -= 1
+                if not loading[1]:
+                    del self._loading[key]
+
+    def release(self, connection):
+        """Free a closed connection's socket and ring, and its model if no connection uses it."""
+        connection.sock.close()
+        shm = connection.ring.shm
+        connection.ring.close()
+        shm.unlink()
+        self._detach(connection.model)
+
+    def _detach(self, model):
+        with self._lock:
+            model.connections -= 1
+            if model.connections == 0:
+                del self.models[model.key]
+                model.queue.put(STOP)
+                logger.info(f"Unloaded {model.runtime.path}")
+
+    def _serve(self, sock):
+        try:
+            _, payload = recv_frame(sock)
+            hello = json.loads(payload)
+            slots, max_batch = int(hello["slots"]), int(hello["max_batch"])
+            model = self.acquire(hello["backend"], hello["path"], hello.get("num_threads"))
+        except Exception as e:
+            logger.error(f"Could not attach worker: {e!r}")
+            try:
+                send_frame(sock, READY, json.dumps({"error": repr(e)}).encode())
+            finally:
+                sock.close()
+            return
+
+        try:
+            shm = shared_memory.SharedMemory(create=True, size=Ring.nbytes(
+                slots, max_batch, model.input_size, model.num_classes))
+        except OSError as e:
+            logger.error(f"Could not create a ring for a worker: {e!r}")
+            sock.close()
+            self._detach(model)
+            return
+        connection = Connection(sock, model, Ring(shm, slots, max_batch, model.input_size,
+                                                  model.num_classes))
+        try:
+            send_frame(sock, READY, json.dumps({
+                "ring": shm.name, "path": str(model.runtime.path),
+                "input_size": list(model.input_size), "num_classes": model.num_classes,
+            }).encode())
+            while True:
+                _, payload = recv_frame(sock)
+                slot, count = BATCH.unpack(payload)
+                if slot >= slots or not 0 < count <= max_batch:
+                    logger.error(f"Disconnecting worker after a bad batch: slot {slot}, {count} images")
+                    break
+                model.queue.put((connection, slot, count))
+        except OSError:
+            pass  # worker disconnected
+        finally:
+            # Closed by release() once the model thread reaches it
+            model.queue.put((connection, None, 0))
+
+
+if __name__ == "__main__":
+    from config import MODEL_HOST_SOCKET, MODEL_HOST_MAX_BATCH
+
+    parser = argparse.ArgumentParser(description="Serve models to prediction workers over shared memory.")
+    parser.add_argument("--socket", default=MODEL_HOST_SOCKET or DEFAULT_SOCKET)
+    parser.add_argument("--max-batch", type=int, default=MODEL_HOST_MAX_BATCH,
+                        help="most images per forward pass, across workers")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    # Exit through serve_forever's cleanup, which removes the socket
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    ModelHost(args.socket, args.max_batch).serve_forever()
@@ -0,0 +1,62 @@
+import functools
+from typing import Optional, Tuple
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from config import (
+    PASSWORD_HASH_METHOD, PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+    RETRY_AFTER_SECONDS,
+)
+from executors import BoundedExecutor
+
+# Password hashing is a deliberately slow KDF, so it runs on its own small
+# pool: a login burst can saturate these threads but not the event loop.
+# Set to None to hash inline on the event loop (the old behaviour).
+HASH_EXECUTOR = BoundedExecutor(
+    "password_hash", PASSWORD_HASH_WORKERS, PASSWORD_HASH_MAX_PENDING,
+    retry_after=RETRY_AFTER_SECONDS)
+
+
+@functools.lru_cache(maxsize=None)
+def _method_prefix(method: str) -> str:
+    # werkzeug expands defaults (e.g. "pbkdf2" -> "pbkdf2:sha256:600000")
+    # in the stored hash, so compare against the expanded form
+    return generate_password_hash("", method=method).split("$", 1)[0]
+
+
+def needs_rehash(password_hash: str) -> bool:
+    """True if the hash was made with a different algorithm or work factor."""
+    return password_hash.split("$", 1)[0] != _method_prefix(PASSWORD_HASH_METHOD)
+
+
+def _hash(password: str) -> str:
+    return generate_password_hash(password, method=PASSWORD_HASH_METHOD)
+
+
+def _verify(password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+    if not check_password_hash(password_hash, password):
+        return False, None
+    if needs_rehash(password_hash):
+        return True, _hash(password)
+    return True, None
+
+
+async def _run(fn, *args):
+    if HASH_EXECUTOR is None:
+        return fn(*args)
+    return await HASH_EXECUTOR.run(fn, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password)
+
+
+async def verify_password(password_hash: str, password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Check a password against its stored hash.
+
+    Returns (matches, new_hash). new_hash is set when the password matched
+    but was stored with outdated parameters, and should replace the stored
+    hash. Raises Overloaded when the hashing pool is full.
+    """
+    return await _run(_verify, password_hash, password)
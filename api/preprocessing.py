@@ -0,0 +1,45 @@
+from contextlib import nullcontext
+
+import numpy as np
+from PIL import Image, ImageOps
+
+
+def decode_image(source, size, out=None, timer=None) -> np.ndarray:
+    """
+    Decode an uploaded image into an RGB uint8 array of shape (height, width, 3).
+
+    `source` is anything `Image.open` accepts, typically the upload's spooled
+    file, so the request body is never copied into one big bytes object. For JPEGs,
+    `Image.draft` lets libjpeg scale down by 1/2, 1/4 or 1/8 while decoding,
+    so a 12 MP photo is never materialised at full resolution. EXIF
+    orientation is applied and any mode (RGBA, grayscale, palette) is
+    converted to RGB so every image yields the same tensor shape.
+
+    If `out` is given it must be a (height, width, 3) uint8 array and the
+    pixels are written into it. With a StageTimer as `timer`, decoding and
+    the preprocessing after it are recorded as the "decode" and "preprocess"
+    stages.
+    """
+    height, width = size
+    with timer.stage("decode") if timer else nullcontext():
+        image = Image.open(source)
+        # Only has an effect for JPEG; picks the smallest scale still >= size
+        image.draft("RGB", (width, height))
+        image.load()
+
+    with timer.stage("preprocess") if timer else nullcontext():
+        return _to_array(image, size, out)
+
+
+def _to_array(image, size, out):
+    height, width = size
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if image.size != (width, height):
+        image = image.resize((width, height), Image.BILINEAR, reducing_gap=2.0)
+
+    if out is None:
+        out = np.empty((height, width, 3), dtype=np.uint8)
+    out[...] = np.asarray(image)
+    return out
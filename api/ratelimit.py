@@ -0,0 +1,53 @@
+import math
+import threading
+import time
+
+from fastapi import HTTPException
+
+from metrics import REGISTRY
+
+
+class RateLimiter:
+    """
+    Token bucket per key: each key may make `burst` attempts at once, refilled
+    at `per_minute` attempts per minute. Idle buckets are dropped once they
+    would be full again, so memory is bounded by the keys active recently.
+    A `per_minute` of 0 disables the limiter.
+    """
+
+    def __init__(self, name, per_minute, burst):
+        self.name = name
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self.rejected = REGISTRY.counter(f"{name}_rate_limited")
+
+    def check(self, key):
+        """Consume one attempt for `key` or raise HTTPException(429)."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                self.rejected.inc()
+                retry_after = math.ceil((1 - tokens) / self.rate)
+                raise HTTPException(
+                    status_code=429,
+                    detail="Too many attempts, please try again later",
+                    headers={"Retry-After": str(retry_after)},
+                )
+            self._buckets[key] = (tokens - 1, now)
+
+    def _prune(self, now):
+        full_after = self.burst / self.rate
+        if now - self._last_prune < full_after:
+            return
+        self._buckets = {key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+                         if now - updated < full_after}
+        self._last_prune = now
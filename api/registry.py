@@ -0,0 +1,415 @@
+"""
+Registry of the versioned models in models/.
+
+The training notebooks save each model as models/N.keras. Next to it the
+registry keeps models/N.json with the class names and input size that
+version serves; the file is written on first load if missing, from
+DEFAULT_CLASS_NAMES and the model's input shape, and can be edited by hand.
+
+One version is *serving*: unpinned requests go to it. A *candidate* can be
+loaded alongside and take a percentage of traffic, either as canary (the
+candidate answers) or as shadow (the candidate also runs on the request's
+image and only its latency and agreement with the serving version are
+recorded). An *escalation* version can be kept loaded as well for the
+confidence-gated cascade (cascade.py) to send hard inputs to. Versions are
+loaded and warmed up on a dedicated thread, then swapped in by replacing a
+single reference, so no request sees a half-loaded model. A version that is
+no longer needed is drained of in-flight requests before its batcher is
+stopped.
+"""
+import asyncio
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import numpy as np
+from fastapi import HTTPException
+
+from batching import MicroBatcher
+from cache import model_fingerprint
+from executors import STAGE_BUCKETS
+from metrics import REGISTRY
+from model_host import HostedRuntime
+from runtimes import load_runtime
+
+logger = logging.getLogger(__name__)
+
+
+# Confidence of the predicted class; below 0.5 the model was unsure
+CONFIDENCE_BUCKETS = (0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+
+def version_key(version):
+    return int(version) if version.isdigit() else -1
+
+
+def close_runtime(runtime):
+    """Disconnect hosted runtimes; in-process ones are freed with the version."""
+    if isinstance(runtime, HostedRuntime):
+        runtime.close()
+
+
+class ModelVersion:
+    """A loaded model version with its own batcher."""
+
+    def __init__(self, version, runtime, class_names, batcher):
+        self.version = version
+        self.runtime = runtime
+        self.class_names = class_names
+        self.input_size = tuple(runtime.input_size)
+        self.fingerprint = model_fingerprint(runtime.path)
+        self.batcher = batcher
+        self.inflight = 0
+        self.last_used = time.monotonic()
+        self.requests = REGISTRY.counter(f"model_v{version}_requests")
+        self.latency = REGISTRY.histogram(f"model_v{version}_seconds", STAGE_BUCKETS)
+        # Served predictions per class, and their confidence, for drift dashboards
+        self.class_counts = {name: REGISTRY.counter("model_predictions",
+                                                    labels={"version": version, "class": name})
+                             for name in class_names}
+        self.confidence = REGISTRY.histogram("model_confidence", CONFIDENCE_BUCKETS,
+                                             labels={"version": version})
+
+    @contextmanager
+    def lease(self):
+        """Hold the version loaded for the duration of a request."""
+        self.inflight += 1
+        self.last_used = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.inflight -= 1
+
+    async def predict(self, image: np.ndarray) -> np.ndarray:
+        self.requests.inc()
+        start = time.perf_counter()
+        try:
+            return await self.batcher.submit(image)
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    async def predict_many(self, images) -> np.ndarray:
+        """Predictions for several images, queued together so they share a forward pass."""
+        self.requests.inc(len(images))
+        start = time.perf_counter()
+        try:
+            return np.stack(await asyncio.gather(*(self.batcher.submit(image) for image in images)))
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    def label(self, prediction):
+        index = int(np.argmax(prediction))
+        return self.class_names[index], float(prediction[index])
+
+    def record(self, predicted_class, confidence):
+        """Count a prediction served to a client in the class and confidence metrics."""
+        self.class_counts[predicted_class].inc()
+        self.confidence.observe(confidence)
+
+    def describe(self):
+        return {
+            "version": self.version,
+            "model": str(self.runtime.path),
+            "fingerprint": self.fingerprint,
+            "class_names": self.class_names,
+            "input_size": list(self.input_size),
+            "inflight": self.inflight,
+        }
+
+
+class ModelRegistry:
+    def __init__(self, models_dir, backend="keras", num_threads=None, executor=None,
+                 default_class_names=None, warmup_batch_sizes=(1,), max_loaded=3,
+                 max_batch_size=16, max_wait_ms=5.0, max_queue_size=0,
+                 model_host=None, host_slots=2):
+        self.models_dir = Path(models_dir)
+        self.backend = backend
+        self.num_threads = num_threads
+        self.executor = executor
+        self.default_class_names = list(default_class_names or [])
+        self.warmup_batch_sizes = warmup_batch_sizes
+        self.max_loaded = max_loaded
+        # Socket of the model host (model_host.py); versions are then loaded there
+        self.model_host = model_host
+        self.host_slots = host_slots
+        self.batch_options = dict(max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+                                  max_queue_size=max_queue_size)
+
+        self.serving = None
+        self.candidate = None
+        self.escalation = None
+        self.canary_percent = 0.0
+        self.shadow_percent = 0.0
+        self.loaded = {}
+        self.failed = {}
+        self._loading = {}
+        # Loading runs beside inference rather than on the inference thread,
+        # so serving continues while a new version loads
+        self._loader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model_load")
+        self._retiring = set()
+        # Agreement of the current candidate's shadow runs: [runs, agreements]
+        self._shadow_results = [0, 0]
+
+        self.shadow_comparisons = REGISTRY.counter("model_shadow_comparisons")
+        self.shadow_agreements = REGISTRY.counter("model_shadow_agreements")
+        REGISTRY.gauge("model_serving_version",
+                       lambda: version_key(self.serving.version) if self.serving else None)
+        REGISTRY.gauge("model_loaded_versions", lambda: len(self.loaded))
+
+    # Discovery
+
+    def versions(self):
+        """Versions present in models_dir, oldest first."""
+        paths = {p.stem: p for p in self.models_dir.glob("*.keras") if p.stem.isdigit()}
+        return {version: paths[version] for version in sorted(paths, key=version_key)}
+
+    def latest(self):
+        versions = self.versions()
+        return next(reversed(versions), None) if versions else None
+
+    def metadata_path(self, version):
+        return self.models_dir / f"{version}.json"
+
+    def _read_metadata(self, version):
+        try:
+            with open(self.metadata_path(version)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _write_metadata(self, version, metadata):
+        try:
+            with open(self.metadata_path(version), "w") as f:
+                json.dump(metadata, f, indent=2)
+        except OSError as e:
+            logger.warning(f"Could not write metadata for model {version}: {e}")
+
+    # Loading
+
+    def load_version(self, version, phases=None) -> ModelVersion:
+        """
+        Load and warm up `version` on the calling thread, without starting its
+        batcher. load() runs this in the background; offline tools call it
+        directly.
+        """
+        path = self.versions().get(version)
+        if path is None:
+            raise FileNotFoundError(f"{self.models_dir / version}.keras not found")
+        phase = phases.phase if phases is not None else lambda name: nullcontext()
+        with phase("load_model"):
+            if self.model_host:
+                runtime = HostedRuntime(self.model_host, self.backend, path,
+                                        num_threads=self.num_threads, slots=self.host_slots,
+                                        max_batch=self.batch_options["max_batch_size"])
+            else:
+                runtime = load_runtime(self.backend, path, num_threads=self.num_threads)
+            metadata = self._read_metadata(version)
+            if not metadata:
+                metadata = {"class_names": self.default_class_names,
+                            "input_size": list(runtime.input_size)}
+                self._write_metadata(version, metadata)
+            if list(metadata["input_size"]) != list(runtime.input_size):
+                raise ValueError(f"models/{version}.json input_size {metadata['input_size']} "
+                                 f"does not match the model ({list(runtime.input_size)})")
+
+        # Trace the graph / allocate tensors for the batch sizes the batcher
+        # sends, so the first real requests don't pay for it
+        with phase("warmup"):
+            for size in self.warmup_batch_sizes or (1,):
+                prediction = runtime.predict(
+                    np.zeros((size, *runtime.input_size, 3), dtype=np.uint8))
+            if prediction.shape[-1] != len(metadata["class_names"]):
+                raise ValueError(f"Model {version} has {prediction.shape[-1]} outputs but "
+                                 f"{len(metadata['class_names'])} class names")
+
+        batcher = MicroBatcher(runtime.predict, executor=self.executor,
+                               name=f"predict_v{version}", **self.batch_options)
+        return ModelVersion(version, runtime, list(metadata["class_names"]), batcher)
+
+    async def load(self, version, phases=None) -> ModelVersion:
+        """Load a version in the background (once) and start its batcher."""
+        if version in self.loaded:
+            return self.loaded[version]
+        return await asyncio.shield(self._start_loading(version, phases))
+
+    def _start_loading(self, version, phases=None):
+        if version not in self._loading:
+            task = asyncio.create_task(self._load_and_start(version, phases))
+            # Failures are recorded in self.failed; nobody may await the task
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._loading[version] = task
+        return self._loading[version]
+
+    async def _load_and_start(self, version, phases):
+        try:
+            start = time.perf_counter()
+            model = await asyncio.get_running_loop().run_in_executor(
+                self._loader, self.load_version, version, phases)
+            await model.batcher.start()
+            self.loaded[version] = model
+            self.failed.pop(version, None)
+            logger.info(f"Loaded model {version} in {time.perf_counter() - start:.2f}s")
+            self._evict()
+            return model
+        except Exception as e:
+            self.failed[version] = repr(e)
+            logger.error(f"Could not load model {version}: {e!r}")
+            raise
+        finally:
+            del self._loading[version]
+
+    def _evict(self):
+        keep = {m.version for m in (self.serving, self.candidate, self.escalation) if m is not None}
+        spare = sorted((m for m in self.loaded.values() if m.version not in keep),
+                       key=lambda m: m.last_used)
+        while spare and len(self.loaded) > self.max_loaded:
+            self._retire(spare.pop(0))
+
+    def _retire(self, model):
+        self.loaded.pop(model.version, None)
+        task = asyncio.create_task(self._drain(model))
+        self._retiring.add(task)
+        task.add_done_callback(self._retiring.discard)
+
+    async def _drain(self, model):
+        # Requests that already picked this version finish on it
+        while model.inflight or model.batcher.qsize():
+            await asyncio.sleep(0.05)
+        await model.batcher.stop()
+        close_runtime(model.runtime)
+        logger.info(f"Unloaded model {model.version}")
+
+    # Rollout
+
+    async def promote(self, version, phases=None) -> ModelVersion:
+        """Make `version` the serving version once it is loaded and warm."""
+        model = await self.load(version, phases)
+        previous, self.serving = self.serving, model
+        if self.candidate is model:
+            self.candidate = None
+            self.canary_percent = self.shadow_percent = 0.0
+        logger.info(f"Serving model {version}"
+                    + (f" (was {previous.version})" if previous and previous is not model else ""))
+        if previous is not None and previous is not model and previous not in (
+                self.candidate, self.escalation):
+            self._retire(previous)
+        return model
+
+    async def set_candidate(self, version, canary_percent=0.0, shadow_percent=0.0):
+        """Load `version` next to the serving one and route a share of traffic to it."""
+        model = await self.load(version)
+        previous, self.candidate = self.candidate, model
+        self.canary_percent = canary_percent
+        self.shadow_percent = shadow_percent
+        if previous is not model:
+            self._shadow_results = [0, 0]
+        if previous is not None and previous is not model and previous not in (
+                self.serving, self.escalation):
+            self._retire(previous)
+        return model
+
+    async def set_escalation(self, version) -> ModelVersion:
+        """Load `version` and keep it loaded as the cascade's escalation model."""
+        model = await self.load(version)
+        previous, self.escalation = self.escalation, model
+        if previous is not None and previous is not model and previous not in (
+                self.serving, self.candidate):
+            self._retire(previous)
+        return model
+
+    def route(self, version=None):
+        """
+        Pick the model for a request: the pinned `version`, else the canary
+        for `canary_percent` of requests, else the serving version. Also
+        returns the candidate when this request should be shadowed.
+
+        Callers hold `model.lease()` from here until the prediction is done,
+        so a version swapped out meanwhile isn't unloaded under them.
+        """
+        if version is not None:
+            model = self.loaded.get(version)
+            if model is None:
+                if version not in self.versions():
+                    raise HTTPException(status_code=404, detail=f"Unknown model version {version}")
+                # Load it for the next request rather than stalling this one
+                self._start_loading(version)
+                raise HTTPException(status_code=503, detail=f"Model {version} is loading, please retry",
+                                    headers={"Retry-After": "5"})
+            model.last_used = time.monotonic()
+            return model, None
+
+        candidate = self.candidate
+        if candidate is not None:
+            if self.canary_percent and random.random() * 100 < self.canary_percent:
+                return candidate, None
+            if self.shadow_percent and random.random() * 100 < self.shadow_percent:
+                return self.serving, candidate
+        return self.serving, None
+
+    async def shadow(self, candidate, image, served_class):
+        """Run `image` on the candidate and record whether it agrees."""
+        if tuple(image.shape[:2]) != candidate.input_size:
+            return
+        with candidate.lease():
+            try:
+                prediction = await candidate.predict(image)
+            except Exception as e:
+                logger.warning(f"Shadow prediction on model {candidate.version} failed: {e!r}")
+                return
+        agrees = candidate.label(prediction)[0] == served_class
+        self.shadow_comparisons.inc()
+        if agrees:
+            self.shadow_agreements.inc()
+        if candidate is self.candidate:
+            self._shadow_results[0] += 1
+            self._shadow_results[1] += agrees
+
+    async def watch(self, interval, canary_percent=0.0, shadow_percent=0.0):
+        """
+        Poll models_dir for new versions. A new version becomes the candidate
+        with the given canary/shadow percentages, or is promoted straight
+        away when both are zero.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            latest = self.latest()
+            known = {m.version for m in (self.serving, self.candidate) if m is not None}
+            if (latest is None or latest in known or latest in self.failed
+                    or version_key(latest) < version_key(self.serving.version)):
+                continue
+            try:
+                if canary_percent or shadow_percent:
+                    await self.set_candidate(latest, canary_percent, shadow_percent)
+                else:
+                    await self.promote(latest)
+            except Exception:
+                pass  # recorded in self.failed and logged by load()
+
+    async def stop(self):
+        for task in list(self._loading.values()):
+            task.cancel()
+        for model in list(self.loaded.values()):
+            await model.batcher.stop()
+            close_runtime(model.runtime)
+        self.loaded.clear()
+        self._loader.shutdown(wait=False)
+
+    def status(self):
+        runs, agreements = self._shadow_results
+        return {
+            "available": list(self.versions()),
+            "serving": self.serving.describe() if self.serving else None,
+            "candidate": self.candidate.describe() if self.candidate else None,
+            "escalation": self.escalation.describe() if self.escalation else None,
+            "canary_percent": self.canary_percent,
+            "shadow_percent": self.shadow_percent,
+            "shadow_runs": runs,
+            "shadow_agreement": agreements / runs if runs else None,
+            "loaded": sorted(self.loaded, key=version_key),
+            "loading": sorted(self._loading, key=version_key),
+            "failed": self.failed,
+        }
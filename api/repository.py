@@ -0,0 +1,447 @@
+"""
+Async data access for users and history.
+
+mysql-connector is a blocking driver, so every query runs on a dedicated
+thread pool sized to the connection pool (DB_THREADS). Handlers `await` the
+helpers below and the event loop keeps serving other requests meanwhile.
+Each helper also exposes the blocking version as `.sync` for code that
+already runs off the loop, such as background tasks.
+"""
+import asyncio
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from typing import List, Optional, Tuple, TypedDict
+
+from config import DB_THREADS
+from database import get_db_connection
+from executors import STAGE_BUCKETS
+from metrics import REGISTRY
+
+# Set to None to run queries inline on the event loop (the old behaviour)
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db") if DB_THREADS else None
+
+
+class UserRow(TypedDict):
+    id: int
+    username: str
+    email: str
+    password_hash: str
+    is_admin: bool
+
+
+class UserSummary(TypedDict):
+    id: int
+    username: str
+    email: str
+    is_admin: bool
+
+
+class HistoryRow(TypedDict):
+    id: int
+    user_id: int
+    disease_name: str
+    confidence: float
+    image_path: str
+    image_digest: Optional[str]
+    timestamp: datetime
+
+
+class HistoryEntry(TypedDict):
+    id: int
+    disease_name: str
+    confidence: float
+    image_path: str
+    image_digest: Optional[str]
+    timestamp: datetime
+
+
+class ImageRow(TypedDict):
+    extension: str
+    refcount: int
+
+
+class UserAnalytics(TypedDict):
+    user_id: int
+    username: str
+    predictions: int
+    mean_confidence: float
+
+
+class DiseaseAnalytics(TypedDict):
+    disease_name: str
+    predictions: int
+    mean_confidence: float
+
+
+class DailyAnalytics(TypedDict):
+    day: date
+    disease_name: str
+    predictions: int
+    mean_confidence: float
+
+
+# Columns returned to clients; user_id is implied by the token. image_digest
+# is NULL for rows written before the content-addressed image store.
+HISTORY_COLUMNS = "h.id, h.disease_name, h.confidence, h.image_path, h.image_digest, h.timestamp"
+
+
+def db_call(fn):
+    """
+    Run a blocking query helper on the database thread pool when awaited.
+    Each helper's run time, connection checkout included, is recorded as
+    db_query_seconds{query="<helper name>"}.
+    """
+    latency = REGISTRY.histogram("db_query_seconds", STAGE_BUCKETS, labels={"query": fn.__name__})
+
+    @functools.wraps(fn)
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            latency.observe(time.perf_counter() - start)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if DB_EXECUTOR is None:
+            return timed(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            DB_EXECUTOR, functools.partial(timed, *args, **kwargs))
+    wrapper.sync = timed
+    return wrapper
+
+
+def _execute(sql, params=(), fetch=None, commit=False):
+    conn = None
+    cursor = None
+    try:
+        conn = get_db_connection()
+        cursor = conn.cursor(dictionary=True)
+        cursor.execute(sql, params)
+        if fetch == "one":
+            result = cursor.fetchone()
+        elif fetch == "all":
+            result = cursor.fetchall()
+        else:
+            result = cursor.lastrowid
+        if commit:
+            conn.commit()
+        return result
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+
+@contextmanager
+def transaction():
+    """
+    Cursor on a pooled connection for several statements that commit
+    together (or roll back if the block raises). Blocking; use off the loop.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor(dictionary=True)
+    try:
+        yield cursor
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+# Users
+
+@db_call
+def find_user_by_username_or_email(username: str, email: str) -> Optional[UserRow]:
+    return _execute(
+        "SELECT id, username, email, password_hash, is_admin FROM users "
+        "WHERE username = %s OR email = %s",
+        (username, email), fetch="one")
+
+
+@db_call
+def get_user_by_username(username: str) -> Optional[UserRow]:
+    return _execute(
+        "SELECT id, username, email, password_hash, is_admin FROM users WHERE username = %s",
+        (username,), fetch="one")
+
+
+@db_call
+def get_user_id(username: str) -> Optional[int]:
+    row = _execute("SELECT id FROM users WHERE username = %s", (username,), fetch="one")
+    return row['id'] if row else None
+
+
+@db_call
+def create_user(username: str, email: str, password_hash: str, is_admin: bool) -> int:
+    return _execute(
+        "INSERT INTO users (username, email, password_hash, is_admin) VALUES (%s, %s, %s, %s)",
+        (username, email, password_hash, is_admin), commit=True)
+
+
+@db_call
+def update_password_hash(user_id: int, password_hash: str) -> None:
+    _execute("UPDATE users SET password_hash = %s WHERE id = %s",
+             (password_hash, user_id), commit=True)
+
+
+@db_call
+def list_users(limit: int, after=None, prefix: Optional[str] = None,
+               search_by: str = "username") -> List[UserSummary]:
+    """
+    One page of users. Without `prefix`, by ascending id; with it, the users
+    whose `search_by` column ("username" or "email") starts with `prefix`, in
+    that column's order. `after` is the previous page's last id, or last
+    username/email when searching. Either way the page is a range scan on an
+    index (the primary key or the column's unique index), however many
+    users there are.
+    """
+    if search_by not in ("username", "email"):
+        raise ValueError(f"Cannot search users by {search_by}")
+    order = search_by if prefix else "id"
+    conditions = []
+    params = []
+    if prefix:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        conditions.append(f"{search_by} LIKE %s")
+        params.append(escaped + "%")
+    if after is not None:
+        conditions.append(f"{order} > %s")
+        params.append(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit)
+    return _execute(f"""
+        SELECT id, username, email, is_admin FROM users
+        {where}
+        ORDER BY {order}
+        LIMIT %s
+    """, tuple(params), fetch="all")
+
+
+# History
+
+@db_call
+def insert_history(user_id: int, disease_name: str, confidence: float, image_path: str) -> int:
+    with transaction() as cursor:
+        cursor.execute(
+            """
+            INSERT INTO history (user_id, disease_name, confidence, image_path)
+            VALUES (%s, %s, %s, %s)
+            """,
+            (user_id, disease_name, confidence, image_path))
+        history_id = cursor.lastrowid
+        update_rollups(cursor, history_id, 1)
+        return history_id
+
+
+def insert_history_image(cursor, user_id: int, disease_name: str, confidence: float,
+                         image_path: str, image_digest: str) -> int:
+    """insert_history() for an image in the image store, inside a transaction()."""
+    cursor.execute(
+        """
+        INSERT INTO history (user_id, disease_name, confidence, image_path, image_digest)
+        VALUES (%s, %s, %s, %s, %s)
+        """,
+        (user_id, disease_name, confidence, image_path, image_digest))
+    history_id = cursor.lastrowid
+    update_rollups(cursor, history_id, 1)
+    return history_id
+
+
+@db_call
+def list_history(user_id: int, limit: int,
+                 after: Optional[Tuple[datetime, int]] = None,
+                 disease_name: Optional[str] = None,
+                 since: Optional[datetime] = None,
+                 until: Optional[datetime] = None) -> List[HistoryEntry]:
+    """
+    One page of a user's history, newest first.
+
+    Pages are keyed on (timestamp, id): `after` is the last (timestamp, id)
+    of the previous page, so each page is an index range scan on
+    history(user_id, timestamp, id) rather than an OFFSET. `since` is
+    inclusive and `until` exclusive.
+    """
+    conditions = ["h.user_id = %s"]
+    params = [user_id]
+    if disease_name:
+        conditions.append("h.disease_name = %s")
+        params.append(disease_name)
+    if since:
+        conditions.append("h.timestamp >= %s")
+        params.append(since)
+    if until:
+        conditions.append("h.timestamp < %s")
+        params.append(until)
+    if after:
+        conditions.append("(h.timestamp < %s OR (h.timestamp = %s AND h.id < %s))")
+        params.extend([after[0], after[0], after[1]])
+    params.append(limit)
+
+    return _execute(f"""
+        SELECT {HISTORY_COLUMNS} FROM history h
+        WHERE {" AND ".join(conditions)}
+        ORDER BY h.timestamp DESC, h.id DESC
+        LIMIT %s
+    """, tuple(params), fetch="all")
+
+
+@db_call
+def get_history_item(history_id: int, user_id: int) -> Optional[HistoryRow]:
+    """Return the history entry only if it belongs to `user_id`."""
+    return _execute(
+        "SELECT id, user_id, disease_name, confidence, image_path, image_digest, timestamp "
+        "FROM history WHERE id = %s AND user_id = %s",
+        (history_id, user_id), fetch="one")
+
+
+@db_call
+def delete_history_item(history_id: int) -> None:
+    with transaction() as cursor:
+        delete_history_row(cursor, history_id)
+
+
+# Images
+#
+# Reference counts of the content-addressed image store (images.py). These
+# take a cursor from transaction(): each locks the image's row until the
+# transaction ends, which serialises uploads and deletes of the same image.
+
+def acquire_image(cursor, digest: str, extension: str, size: int) -> None:
+    cursor.execute(
+        """
+        INSERT INTO images (digest, extension, bytes, refcount) VALUES (%s, %s, %s, 1)
+        ON DUPLICATE KEY UPDATE refcount = refcount + 1
+        """,
+        (digest, extension, size))
+
+
+def release_image(cursor, digest: str) -> Optional[ImageRow]:
+    """Drop one reference; returns the row with its new refcount, deleted at zero."""
+    cursor.execute("SELECT extension, refcount FROM images WHERE digest = %s FOR UPDATE",
+                   (digest,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    row["refcount"] -= 1
+    if row["refcount"] <= 0:
+        cursor.execute("DELETE FROM images WHERE digest = %s", (digest,))
+    else:
+        cursor.execute("UPDATE images SET refcount = %s WHERE digest = %s",
+                       (row["refcount"], digest))
+    return row
+
+
+def delete_history_row(cursor, history_id: int) -> None:
+    """delete_history_item() inside a transaction()."""
+    update_rollups(cursor, history_id, -1)
+    cursor.execute("DELETE FROM history WHERE id = %s", (history_id,))
+
+
+# Analytics
+#
+# Rollups of the history table, kept in step with it: every history insert
+# and delete adds or subtracts the row in the same transaction. Each rollup
+# holds a prediction count and a confidence sum per key, so means stay exact
+# under deletes. analytics.py backfill rebuilds them from history.
+
+ROLLUPS = {
+    # table: (key columns, the same keys computed from a history row)
+    "analytics_user_disease": ("user_id, disease_name", "user_id, disease_name"),
+    "analytics_daily": ("day, disease_name", "DATE(timestamp), disease_name"),
+}
+
+
+def update_rollups(cursor, history_id: int, sign: int) -> None:
+    """Add (sign=1) or subtract (sign=-1) history row `history_id` to every rollup."""
+    for table, (keys, source) in ROLLUPS.items():
+        cursor.execute(f"""
+            INSERT INTO {table} ({keys}, predictions, confidence_sum)
+            SELECT {source}, %s, %s * confidence FROM history WHERE id = %s
+            ON DUPLICATE KEY UPDATE predictions = predictions + %s,
+                                    confidence_sum = confidence_sum + %s * confidence
+        """, (sign, sign, history_id, sign, sign))
+
+
+def rebuild_rollups(cursor, tables=None) -> None:
+    """
+    Recompute every rollup (or those in `tables`) from the history table,
+    inside a transaction(). INSERT ... SELECT share-locks the history rows it
+    reads, so history writes wait until the rebuild commits instead of being
+    missed.
+    """
+    for table, (keys, source) in ROLLUPS.items():
+        if tables is not None and table not in tables:
+            continue
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(f"""
+            INSERT INTO {table} ({keys}, predictions, confidence_sum)
+            SELECT {source}, COUNT(*), SUM(confidence) FROM history
+            GROUP BY {source}
+        """)
+
+
+@db_call
+def user_analytics(limit: int, after: Optional[int] = None) -> List[UserAnalytics]:
+    """
+    Prediction totals per user, by ascending user id; `after` is the last
+    user id of the previous page. Reads one rollup row per user and class.
+    """
+    return _execute("""
+        SELECT a.user_id, u.username, SUM(a.predictions) AS predictions,
+               SUM(a.confidence_sum) / SUM(a.predictions) AS mean_confidence
+        FROM analytics_user_disease a JOIN users u ON u.id = a.user_id
+        WHERE a.user_id > %s AND a.predictions > 0
+        GROUP BY a.user_id, u.username
+        ORDER BY a.user_id
+        LIMIT %s
+    """, (after or 0, limit), fetch="all")
+
+
+@db_call
+def user_disease_analytics(user_id: int) -> List[DiseaseAnalytics]:
+    """One user's predictions per class, most frequent first."""
+    return _execute("""
+        SELECT disease_name, predictions, confidence_sum / predictions AS mean_confidence
+        FROM analytics_user_disease
+        WHERE user_id = %s AND predictions > 0
+        ORDER BY predictions DESC
+    """, (user_id,), fetch="all")
+
+
+@db_call
+def disease_analytics(since: date, until: date) -> List[DiseaseAnalytics]:
+    """Predictions per class over [since, until), most frequent first."""
+    return _execute("""
+        SELECT disease_name, SUM(predictions) AS predictions,
+               SUM(confidence_sum) / SUM(predictions) AS mean_confidence
+        FROM analytics_daily
+        WHERE day >= %s AND day < %s AND predictions > 0
+        GROUP BY disease_name
+        ORDER BY predictions DESC
+    """, (since, until), fetch="all")
+
+
+@db_call
+def daily_analytics(since: date, until: date,
+                    disease_name: Optional[str] = None) -> List[DailyAnalytics]:
+    """Predictions per day and class over [since, until), oldest first."""
+    conditions = ["day >= %s", "day < %s", "predictions > 0"]
+    params = [since, until]
+    if disease_name:
+        conditions.append("disease_name = %s")
+        params.append(disease_name)
+    return _execute(f"""
+        SELECT day, disease_name, predictions, confidence_sum / predictions AS mean_confidence
+        FROM analytics_daily
+        WHERE {" AND ".join(conditions)}
+        ORDER BY day, disease_name
+    """, tuple(params), fetch="all")
+
@@ -0,0 +1,97 @@
+"""
+Inference backends behind a common interface.
+
+Every runtime takes a uint8 batch of shape (n, height, width, 3) and returns
+an (n, num_classes) float array of probabilities. Runtimes are not
+thread-safe; the inference pool calls them from a single thread.
+
+    keras           the .keras file through Keras (the original path)
+    tflite          the exported float32 TFLite flatbuffer
+    tflite-float16  TFLite with float16 weights
+    tflite-int8     TFLite with int8 post-training quantization
+
+TFLite runtimes use the standalone `tflite_runtime` package when it is
+installed, which avoids importing TensorFlow and Keras in the worker.
+"""
+from pathlib import Path
+
+import numpy as np
+
+BACKENDS = ("keras", "tflite", "tflite-float16", "tflite-int8")
+
+
+def tflite_path(keras_path, quantization=None) -> Path:
+    """models/1.keras -> models/1.tflite, models/1-int8.tflite, ..."""
+    keras_path = Path(keras_path)
+    suffix = f"-{quantization}" if quantization else ""
+    return keras_path.with_name(f"{keras_path.stem}{suffix}.tflite")
+
+
+class KerasRuntime:
+    def __init__(self, path):
+        import tensorflow as tf
+
+        self.path = Path(path)
+        self.model = tf.keras.models.load_model(str(path), compile=False)
+        self.input_size = tuple(self.model.input_shape[1:3])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class TFLiteRuntime:
+    def __init__(self, path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        self.path = Path(path)
+        self.interpreter = Interpreter(model_path=str(path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self.input_size = tuple(int(d) for d in self._input['shape'][1:3])
+        self._batch_size = int(self._input['shape'][0])
+
+    def _resize(self, batch_size):
+        # The exported model has a dynamic batch dimension; reallocate only
+        # when the batch size changes
+        if batch_size != self._batch_size:
+            shape = [batch_size, *self.input_size, 3]
+            self.interpreter.resize_tensor_input(self._input['index'], shape)
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch_size = batch_size
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        self._resize(len(batch))
+        dtype = self._input['dtype']
+        scale, zero_point = self._input['quantization']
+        if scale:
+            batch = np.round(batch / scale + zero_point)
+        self.interpreter.set_tensor(self._input['index'], batch.astype(dtype))
+        self.interpreter.invoke()
+
+        output = self.interpreter.get_tensor(self._output['index'])
+        scale, zero_point = self._output['quantization']
+        if scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+def load_runtime(backend, keras_path, num_threads=None):
+    """Load `keras_path`, or the TFLite export of it, with the given backend."""
+    if backend == "keras":
+        return KerasRuntime(keras_path)
+    if backend in BACKENDS:
+        quantization = backend.partition("-")[2] or None
+        path = tflite_path(keras_path, quantization)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"{path} not found; create it with: python export_model.py {keras_path}"
+                + (f" --quantization {quantization}" if quantization else ""))
+        return TFLiteRuntime(path, num_threads=num_threads)
+    raise ValueError(f"Unknown model backend {backend!r}, expected one of {BACKENDS}")
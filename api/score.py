@@ -0,0 +1,183 @@
+"""
+Score a directory tree of images offline and write NDJSON results.
+
+    python score.py ../training/archive1 --output archive1.ndjson
+    python score.py /data/surveys/orchard-a --output orchard-a.ndjson --version 2 --processes
+
+Images are found recursively. The stages overlap. The reader walks the tree
+lazily. A pool of decoder workers turns files into tensors ahead of the
+model. The model runs on full batches while the next ones decode. A writer
+thread appends one line per image.
+
+Re-running with the same --output skips images already written, so an
+interrupted run resumes where it stopped. Images that sit in a folder named
+after a class, as in training/archive1, get that name recorded as `label`,
+and the summary then reports accuracy.
+"""
+import argparse
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from config import (
+    MODEL_DIR, MODEL_BACKEND, MODEL_THREADS, MODEL_CLASS_NAMES, BATCH_MAX_SIZE, DECODE_WORKERS,
+)
+from preprocessing import decode_image
+from registry import ModelRegistry
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff")
+
+
+def find_images(root):
+    """Image paths under `root`, in a stable order, found lazily."""
+    for directory, subdirs, files in os.walk(root):
+        subdirs.sort()
+        for name in sorted(files):
+            if name.lower().endswith(IMAGE_SUFFIXES):
+                yield Path(directory, name)
+
+
+def completed_paths(output):
+    """
+    Paths already recorded in `output`. A last line cut short by an
+    interruption is truncated away so appending continues cleanly.
+    """
+    done = set()
+    if not output.exists():
+        return done
+    with open(output, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    for line in data[:end].splitlines():
+        done.add(json.loads(line)["path"])
+    return done
+
+
+def decode(path, size):
+    try:
+        return decode_image(path, size), None
+    except Exception as e:
+        return None, f"Could not process image: {e}"
+
+
+def prefetch(executor, fn, items, size, depth):
+    """
+    Decode `items` ((path, name) pairs) on `executor`, yielding
+    (name, future) in order with at most `depth` decodes in flight.
+    """
+    pending = deque()
+    for path, name in items:
+        pending.append((name, executor.submit(fn, path, size)))
+        if len(pending) >= depth:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
+
+
+def write_lines(out, lines):
+    out.write("".join(json.dumps(line) + "\n" for line in lines))
+    out.flush()
+
+
+def score(args):
+    root = Path(args.root)
+    output = Path(args.output)
+    registry = ModelRegistry(args.models, backend=args.backend, num_threads=MODEL_THREADS,
+                             default_class_names=MODEL_CLASS_NAMES,
+                             warmup_batch_sizes=[args.batch_size])
+    version = args.version or registry.latest()
+    if version is None:
+        raise SystemExit(f"No models found in {args.models} (MODEL_DIR); expected N.keras files")
+    model = registry.load_version(version)
+
+    done = completed_paths(output)
+    todo = ((path, path.relative_to(root).as_posix()) for path in find_images(root))
+    todo = ((path, name) for path, name in todo if name not in done)
+
+    batch = np.empty((args.batch_size, *model.input_size, 3), dtype=np.uint8)
+    stats = {"skipped": len(done), "scored": 0, "errors": 0, "labelled": 0, "correct": 0}
+
+    def run_batch(lines, count):
+        if count:
+            predictions = model.runtime.predict(batch[:count])
+            scored = (line for line in lines if "error" not in line)
+            for line, prediction in zip(scored, predictions):
+                line["class"], line["confidence"] = model.label(prediction)
+                if "label" in line:
+                    stats["labelled"] += 1
+                    stats["correct"] += line["class"] == line["label"]
+        stats["scored"] += count
+        stats["errors"] += len(lines) - count
+
+    # PIL releases the GIL while decoding, so threads scale with cores;
+    # --processes also parallelises the Python work around each decode
+    pool_class = ProcessPoolExecutor if args.processes else ThreadPoolExecutor
+    start = time.perf_counter()
+    with open(output, "a") as out, \
+            pool_class(max_workers=args.workers) as decoders, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer") as writer:
+        lines, count, written = [], 0, None
+        for name, future in prefetch(decoders, decode, todo, model.input_size, args.prefetch):
+            image, error = future.result()
+            line = {"path": name, "model_version": model.version}
+            label = Path(name).parent.name
+            if label in model.class_names:
+                line["label"] = label
+            if error is None:
+                batch[count] = image
+                count += 1
+            else:
+                line["error"] = error
+            lines.append(line)
+
+            if count == args.batch_size:
+                run_batch(lines, count)
+                # Writing overlaps with the next batch's decode and inference;
+                # waiting on the previous write surfaces errors and keeps at
+                # most one batch queued
+                if written is not None:
+                    written.result()
+                written = writer.submit(write_lines, out, lines)
+                lines, count = [], 0
+        run_batch(lines, count)
+        writer.submit(write_lines, out, lines).result()
+    elapsed = time.perf_counter() - start
+
+    processed = stats["scored"] + stats["errors"]
+    stats.update({
+        "model_version": version,
+        "seconds": elapsed,
+        "images_per_second": processed / elapsed if elapsed else 0.0,
+        "accuracy": stats["correct"] / stats["labelled"] if stats["labelled"] else None,
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("root", help="directory of images, searched recursively")
+    parser.add_argument("--output", required=True, help="NDJSON file, appended to on resume")
+    parser.add_argument("--version", help="model version (default: the highest in --models)")
+    parser.add_argument("--models", default=MODEL_DIR)
+    parser.add_argument("--backend", default=MODEL_BACKEND)
+    parser.add_argument("--batch-size", type=int, default=BATCH_MAX_SIZE)
+    parser.add_argument("--workers", type=int, default=DECODE_WORKERS, help="decoder workers")
+    parser.add_argument("--processes", action="store_true",
+                        help="decode in worker processes instead of threads")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="decodes kept in flight (default: 4 batches)")
+    args = parser.parse_args()
+    args.prefetch = args.prefetch or 4 * args.batch_size
+
+    print(json.dumps(score(args), indent=2))
+
+
+if __name__ == "__main__":
+    main()
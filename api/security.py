@@ -0,0 +1,114 @@
+import hmac
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import Depends, HTTPException
+from fastapi.security import OAuth2PasswordBearer
+from jose import jwt
+from pydantic import BaseModel
+
+import repository
+from config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, TOKEN_CACHE_SIZE
+from metrics import REGISTRY
+
+# OAuth2 scheme
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+
+
+class CurrentUser(BaseModel):
+    id: Optional[int]
+    username: str
+    is_admin: bool = False
+
+
+# Token Generation
+def create_access_token(data: dict):
+    to_encode = data.copy()
+    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode.update({"exp": expire})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+
+class TokenCache:
+    """
+    Bounded LRU of tokens that already passed signature verification.
+
+    Entries are keyed by the token's signature segment and hold the signed
+    header.payload it belongs to, so a lookup only succeeds for the exact
+    token that was verified. Each entry is dropped once the token expires.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = REGISTRY.counter("token_cache_hits")
+        self.misses = REGISTRY.counter("token_cache_misses")
+
+    def get(self, token):
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is not None:
+                cached_input, user, expires_at = entry
+                if time.time() < expires_at and hmac.compare_digest(cached_input, signing_input):
+                    self._entries.move_to_end(signature)
+                    self.hits.inc()
+                    return user
+                del self._entries[signature]
+        self.misses.inc()
+        return None
+
+    def put(self, token, user, expires_at):
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            self._entries[signature] = (signing_input, user, expires_at)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+TOKEN_CACHE = TokenCache(TOKEN_CACHE_SIZE)
+
+
+def verify_access_token(token: str) -> CurrentUser:
+    """Decode and verify a token, reusing the result for repeat requests."""
+    user = TOKEN_CACHE.get(token)
+    if user is not None:
+        return user
+
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.JWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+    username = payload.get("sub")
+    if not username:
+        raise HTTPException(status_code=401, detail="Could not validate credentials",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+    user = CurrentUser(id=payload.get("uid"), username=username,
+                       is_admin=bool(payload.get("is_admin")))
+    # Tokens issued before the uid claim existed are resolved by the caller
+    if user.id is not None:
+        TOKEN_CACHE.put(token, user, payload["exp"])
+    return user
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> CurrentUser:
+    user = verify_access_token(token)
+    if user.id is None:
+        user_id = await repository.get_user_id(user.username)
+        if not user_id:
+            raise HTTPException(status_code=401, detail="User not found")
+        user = CurrentUser(id=user_id, username=user.username, is_admin=user.is_admin)
+    return user
+
+
+async def require_admin(user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
+    if not user.is_admin:
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return user
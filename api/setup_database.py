@@ -2,6 +2,7 @@ import mysql.connector
 from mysql.connector import Error
 from dotenv import load_dotenv
 from config import DB_CONFIG
+from migrations import apply_migrations
 
 # Load environment variables
 load_dotenv()
@@ -49,6 +50,9 @@ def create_database():
             )
         """)
         print("History table created successfully")
+
+        # Indexes added after the initial schema
+        apply_migrations(cursor, DB_CONFIG['database'])
         
         # Create an admin user if it doesn't exist
         cursor.execute("SELECT COUNT(*) FROM users WHERE is_admin = TRUE")
@@ -0,0 +1,156 @@
+"""
+Limits and checks for uploaded images.
+
+Request bodies are capped by UploadLimitMiddleware. A declared
+Content-Length over the limit is refused before any of the body is read.
+Otherwise the body is counted chunk by chunk as the multipart parser
+receives it, and the request is cut off with a 413 as soon as it goes over
+the limit. Each file in the upload is spooled in memory up to
+UPLOAD_SPOOL_BYTES and to a temporary file beyond that, so an upload in
+flight holds at most that much memory, whatever its size.
+
+check_image() then reads only the header of a spooled upload. It checks
+the magic bytes against the accepted formats, and the image dimensions
+against UPLOAD_MAX_PIXELS, before anything decodes it. That stops both
+non-images and decompression bombs, small files that expand to huge pixel
+buffers. Uploads that pass are read from the spooled file by the decoder
+and the image store, without being copied into a bytes object first.
+"""
+import json
+
+from fastapi import HTTPException
+from PIL import Image, UnidentifiedImageError
+from starlette.formparsers import MultiPartParser
+
+from config import UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, UPLOAD_SPOOL_BYTES
+from metrics import REGISTRY
+
+# Starlette spools each uploaded file in memory up to this size, then on disk
+MultiPartParser.max_file_size = UPLOAD_SPOOL_BYTES
+
+# (offset, magic bytes, PIL format)
+SIGNATURES = [
+    (0, b"\xff\xd8\xff", "JPEG"),
+    (0, b"\x89PNG\r\n\x1a\n", "PNG"),
+    (8, b"WEBP", "WEBP"),
+    (0, b"GIF87a", "GIF"),
+    (0, b"GIF89a", "GIF"),
+    (0, b"BM", "BMP"),
+    (0, b"II*\x00", "TIFF"),
+    (0, b"MM\x00*", "TIFF"),
+]
+SNIFF_BYTES = 16
+
+SIZE_BUCKETS = (2**14, 2**16, 2**18, 2**20, 2**21, 2**22, 2**23, 2**24, 2**25, 2**26)
+
+
+def sniff_format(header: bytes):
+    """The image format the leading bytes announce, or None."""
+    for offset, magic, image_format in SIGNATURES:
+        if header[offset:offset + len(magic)] == magic:
+            if image_format == "WEBP" and not header.startswith(b"RIFF"):
+                continue
+            return image_format
+    return None
+
+
+def check_image(fileobj, max_pixels=UPLOAD_MAX_PIXELS):
+    """
+    Check an upload from its header alone; returns (format, (width, height))
+    and leaves the file at its start. Raises 415 if it is not an image in a
+    supported format and 413 if it has more than `max_pixels` pixels.
+    """
+    fileobj.seek(0)
+    image_format = sniff_format(fileobj.read(SNIFF_BYTES))
+    fileobj.seek(0)
+    if image_format is None:
+        REGISTRY.counter("uploads_rejected", labels={"reason": "type"}).inc()
+        raise HTTPException(status_code=415, detail="Not a supported image file")
+    try:
+        # Parses the header only; pixels are decoded later, if at all
+        with Image.open(fileobj) as image:
+            width, height = image.size
+    except Image.DecompressionBombError:
+        width = height = max_pixels + 1
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        REGISTRY.counter("uploads_rejected", labels={"reason": "type"}).inc()
+        raise HTTPException(status_code=415, detail="Not a supported image file")
+    finally:
+        fileobj.seek(0)
+    if width * height > max_pixels:
+        REGISTRY.counter("uploads_rejected", labels={"reason": "pixels"}).inc()
+        raise HTTPException(status_code=413,
+                            detail=f"Image is larger than {max_pixels} pixels")
+    return image_format, (width, height)
+
+
+class BodyTooLarge(HTTPException):
+    """
+    Raised from receive() mid-body. An HTTPException, so FastAPI's body
+    parsing lets it through and it is answered like any other 413.
+    """
+
+    def __init__(self, limit):
+        super().__init__(status_code=413, detail=f"Upload is larger than {limit} bytes",
+                         headers={"Connection": "close"})
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware refusing request bodies larger than `max_bytes` with a
+    413. `limits` maps request paths to their own limit (e.g. a batch
+    endpoint). Also reports the uploads in flight, the body bytes they
+    have received so far, and the size of every body.
+    """
+
+    def __init__(self, app, max_bytes=UPLOAD_MAX_BYTES, limits=None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.limits = limits or {}
+        self.in_flight = 0
+        self.bytes_in_flight = 0
+        self.sizes = REGISTRY.histogram("upload_bytes", SIZE_BUCKETS)
+        self.rejected = REGISTRY.counter("uploads_rejected", labels={"reason": "size"})
+        REGISTRY.gauge("uploads_in_flight", lambda: self.in_flight)
+        REGISTRY.gauge("upload_bytes_in_flight", lambda: self.bytes_in_flight)
+
+    async def reject(self, send, limit):
+        self.rejected.inc()
+        body = json.dumps({"detail": BodyTooLarge(limit).detail}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode()),
+                                (b"connection", b"close")]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            return await self.app(scope, receive, send)
+
+        limit = self.limits.get(scope["path"], self.max_bytes)
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            return await self.reject(send, limit)
+
+        received = 0
+
+        async def counted_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = len(message.get("body", b""))
+                received += chunk
+                self.bytes_in_flight += chunk
+                if received > limit:
+                    self.rejected.inc()
+                    raise BodyTooLarge(limit)
+            return message
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, counted_receive, send)
+        finally:
+            self.in_flight -= 1
+            self.bytes_in_flight -= received
+            self.sizes.observe(received)
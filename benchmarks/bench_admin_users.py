@@ -0,0 +1,118 @@
+"""
+Admin user listing under load: the unbounded list vs keyset pages and the cache.
+
+Builds a scratch database (DB_NAME, default apple_disease_bench, on the
+server from api/config.py) with setup_database.py and fills it with
+`--users` generated users. Requests go to the auth app through httpx's
+in-process ASGI transport, `--concurrency` at a time, with the admin check
+bypassed:
+
+- legacy: the old GET /admin/users, every user validated through
+  UserResponse on each request (fewer requests: each one reads every user)
+- first_page / deep_page / search: GET /admin/users with the response
+  cache off, for the first page, a page near the end of the id range, and a
+  username prefix search
+- cached: the first page with the cache on, as dashboard refreshes see it
+
+    python benchmarks/bench_admin_users.py --users 500000 --requests 500 --concurrency 16
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import List
+
+from common import summarize
+
+os.environ.setdefault("DB_NAME", "apple_disease_bench")
+
+import httpx
+
+import auth
+import repository
+import setup_database
+from security import require_admin
+
+BATCH = 10000
+
+
+def seed(users):
+    with repository.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM users WHERE username LIKE 'bench\\_%'")
+        have = cursor.fetchone()["n"]
+    for start in range(have, users, BATCH):
+        with repository.transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO users (username, email, password_hash, is_admin) "
+                "VALUES (%s, %s, 'x', FALSE)",
+                [(f"bench_{i}", f"bench_{i}@example.com")
+                 for i in range(start, min(users, start + BATCH))])
+        print(f"Seeded {min(users, start + BATCH)}/{users} users", flush=True)
+
+
+def add_legacy_route(app):
+    @app.get("/bench/legacy-users", response_model=List[auth.UserResponse])
+    async def legacy_users():
+        return await asyncio.get_running_loop().run_in_executor(
+            repository.DB_EXECUTOR, repository._execute,
+            "SELECT id, username, email, is_admin FROM users", (), "all")
+
+
+async def load(client, url, requests, concurrency):
+    latencies = []
+    sizes = []
+    remaining = iter(range(requests))
+
+    async def worker():
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await client.get(url)
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+            sizes.append(len(response.content))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {**summarize(latencies), "requests_per_second": len(latencies) / elapsed,
+            "response_kb": sizes[-1] / 1e3}
+
+
+async def main(args):
+    setup_database.create_database()
+    seed(args.users)
+    auth.app.dependency_overrides[require_admin] = lambda: None
+    add_legacy_route(auth.app)
+
+    with repository.transaction() as cursor:
+        cursor.execute("SELECT MAX(id) AS id FROM users")
+        deep = auth.encode_user_cursor(cursor.fetchone()["id"] - 5 * args.page_size)
+    page = f"/admin/users?limit={args.page_size}"
+    scenarios = {
+        "legacy": ("/bench/legacy-users", args.legacy_requests, 0),
+        "first_page": (page, args.requests, 0),
+        "deep_page": (f"{page}&cursor={deep}", args.requests, 0),
+        "search": (f"{page}&q=bench_4999", args.requests, 0),
+        "cached": (page, args.requests, 10),
+    }
+    report = {"users": args.users, "page_size": args.page_size,
+              "concurrency": args.concurrency, "scenarios": {}}
+    transport = httpx.ASGITransport(app=auth.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench",
+                                 timeout=None) as client:
+        for name, (url, requests, ttl) in scenarios.items():
+            auth.USERS_CACHE.ttl = ttl
+            auth.USERS_CACHE.clear()
+            report["scenarios"][name] = await load(client, url, requests, args.concurrency)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=500000)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--legacy-requests", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--page-size", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
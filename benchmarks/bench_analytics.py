@@ -0,0 +1,159 @@
+"""
+Admin analytics latency: aggregate queries over history vs the rollup tables.
+
+Builds a scratch database (DB_NAME, default apple_disease_bench, on the
+server from api/config.py) with setup_database.py, and fills it with
+`--rows` generated history rows spread over `--users` users and `--days`
+days. The rollups are then rebuilt with `analytics.py backfill`, timed.
+
+Each admin report is timed both ways:
+
+- naive: the GROUP BY over the history table that computing it by hand takes
+- rollup: the repository query behind the /admin/analytics endpoint
+
+and their counts compared. The cost on the write path is the latency of
+repository.insert_history (history row plus rollups, one transaction)
+against a bare history INSERT.
+
+    python benchmarks/bench_analytics.py --rows 1000000 --users 5000 --days 365
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+
+from common import summarize
+
+os.environ.setdefault("DB_NAME", "apple_disease_bench")
+
+import analytics
+import repository
+import setup_database
+
+CLASSES = ["Alternaria leaf spot", "Brown spot", "Gray spot", "Healthy leaf", "Rust"]
+BATCH = 10000
+
+
+def seed(rows, users, days):
+    """Generate users and history rows until the history table holds `rows`."""
+    with repository.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM users WHERE username LIKE 'bench_%'")
+        have_users = cursor.fetchone()["n"]
+        cursor.executemany(
+            "INSERT INTO users (username, email, password_hash, is_admin) VALUES (%s, %s, 'x', FALSE)",
+            [(f"bench_{i}", f"bench_{i}@example.com") for i in range(have_users, users)])
+        cursor.execute("SELECT id FROM users WHERE username LIKE 'bench_%'")
+        user_ids = [row["id"] for row in cursor.fetchall()]
+        cursor.execute("SELECT COUNT(*) AS n FROM history")
+        have_rows = cursor.fetchone()["n"]
+
+    rng = random.Random(123)
+    now = datetime.now()
+    for start in range(have_rows, rows, BATCH):
+        batch = [(rng.choice(user_ids), rng.choice(CLASSES), rng.uniform(0.3, 1.0),
+                  "uploads/images/bench.jpg", now - timedelta(seconds=rng.uniform(0, days * 86400)))
+                 for _ in range(min(BATCH, rows - start))]
+        with repository.transaction() as cursor:
+            cursor.executemany(
+                "INSERT INTO history (user_id, disease_name, confidence, image_path, timestamp) "
+                "VALUES (%s, %s, %s, %s, %s)", batch)
+        print(f"Seeded {start + len(batch)}/{rows} history rows", flush=True)
+    return user_ids
+
+
+def naive(sql, params=()):
+    def run():
+        return repository._execute(sql, params, fetch="all")
+    return run
+
+
+def timed(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def write_latency(user_id, count):
+    """Per-insert latency with and without the rollup updates; rows are deleted afterwards."""
+    with_rollups, without = [], []
+    for i in range(count):
+        start = time.perf_counter()
+        history_id = repository.insert_history.sync(user_id, CLASSES[i % 5], 0.9, "bench.jpg")
+        with_rollups.append(time.perf_counter() - start)
+        repository.delete_history_item.sync(history_id)
+
+        start = time.perf_counter()
+        history_id = repository._execute(
+            "INSERT INTO history (user_id, disease_name, confidence, image_path) "
+            "VALUES (%s, %s, 0.9, 'bench.jpg')", (user_id, CLASSES[i % 5]), commit=True)
+        without.append(time.perf_counter() - start)
+        repository._execute("DELETE FROM history WHERE id = %s", (history_id,), commit=True)
+    return summarize(with_rollups), summarize(without)
+
+
+def main(args):
+    setup_database.create_database()
+    user_ids = seed(args.rows, args.users, args.days)
+
+    start = time.perf_counter()
+    analytics.backfill()
+    backfill_seconds = time.perf_counter() - start
+
+    until = date.today() + timedelta(days=1)
+    since = until - timedelta(days=30)
+    user_id = user_ids[len(user_ids) // 2]
+    reports = {
+        "diseases_last_30_days": (
+            naive("SELECT disease_name, COUNT(*) AS predictions FROM history "
+                  "WHERE timestamp >= %s AND timestamp < %s GROUP BY disease_name", (since, until)),
+            lambda: repository.disease_analytics.sync(since, until)),
+        "daily_last_30_days": (
+            naive("SELECT DATE(timestamp) AS day, disease_name, COUNT(*) AS predictions FROM history "
+                  "WHERE timestamp >= %s AND timestamp < %s "
+                  "GROUP BY DATE(timestamp), disease_name", (since, until)),
+            lambda: repository.daily_analytics.sync(since, until)),
+        "users_first_page": (
+            naive("SELECT user_id, COUNT(*) AS predictions FROM history "
+                  "GROUP BY user_id ORDER BY user_id LIMIT %s", (args.page_size,)),
+            lambda: repository.user_analytics.sync(args.page_size)),
+        "one_user_by_disease": (
+            naive("SELECT disease_name, COUNT(*) AS predictions FROM history "
+                  "WHERE user_id = %s GROUP BY disease_name", (user_id,)),
+            lambda: repository.user_disease_analytics.sync(user_id)),
+    }
+
+    report = {"rows": args.rows, "users": args.users, "days": args.days,
+              "backfill_seconds": backfill_seconds, "reports": {}}
+    for name, (naive_query, rollup_query) in reports.items():
+        naive_seconds, naive_rows = timed(naive_query, args.repeats)
+        rollup_seconds, rollup_rows = timed(rollup_query, args.repeats)
+        report["reports"][name] = {
+            "naive_ms": naive_seconds * 1000,
+            "rollup_ms": rollup_seconds * 1000,
+            "speedup": naive_seconds / rollup_seconds,
+            "rows_returned": len(rollup_rows),
+            "counts_match": (sum(int(r["predictions"]) for r in naive_rows)
+                             == sum(int(r["predictions"]) for r in rollup_rows)),
+        }
+    with_rollups, without = write_latency(user_id, args.writes)
+    report["insert_with_rollups"] = with_rollups
+    report["insert_without_rollups"] = without
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--writes", type=int, default=500,
+                        help="inserts timed with and without the rollup updates")
+    main(parser.parse_args())
@@ -0,0 +1,79 @@
+"""
+Microbenchmarks for request authentication.
+
+Compares verifying a bearer token from scratch (jwt.decode on every request,
+as the handlers used to) with security.verify_access_token(), which serves
+repeat tokens from the verified-token cache, and measures the full
+get_current_user dependency for tokens with and without the uid claim.
+
+    python benchmarks/bench_auth.py --iterations 20000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import common  # noqa: F401  (puts api/ on sys.path)
+
+from jose import jwt
+
+import repository
+import security
+from config import SECRET_KEY, ALGORITHM
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+async def per_await_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(args):
+    token = security.create_access_token({"sub": "bench_user", "uid": 1, "is_admin": False})
+    # Spread of distinct users to show the cache staying effective when full
+    tokens = [security.create_access_token({"sub": f"user{i}", "uid": i})
+              for i in range(args.users)]
+
+    # Tokens issued before the uid claim existed still need a lookup; stand
+    # in for the database with a fixed-latency function
+    def lookup(username):
+        time.sleep(args.lookup_ms / 1000)
+        return 1
+    repository.get_user_id = repository.db_call(lookup)
+    legacy_token = jwt.encode({"sub": "bench_user", "exp": time.time() + 3600},
+                              SECRET_KEY, algorithm=ALGORITHM)
+
+    counter = iter(range(10**12))
+
+    report = {
+        "iterations": args.iterations,
+        "jwt_decode_us": per_call_us(
+            lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]), args.iterations),
+        "verify_cached_us": per_call_us(
+            lambda: security.verify_access_token(token), args.iterations),
+        "verify_cached_many_users_us": per_call_us(
+            lambda: security.verify_access_token(tokens[next(counter) % len(tokens)]),
+            args.iterations),
+        "dependency_with_uid_us": asyncio.run(per_await_us(
+            lambda: security.get_current_user(token), args.iterations)),
+        "dependency_legacy_token_us": asyncio.run(per_await_us(
+            lambda: security.get_current_user(legacy_token), args.iterations // 100)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--lookup-ms", type=float, default=1.0,
+                        help="simulated users-table lookup for tokens without uid")
+    main(parser.parse_args())
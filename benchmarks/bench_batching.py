@@ -0,0 +1,88 @@
+"""
+Load test for the /predict micro-batcher.
+
+Drives the model with `--concurrency` simultaneous callers, first through the
+old one-request-one-forward-pass path and then through MicroBatcher, and
+prints throughput, latency percentiles and the observed batch sizes.
+
+    python benchmarks/bench_batching.py --requests 512 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from common import MODELS_DIR, sample_images, summarize
+
+from batching import MicroBatcher
+from metrics import REGISTRY
+
+
+async def drive(call, images, concurrency):
+    latencies = []
+    queue = asyncio.Queue()
+    for image in images:
+        queue.put_nowait(image)
+
+    async def client():
+        while not queue.empty():
+            image = queue.get_nowait()
+            start = time.perf_counter()
+            await call(image)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {"throughput_rps": len(images) / elapsed, **summarize(latencies)}
+
+
+async def main(args):
+    import tensorflow as tf
+    from PIL import Image
+
+    model = tf.keras.models.load_model(args.model, compile=False)
+    height, width = model.input_shape[1:3]
+    pool = [np.array(Image.open(p).convert("RGB").resize((width, height)))
+            for p in sample_images(64)]
+    images = [pool[i % len(pool)] for i in range(args.requests)]
+
+    # Warm up both code paths so graph tracing isn't measured
+    model.predict(np.expand_dims(pool[0], 0), verbose=0)
+    model.predict_on_batch(np.stack(pool[:args.batch_size]))
+
+    async def one_at_a_time(image):
+        # The pre-batching /predict handler: one blocking predict per request
+        model.predict(np.expand_dims(image, 0), verbose=0)
+
+    batcher = MicroBatcher(model.predict_on_batch,
+                           max_batch_size=args.batch_size,
+                           max_wait_ms=args.max_wait_ms)
+    await batcher.start()
+    try:
+        baseline = await drive(one_at_a_time, images, args.concurrency)
+        batched = await drive(batcher.submit, images, args.concurrency)
+    finally:
+        await batcher.stop()
+
+    report = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "one_at_a_time": baseline,
+        "batched": batched,
+        "speedup": batched["throughput_rps"] / baseline["throughput_rps"],
+        "batcher_stats": REGISTRY.snapshot(),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=str(MODELS_DIR / "1.keras"))
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Accuracy vs compute of the confidence-gated cascade at several thresholds.
+
+Scores a stratified sample of training/archive1 with the cheap model
+(models/<--version>.keras) once, with its TTA views (api/cascade.py) and, if
+--escalation-version is given, with the larger model. Each is timed per
+image in batches of --batch-size. For every threshold in --thresholds it
+reports, for both escalation modes, the fraction of images escalated, the
+accuracy overall and on Brown spot / Alternaria leaf spot, and the mean
+model time per image: the first pass for every image plus the escalation
+for the escalated fraction. "always" rows escalate every image, the cost
+of applying TTA or the larger model to all traffic.
+
+    python benchmarks/bench_cascade.py --images 500 --views 4 --escalation-version 2
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from common import DATASET_DIR, MODELS_DIR
+
+from cascade import tta_views
+from export_model import calibration_images
+from preprocessing import decode_image
+from runtimes import load_runtime
+
+CLASS_NAMES = ['Alternaria leaf spot', 'Brown spot', 'Gray spot', 'Healthy leaf', 'Rust']
+HARD_CLASSES = ['Alternaria leaf spot', 'Brown spot']
+
+
+def load_dataset(count, input_size, seed=1):
+    paths = calibration_images(DATASET_DIR, count, seed=seed)
+    images = np.stack([decode_image(p, input_size) for p in paths])
+    labels = np.array([CLASS_NAMES.index(p.parent.name) for p in paths])
+    return paths, images, labels
+
+
+def predict(runtime, images, batch_size):
+    """(predictions, seconds per image) over `images` in batches."""
+    runtime.predict(images[:batch_size])  # trace / allocate before timing
+    start = time.perf_counter()
+    predictions = np.concatenate([runtime.predict(images[i:i + batch_size])
+                                  for i in range(0, len(images), batch_size)])
+    return predictions, (time.perf_counter() - start) / len(images)
+
+
+def predict_tta(runtime, images, first, views, batch_size):
+    """Mean softmax over each image and its views, and the views' seconds per image."""
+    stacked = np.stack([view for image in images for view in tta_views(image, views)])
+    predictions, per_view = predict(runtime, stacked, batch_size)
+    per_image = predictions.reshape(len(images), -1, predictions.shape[-1])
+    return (first + per_image.sum(axis=1)) / (1 + per_image.shape[1]), per_view * per_image.shape[1]
+
+
+def score(predictions, labels):
+    predicted = predictions.argmax(axis=1)
+    result = {"accuracy": float((predicted == labels).mean())}
+    for name in HARD_CLASSES:
+        mask = labels == CLASS_NAMES.index(name)
+        result[f"{name} accuracy"] = float((predicted[mask] == labels[mask]).mean()) if mask.any() else None
+    return result
+
+
+def main(args):
+    cheap = load_runtime("keras", MODELS_DIR / f"{args.version}.keras")
+    paths, images, labels = load_dataset(args.images, cheap.input_size)
+    first, first_cost = predict(cheap, images, args.batch_size)
+    confidence = first.max(axis=1)
+
+    escalations = {}
+    tta, tta_cost = predict_tta(cheap, images, first, args.views, args.batch_size)
+    escalations["tta"] = (tta, tta_cost)
+    if args.escalation_version:
+        large = load_runtime("keras", MODELS_DIR / f"{args.escalation_version}.keras")
+        large_images = (images if tuple(large.input_size) == tuple(cheap.input_size)
+                        else np.stack([decode_image(p, large.input_size) for p in paths]))
+        escalations["model"] = predict(large, large_images, args.batch_size)
+
+    rows = [{"mode": "single", "threshold": None, "escalated": 0.0,
+             "ms_per_image": first_cost * 1000, **score(first, labels)}]
+    for mode, (escalated_predictions, escalation_cost) in escalations.items():
+        for threshold in [*args.thresholds, None]:
+            hard = confidence < threshold if threshold is not None else np.ones(len(images), bool)
+            combined = np.where(hard[:, None], escalated_predictions, first)
+            rows.append({
+                "mode": mode,
+                "threshold": threshold if threshold is not None else "always",
+                "escalated": float(hard.mean()),
+                "ms_per_image": (first_cost + hard.mean() * escalation_cost) * 1000,
+                **score(combined, labels),
+            })
+
+    print(f"| mode | threshold | escalated | ms/img | accuracy | {' | '.join(HARD_CLASSES)} |")
+    print("|---|---|---|---|---|" + "---|" * len(HARD_CLASSES))
+    for row in rows:
+        hard = " | ".join("-" if row[f"{n} accuracy"] is None else f"{row[f'{n} accuracy']:.3f}"
+                          for n in HARD_CLASSES)
+        print(f"| {row['mode']} | {row['threshold'] if row['threshold'] is not None else '-'} | "
+              f"{row['escalated']:.2f} | {row['ms_per_image']:.2f} | {row['accuracy']:.3f} | {hard} |")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"images": len(images), "views": args.views, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--version", default="1", help="cheap model: models/<version>.keras")
+    parser.add_argument("--escalation-version", help="larger model: models/<version>.keras")
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--views", type=int, default=4, help="TTA views besides the original")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.6, 0.7, 0.8, 0.9])
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--output", help="also write the report as JSON")
+    main(parser.parse_args())
@@ -0,0 +1,78 @@
+"""
+Cold start of a prediction worker.
+
+Starts `uvicorn main:app` in a fresh process and measures, from launch, when
+/live first answers, when /ready turns green and when the first /predict
+succeeds, along with the phase timings the worker reports. Each run starts a
+new process so TensorFlow import and model load are included.
+
+    python benchmarks/bench_cold_start.py --runs 3 --port 8100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from common import API_DIR, sample_images
+
+
+def wait_for(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if predicate():
+                return True
+        except httpx.TransportError:
+            pass
+        time.sleep(0.02)
+    return False
+
+
+def cold_start(args, image):
+    base = f"http://127.0.0.1:{args.port}"
+    env = dict(os.environ, WARMUP_BATCH_SIZES=args.warmup) if args.warmup else None
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port)],
+        cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        with httpx.Client(timeout=30) as client:
+            wait_for(lambda: client.get(f"{base}/live").status_code == 200, args.timeout)
+            live = time.perf_counter() - start
+            if not wait_for(lambda: client.get(f"{base}/ready").status_code == 200, args.timeout):
+                raise SystemExit(f"Worker not ready after {args.timeout}s: "
+                                 f"{client.get(f'{base}/ready').json()}")
+            ready = time.perf_counter() - start
+            response = client.post(f"{base}/predict", files={"file": ("leaf.jpg", image)})
+            response.raise_for_status()
+            first_prediction = time.perf_counter() - start
+            reported = client.get(f"{base}/ready").json()
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "live_s": live,
+        "ready_s": ready,
+        "first_prediction_s": first_prediction,
+        "first_prediction_server_timing": response.headers.get("Server-Timing"),
+        "reported": reported,
+    }
+
+
+def main(args):
+    image = sample_images(1)[0].read_bytes()
+    runs = [cold_start(args, image) for _ in range(args.runs)]
+    print(json.dumps({"runs": runs}, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--warmup", help="override WARMUP_BATCH_SIZES, e.g. '1' or '1,8,16'")
+    main(parser.parse_args())
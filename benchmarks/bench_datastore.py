@@ -0,0 +1,88 @@
+"""
+Epoch time and memory of the training input pipeline.
+
+Compares the notebooks' pipeline (image_dataset_from_directory + .cache())
+with the memory-mapped store from training/datastore.py. Each pipeline runs
+in its own process so peak RSS is measured separately; every epoch iterates
+the full dataset with the notebooks' augmentation, without training a model.
+
+    python benchmarks/bench_datastore.py --size 256 --epochs 3
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+from common import DATASET_DIR, ROOT
+
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+
+def directory_pipeline(args):
+    import tensorflow as tf
+    from training.datastore import augmentation
+
+    ds = tf.keras.preprocessing.image_dataset_from_directory(
+        DATASET_DIR, seed=123, shuffle=True, image_size=(args.size, args.size),
+        batch_size=args.batch_size)
+    layers = augmentation()
+    ds = ds.cache().map(lambda x, y: (layers(x, training=True), y))
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def store_pipeline(args):
+    from training.datastore import open_store, to_dataset
+
+    start = time.perf_counter()
+    store = open_store(DATASET_DIR, (args.size, args.size))
+    print(f"store ready in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return to_dataset(store, batch_size=args.batch_size, shuffle=True, augment=True, seed=123)
+
+
+def run(args):
+    build = directory_pipeline if args.pipeline == "directory" else store_pipeline
+    start = time.perf_counter()
+    ds = build(args)
+    setup = time.perf_counter() - start
+
+    epochs = []
+    for _ in range(args.epochs):
+        start = time.perf_counter()
+        for _ in ds:
+            pass
+        epochs.append(time.perf_counter() - start)
+    print(json.dumps({
+        "pipeline": args.pipeline,
+        "setup_s": setup,
+        "epoch_s": epochs,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def main(args):
+    results = []
+    for pipeline in ("directory", "store"):
+        output = subprocess.run(
+            [sys.executable, __file__, "--pipeline", pipeline, "--size", str(args.size),
+             "--epochs", str(args.epochs), "--batch-size", str(args.batch_size)],
+            check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--epochs", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--pipeline", choices=("directory", "store"),
+                        help="run a single pipeline in this process")
+    args = parser.parse_args()
+    if args.pipeline:
+        run(args)
+    else:
+        main(args)
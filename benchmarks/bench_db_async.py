@@ -0,0 +1,98 @@
+"""
+Latency of /login and /history under concurrent load, with queries run
+inline on the event loop ("inline", the old behaviour) and on the database
+thread pool ("threaded").
+
+Runs the auth app in-process against the MySQL database from api/config.py
+(DB_* environment variables). A benchmark user and some history rows are
+created on first run.
+
+    python benchmarks/bench_db_async.py --requests 2000 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from common import summarize
+
+# Every request logs in as the same user; keep the rate limiter out of the way
+os.environ.setdefault("LOGIN_RATE_PER_IP", "1000000")
+os.environ.setdefault("LOGIN_RATE_PER_USERNAME", "1000000")
+
+import auth
+import repository
+from werkzeug.security import generate_password_hash
+
+USERNAME = "bench_user"
+PASSWORD = "BenchPassw0rd"
+
+
+def seed(history_rows):
+    user = repository.get_user_by_username.sync(USERNAME)
+    if not user:
+        repository.create_user.sync(
+            USERNAME, f"{USERNAME}@example.com", generate_password_hash(PASSWORD), False)
+    user_id = repository.get_user_id.sync(USERNAME)
+    existing = len(repository.list_history.sync(user_id, history_rows))
+    for i in range(existing, history_rows):
+        repository.insert_history.sync(user_id, "Rust", 0.9, f"uploads/images/bench_{i}.jpg")
+
+
+async def run(requests, concurrency):
+    transport = httpx.ASGITransport(app=auth.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/login", json={"username": USERNAME, "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        latencies = {"login": [], "history": []}
+        remaining = iter(range(requests))
+
+        async def worker():
+            for i in remaining:
+                # One login for every four history reads
+                endpoint = "login" if i % 5 == 0 else "history"
+                start = time.perf_counter()
+                if endpoint == "login":
+                    r = await client.post("/login", json={"username": USERNAME, "password": PASSWORD})
+                else:
+                    r = await client.get("/history", headers=headers)
+                r.raise_for_status()
+                latencies[endpoint].append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "throughput_rps": requests / elapsed,
+        **{endpoint: summarize(samples) for endpoint, samples in latencies.items()},
+    }
+
+
+def main(args):
+    seed(args.history_rows)
+    threaded_executor = repository.DB_EXECUTOR
+
+    repository.DB_EXECUTOR = None
+    inline = asyncio.run(run(args.requests, args.concurrency))
+    repository.DB_EXECUTOR = threaded_executor
+    threaded = asyncio.run(run(args.requests, args.concurrency))
+
+    print(json.dumps({
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "inline": inline,
+        "threaded": threaded,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--history-rows", type=int, default=200)
+    main(parser.parse_args())
@@ -0,0 +1,96 @@
+"""
+Disk usage and history-page bytes: per-upload files vs the image store.
+
+Simulates `--uploads` history uploads drawn from `--images` distinct photos,
+so the same photo is uploaded several times, as when a user re-checks a
+leaf. "legacy" writes every upload to its own uploads/images/<timestamp>_<name>
+file, as history.py used to. "store" writes through images.ImageStore, which
+keeps one original per distinct image plus a WebP thumbnail. The history
+page bytes are what a page of `--page-size` entries downloads: originals for
+legacy, thumbnails for the store. No database is needed; only the store's
+file writes are timed.
+
+    python benchmarks/bench_image_store.py --uploads 500 --images 100 --phone-size 4032x3024
+"""
+import argparse
+import json
+import random
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+from common import sample_images
+
+from images import ImageStore
+
+
+def make_uploads(paths, phone_size):
+    uploads = []
+    for path in paths:
+        if phone_size is None:
+            uploads.append(path.read_bytes())
+            continue
+        buffer = BytesIO()
+        Image.open(path).convert("RGB").resize(phone_size).save(buffer, "JPEG", quality=90)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+def directory_bytes(root):
+    return sum(p.stat().st_size for p in Path(root).rglob("*") if p.is_file())
+
+
+def main(args):
+    phone_size = None
+    if args.phone_size != "none":
+        phone_size = tuple(int(v) for v in args.phone_size.split("x"))
+    photos = make_uploads(sample_images(args.images), phone_size)
+    rng = random.Random(123)
+    sequence = [rng.randrange(len(photos)) for _ in range(args.uploads)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_dir = Path(tmp) / "legacy"
+        legacy_dir.mkdir()
+        for i, index in enumerate(sequence):
+            (legacy_dir / f"{i:06d}_leaf.jpg").write_bytes(photos[index])
+
+        store = ImageStore(Path(tmp) / "store")
+        write_times = []
+        page = []
+        for index in sequence:
+            start = time.perf_counter()
+            stored, tmp, _ = store.stage(BytesIO(photos[index]))
+            store.place(stored, tmp)
+            write_times.append(time.perf_counter() - start)
+            page.append(stored)
+
+        recent = page[-args.page_size:]
+        legacy_page = sum(len(photos[index]) for index in sequence[-args.page_size:])
+        store_page = sum(store.thumbnail_path(s.digest).stat().st_size for s in recent)
+        report = {
+            "uploads": args.uploads,
+            "distinct_images": len(set(sequence)),
+            "upload_size": args.phone_size,
+            "legacy_disk_mb": directory_bytes(legacy_dir) / 1e6,
+            "store_disk_mb": directory_bytes(store.root) / 1e6,
+            "store_thumbnails_mb": directory_bytes(store.thumbnails) / 1e6,
+            "legacy_page_kb": legacy_page / 1e3,
+            "store_page_kb": store_page / 1e3,
+            "store_write_mean_ms": 1000 * sum(write_times) / len(write_times),
+        }
+    report["disk_reduction"] = report["legacy_disk_mb"] / report["store_disk_mb"]
+    report["page_reduction"] = report["legacy_page_kb"] / report["store_page_kb"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uploads", type=int, default=500)
+    parser.add_argument("--images", type=int, default=100, help="distinct photos uploaded")
+    parser.add_argument("--page-size", type=int, default=50)
+    parser.add_argument("--phone-size", default="4032x3024",
+                        help="WIDTHxHEIGHT to re-encode uploads at, or 'none'")
+    main(parser.parse_args())
@@ -0,0 +1,104 @@
+"""
+/ping latency on the auth service while it is flooded with logins.
+
+With password hashing inline on the event loop ("inline", the old
+behaviour) every login freezes the worker for a full KDF, so /ping waits
+behind them. With the hashing pool ("pooled") /ping stays fast and excess
+logins are shed with 503s. The users table is replaced by an in-memory user
+so only hashing is measured; no database is needed.
+
+    python benchmarks/bench_login_storm.py --logins 200 --concurrency 32
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import httpx
+
+from common import summarize
+
+# Measure hashing, not the login rate limiter
+os.environ.setdefault("LOGIN_RATE_PER_IP", "1000000")
+os.environ.setdefault("LOGIN_RATE_PER_USERNAME", "1000000")
+
+import auth
+import passwords
+import repository
+from werkzeug.security import generate_password_hash
+from config import PASSWORD_HASH_METHOD
+
+PASSWORD = "BenchPassw0rd"
+
+
+async def storm(logins, concurrency, ping_interval):
+    transport = httpx.ASGITransport(app=auth.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        statuses = Counter()
+        pings = []
+        remaining = iter(range(logins))
+        done = asyncio.Event()
+
+        async def login_worker():
+            for _ in remaining:
+                r = await client.post("/login", json={"username": "bench_user", "password": PASSWORD})
+                statuses[r.status_code] += 1
+
+        async def pinger():
+            # Latency is measured from when each ping was due, so time spent
+            # waiting for a blocked event loop to get to it is counted too
+            due = time.perf_counter()
+            while not done.is_set():
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                await client.get("/ping")
+                pings.append(time.perf_counter() - due)
+                due += ping_interval
+
+        ping_task = asyncio.create_task(pinger())
+        start = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await ping_task
+
+    return {
+        "elapsed_s": elapsed,
+        "login_statuses": dict(statuses),
+        "ping": summarize(pings),
+    }
+
+
+def main(args):
+    user = {
+        "id": 1, "username": "bench_user", "email": "bench@example.com",
+        "password_hash": generate_password_hash(PASSWORD, method=PASSWORD_HASH_METHOD),
+        "is_admin": False,
+    }
+
+    async def get_user_by_username(username):
+        return user
+    repository.get_user_by_username = get_user_by_username
+
+    pooled_executor = passwords.HASH_EXECUTOR
+    passwords.HASH_EXECUTOR = None
+    inline = asyncio.run(storm(args.logins, args.concurrency, args.ping_interval))
+    passwords.HASH_EXECUTOR = pooled_executor
+    pooled = asyncio.run(storm(args.logins, args.concurrency, args.ping_interval))
+
+    print(json.dumps({
+        "hash_method": PASSWORD_HASH_METHOD,
+        "logins": args.logins,
+        "concurrency": args.concurrency,
+        "inline": inline,
+        "pooled": pooled,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--ping-interval", type=float, default=0.01)
+    main(parser.parse_args())
@@ -0,0 +1,156 @@
+"""
+Cost of the request instrumentation (MetricsMiddleware plus per-stage timers).
+
+Serves an upload-and-decode endpoint shaped like /predict from two
+otherwise identical apps: "plain" has no instrumentation; "instrumented"
+adds MetricsMiddleware, the upload/decode/preprocess/inference stage timers
+and the per-class prediction counters, as api/main.py does. Requests go
+through httpx's in-process ASGI transport, interleaved between the apps so
+both see the same machine state. There is no model, so the measured
+latency is a lower bound for a real /predict and the overhead percentage
+an upper bound; the overhead is also reported against a request that
+additionally spends --inference-ms in the model.
+
+The instrumentation alone is also timed in a tight loop around a no-op
+app, which gives its cost per request without the noise of a full request.
+
+    python benchmarks/bench_metrics.py --requests 2000
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from common import sample_images, summarize
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, File, Request, UploadFile
+
+from executors import StageTimer
+from metrics import REGISTRY, MetricsMiddleware
+from preprocessing import decode_image
+
+SIZE = (256, 256)
+CLASSES = ["Alternaria leaf spot", "Brown spot", "Gray spot", "Healthy leaf", "Rust"]
+
+
+def fake_model(image):
+    # Stands in for the forward pass: cheap, so it doesn't hide the overhead
+    return np.full(len(CLASSES), 1 / len(CLASSES), dtype=np.float32)
+
+
+def plain_app():
+    app = FastAPI()
+
+    @app.post("/predict")
+    async def predict(file: UploadFile = File(...)):
+        image = decode_image(file.file, SIZE)
+        prediction = fake_model(image)
+        index = int(np.argmax(prediction))
+        return {"class": CLASSES[index], "confidence": float(prediction[index])}
+
+    return app
+
+
+def instrumented_app():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+    counts = {name: REGISTRY.counter("bench_predictions", labels={"class": name})
+              for name in CLASSES}
+    confidence = REGISTRY.histogram("bench_confidence", (0.2, 0.4, 0.6, 0.8, 1.0))
+
+    @app.post("/predict")
+    async def predict(request: Request, file: UploadFile = File(...)):
+        timer = StageTimer("bench")
+        timer.record("upload", time.perf_counter() - request.scope["metrics_start"])
+        with timer.stage("image"):
+            image = decode_image(file.file, SIZE, timer=timer)
+        with timer.stage("inference"):
+            prediction = fake_model(image)
+        index = int(np.argmax(prediction))
+        counts[CLASSES[index]].inc()
+        confidence.observe(float(prediction[index]))
+        timer.server_timing()
+        return {"class": CLASSES[index], "confidence": float(prediction[index])}
+
+    return app
+
+
+async def instrumentation_us(iterations):
+    """Per-request cost of the middleware and stage timers around a no-op app."""
+    async def noop(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message):
+        pass
+
+    middleware = MetricsMiddleware(noop)
+    scope = {"type": "http", "method": "POST", "path": "/predict", "root_path": ""}
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await noop(dict(scope), None, send)
+    bare = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await middleware(dict(scope), None, send)
+        timer = StageTimer("bench_noop")
+        timer.record("upload", 0.0)
+        for stage in ("cache", "image", "decode", "preprocess", "inference"):
+            with timer.stage(stage):
+                pass
+        timer.server_timing()
+    instrumented = time.perf_counter() - start
+    return (instrumented - bare) / iterations * 1e6
+
+
+async def main(args):
+    uploads = [path.read_bytes() for path in sample_images(args.images)]
+    clients = {
+        name: httpx.AsyncClient(transport=httpx.ASGITransport(app=build()),
+                                base_url="http://bench")
+        for name, build in (("plain", plain_app), ("instrumented", instrumented_app))
+    }
+    latencies = {name: [] for name in clients}
+    for i in range(args.warmup + args.requests):
+        data = uploads[i % len(uploads)]
+        # Alternate which app goes first so neither always runs on a warmer cache
+        for name, client in sorted(clients.items(), reverse=bool(i % 2)):
+            start = time.perf_counter()
+            response = await client.post("/predict", files={"file": ("leaf.jpg", data)})
+            elapsed = time.perf_counter() - start
+            response.raise_for_status()
+            if i >= args.warmup:
+                latencies[name].append(elapsed)
+    for client in clients.values():
+        await client.aclose()
+
+    cost_us = await instrumentation_us(args.iterations)
+    plain_median = statistics.median(latencies["plain"])
+    overhead = statistics.median(latencies["instrumented"]) - plain_median
+    print(json.dumps({
+        "requests": args.requests,
+        "plain": summarize(latencies["plain"]),
+        "instrumented": summarize(latencies["instrumented"]),
+        "median_overhead_us": overhead * 1e6,
+        "median_overhead_percent_without_model": overhead / plain_median * 100,
+        "median_overhead_percent_with_model": (
+            overhead / (plain_median + args.inference_ms / 1000) * 100),
+        "instrumentation_us_per_request": cost_us,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--inference-ms", type=float, default=20.0,
+                        help="model time per request assumed for the with-model percentage")
+    parser.add_argument("--iterations", type=int, default=100000,
+                        help="loop iterations for the instrumentation-only timing")
+    asyncio.run(main(parser.parse_args()))
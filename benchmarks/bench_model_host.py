@@ -0,0 +1,184 @@
+"""
+Memory and throughput: one model per worker process vs the shared model host.
+
+For each worker count in --workers, starts the prediction service twice
+with the prediction cache off:
+
+- per_process: `uvicorn main:app --workers N`, every worker loading the model
+- model_host: `python model_host.py` plus the same uvicorn command with
+  MODEL_HOST_SOCKET set, so only the host loads the model
+
+Once every worker answers /ready, --concurrency clients send POST /predict
+with images sampled from training/archive1 for --duration seconds. The report
+has throughput and latency, then the RSS and PSS (resident memory with
+shared pages split between the processes mapping them) of each process,
+read from /proc, so Linux only. The PSS total is the memory the topology
+really costs.
+
+    python benchmarks/bench_model_host.py --workers 1 2 4 --concurrency 32 --duration 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+from common import API_DIR, sample_images, summarize
+
+SOCKET = "/tmp/apple-disease-bench-model-host.sock"
+
+
+def descendants(pid):
+    """pid and the pids of all its children, grandchildren, ..."""
+    pids = [pid]
+    for parent in pids:
+        for task in Path(f"/proc/{parent}/task").glob("*"):
+            children = (task / "children").read_text().split()
+            pids.extend(int(child) for child in children)
+    return pids
+
+
+def memory(pid):
+    """(rss_mb, pss_mb) of a process."""
+    values = {}
+    for line in Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()[1:]:
+        name, value = line.split(":", 1)
+        values[name] = int(value.split()[0]) / 1024
+    return values["Rss"], values["Pss"]
+
+
+def role(pid, server_pid, workers):
+    command = Path(f"/proc/{pid}/cmdline").read_bytes().replace(b"\0", b" ").decode()
+    if "model_host.py" in command:
+        return "model_host"
+    if "resource_tracker" in command:
+        return "resource_tracker"
+    # With one worker uvicorn serves from the process it was started as
+    if pid == server_pid and workers > 1:
+        return "supervisor"
+    return "worker"
+
+
+def processes(pids, server_pid, workers):
+    report = []
+    for pid in pids:
+        try:
+            rss, pss = memory(pid)
+            report.append({"pid": pid, "role": role(pid, server_pid, workers),
+                           "rss_mb": rss, "pss_mb": pss})
+        except (FileNotFoundError, ProcessLookupError):
+            pass  # exited meanwhile
+    return report
+
+
+def wait_until_ready(base, workers, timeout):
+    """Wait until `workers * 4` /ready checks in a row succeed, each on a new connection."""
+    deadline = time.perf_counter() + timeout
+    streak = 0
+    while streak < workers * 4:
+        if time.perf_counter() > deadline:
+            raise SystemExit(f"Workers not ready after {timeout}s")
+        try:
+            ok = httpx.get(f"{base}/ready", timeout=5).status_code == 200
+        except httpx.TransportError:
+            ok = False
+        streak = streak + 1 if ok else 0
+        if not ok:
+            time.sleep(0.2)
+
+
+async def load(base, images, concurrency, duration):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + duration
+
+        async def worker(rng):
+            nonlocal errors
+            while loop.time() < stop_at:
+                name, data = rng.choice(images)
+                start = time.perf_counter()
+                try:
+                    response = await client.post("/predict", files={"file": (name, data)})
+                    errors += response.status_code != 200
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker(random.Random(i)) for i in range(concurrency)))
+    return {**summarize(latencies), "errors": errors,
+            "requests_per_second": len(latencies) / duration}
+
+
+def run(args, topology, workers, images):
+    port = args.port
+    env = dict(os.environ, PREDICTION_CACHE_ENABLED="false")
+    host = None
+    if topology == "model_host":
+        env["MODEL_HOST_SOCKET"] = SOCKET
+        host = subprocess.Popen([sys.executable, "model_host.py", "--socket", SOCKET],
+                                cwd=API_DIR, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_ready(base, workers, args.timeout)
+        throughput = asyncio.run(load(base, images, args.concurrency, args.duration))
+        pids = descendants(server.pid) + (descendants(host.pid) if host else [])
+        procs = processes(pids, server.pid, workers)
+    finally:
+        for process in (server, host):
+            if process is not None:
+                process.terminate()
+                process.wait()
+    return {
+        "topology": topology,
+        "workers": workers,
+        **throughput,
+        "processes": procs,
+        "worker_rss_mb": [p["rss_mb"] for p in procs if p["role"] == "worker"],
+        "total_rss_mb": sum(p["rss_mb"] for p in procs),
+        "total_pss_mb": sum(p["pss_mb"] for p in procs),
+    }
+
+
+def main(args):
+    images = [(f"{p.parent.name}/{p.name}", p.read_bytes()) for p in sample_images(args.images)]
+    rows = [run(args, topology, workers, images)
+            for workers in args.workers for topology in ("per_process", "model_host")]
+
+    print("| topology | workers | req/s | p50 ms | p95 ms | RSS per worker MB | total PSS MB |")
+    print("|---|---|---|---|---|---|---|")
+    for row in rows:
+        per_worker = (sum(row["worker_rss_mb"]) / len(row["worker_rss_mb"])
+                      if row["worker_rss_mb"] else 0.0)
+        print(f"| {row['topology']} | {row['workers']} | {row['requests_per_second']:.1f} | "
+              f"{row['p50_ms']:.1f} | {row['p95_ms']:.1f} | {per_worker:.0f} | "
+              f"{row['total_pss_mb']:.0f} |")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"concurrency": args.concurrency, "duration_s": args.duration,
+                       "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--timeout", type=float, default=180, help="seconds to wait for the workers")
+    parser.add_argument("--output", help="also write the report as JSON")
+    main(parser.parse_args())
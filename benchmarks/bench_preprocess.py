@@ -0,0 +1,102 @@
+"""
+Compare upload preprocessing paths over training/archive1.
+
+"legacy" is the original read_file_as_image(): the whole upload is decoded
+at full resolution into an array and the model's Resizing layer shrinks it
+later. "pipeline" is preprocessing.decode_image(): draft-mode JPEG decoding,
+EXIF orientation, RGB conversion and a resize to the model input size.
+
+The archive images are small PNGs, so by default each one is also
+re-encoded as a phone-sized JPEG to mirror real uploads. Peak memory is the
+largest pixel buffer each path materialises per image.
+
+    python benchmarks/bench_preprocess.py --images 200 --phone-size 4032x3024
+"""
+import argparse
+import json
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from common import sample_images
+
+from preprocessing import decode_image
+
+
+def legacy(data, size):
+    return np.array(Image.open(BytesIO(data)))
+
+
+def legacy_peak(data, size):
+    # Decoded PIL image plus the full-resolution array copied from it
+    image = Image.open(BytesIO(data))
+    return 2 * image.size[0] * image.size[1] * len(image.getbands())
+
+
+def pipeline(data, size):
+    return decode_image(BytesIO(data), size)
+
+
+def pipeline_peak(data, size):
+    # Drafted PIL image plus the model-sized output array
+    image = Image.open(BytesIO(data))
+    image.draft("RGB", (size[1], size[0]))
+    return image.size[0] * image.size[1] * 3 + size[0] * size[1] * 3
+
+
+def run(fn, peak_fn, uploads, size):
+    durations, peaks = [], []
+    for data in uploads:
+        start = time.perf_counter()
+        fn(data, size)
+        durations.append(time.perf_counter() - start)
+        peaks.append(peak_fn(data, size))
+    return {
+        "mean_ms": 1000 * sum(durations) / len(durations),
+        "total_s": sum(durations),
+        "mean_peak_mb": sum(peaks) / len(peaks) / 2**20,
+        "max_peak_mb": max(peaks) / 2**20,
+    }
+
+
+def make_uploads(paths, phone_size):
+    uploads = []
+    for path in paths:
+        if phone_size is None:
+            uploads.append(path.read_bytes())
+            continue
+        buffer = BytesIO()
+        Image.open(path).convert("RGB").resize(phone_size).save(buffer, "JPEG", quality=90)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+def main(args):
+    size = (args.input_size, args.input_size)
+    phone_size = None
+    if args.phone_size != "none":
+        phone_size = tuple(int(v) for v in args.phone_size.split("x"))
+
+    uploads = make_uploads(sample_images(args.images), phone_size)
+    report = {
+        "images": len(uploads),
+        "upload_size": args.phone_size,
+        "input_size": size,
+        "legacy": run(legacy, legacy_peak, uploads, size),
+        "pipeline": run(pipeline, pipeline_peak, uploads, size),
+    }
+    report["speedup"] = report["legacy"]["mean_ms"] / report["pipeline"]["mean_ms"]
+    report["memory_reduction"] = (report["legacy"]["mean_peak_mb"]
+                                  / report["pipeline"]["mean_peak_mb"])
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--input-size", type=int, default=256)
+    parser.add_argument("--phone-size", default="4032x3024",
+                        help="WIDTHxHEIGHT to re-encode uploads at, or 'none'")
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+"""
+Throughput of the offline scoring pipeline as decoder workers are added.
+
+Runs api/score.py over a directory (training/archive1 by default) with
+1, 2, 4, ... decoder workers, threads and processes, writing to a scratch
+file, and reports images per second for each.
+
+    python benchmarks/bench_score.py --max-workers 8 --limit 2000
+"""
+import argparse
+import itertools
+import json
+import os
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+from common import DATASET_DIR, MODELS_DIR
+
+import score
+from config import MODEL_BACKEND
+
+
+def main(args):
+    find_images = score.find_images
+    if args.limit:
+        score.find_images = lambda root: itertools.islice(find_images(root), args.limit)
+
+    workers = [1]
+    while workers[-1] * 2 <= args.max_workers:
+        workers.append(workers[-1] * 2)
+
+    report = []
+    for processes in (False, True):
+        for count in workers:
+            with tempfile.TemporaryDirectory() as scratch:
+                stats = score.score(SimpleNamespace(
+                    root=args.root, output=str(Path(scratch) / "scores.ndjson"),
+                    models=str(MODELS_DIR), version=args.version, backend=MODEL_BACKEND,
+                    batch_size=args.batch_size, workers=count, processes=processes,
+                    prefetch=4 * args.batch_size))
+            report.append({
+                "workers": count,
+                "pool": "processes" if processes else "threads",
+                "images": stats["scored"] + stats["errors"],
+                "images_per_second": stats["images_per_second"],
+                "accuracy": stats["accuracy"],
+            })
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--root", default=str(DATASET_DIR))
+    parser.add_argument("--version", default=None)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--limit", type=int, default=2000, help="images per run (0 for all)")
+    main(parser.parse_args())
@@ -0,0 +1,64 @@
+"""
+Accuracy and wall time of two-stage training against the notebook's MobileNetV2.
+
+The baseline is training2.ipynb's recipe: frozen MobileNetV2, with every
+epoch running the whole backbone (training.train --mode end-to-end). The
+two-stage runs cache backbone features once and then train the head
+(--mode cached-features), optionally followed by fine-tuning. Every run
+trains on the same persisted split in its own process and is evaluated on
+the test split. Nothing is published to models/.
+
+    python benchmarks/bench_two_stage.py --baseline-epochs 50 --views 4 --fine-tune-epochs 5
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+from common import ROOT
+
+
+def run(name, *options):
+    run_name = f"bench-{name}"
+    subprocess.run([sys.executable, "-m", "training.train", "--arch", "mobilenetv2",
+                    "--run-name", run_name, "--fresh", "--no-publish", "--verbose", "0",
+                    *options], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+    with open(ROOT / "training" / "runs" / run_name / "report.json") as f:
+        report = json.load(f)
+    return {
+        "run": name,
+        "train_s": report["train_seconds"],
+        **{key.replace("_seconds", "_s"): report[key]
+           for key in ("features_seconds", "head_seconds", "fine_tune_seconds") if key in report},
+        "test_accuracy": report["test_accuracy"],
+        "test_per_class_accuracy": report["test_per_class_accuracy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--baseline-epochs", type=int, default=50)
+    parser.add_argument("--head-epochs", type=int, default=50)
+    parser.add_argument("--views", type=int, default=4)
+    parser.add_argument("--fine-tune-epochs", type=int, default=5)
+    parser.add_argument("--fine-tune-layers", type=int, default=30)
+    args = parser.parse_args()
+
+    results = [run("notebook", "--mode", "end-to-end", "--epochs", str(args.baseline_epochs))]
+    cached = ["--mode", "cached-features", "--epochs", str(args.head_epochs),
+              "--views", str(args.views)]
+    # train_s includes feature extraction only when the cache was cold (see features_s)
+    results.append(run("cached-features", *cached))
+    if args.fine_tune_epochs:
+        results.append(run("cached-features+fine-tune", *cached,
+                           "--fine-tune-epochs", str(args.fine_tune_epochs),
+                           "--fine-tune-layers", str(args.fine_tune_layers)))
+    baseline = results[0]
+    for result in results[1:]:
+        result["speedup"] = baseline["train_s"] / result["train_s"]
+        result["accuracy_delta"] = result["test_accuracy"] - baseline["test_accuracy"]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
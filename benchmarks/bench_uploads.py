@@ -0,0 +1,135 @@
+"""
+Memory per upload and rejection latency: reading uploads whole vs streaming them.
+
+Serves the same upload-and-decode endpoint two ways. "legacy" does what
+/predict and /history used to: `await file.read()` on the whole upload, then
+decode the bytes, with no size limit and no check before decoding.
+"streaming" runs behind UploadLimitMiddleware, checks the header with
+uploads.check_image() and decodes straight from the spooled upload, as the
+API does now. Each app gets three uploads, streamed from a file on disk by
+httpx's in-process ASGI transport:
+
+- photo: a phone-sized JPEG, accepted by both
+- oversized: `--oversize-mb` of data behind a JPEG signature
+- bomb: a small PNG with more pixels than UPLOAD_MAX_PIXELS (still under
+  Pillow's own bomb limit, so the legacy path decodes it)
+
+Memory is the tracemalloc peak above the baseline during a request: the
+upload bytes held in Python objects. Pillow's pixel buffers are not traced,
+so the bomb's decoded image shows in its latency, not its memory.
+
+    python benchmarks/bench_uploads.py --repeats 5 --oversize-mb 32
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from common import sample_images
+
+import httpx
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from PIL import Image
+
+from config import UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS
+from preprocessing import decode_image
+from uploads import UploadLimitMiddleware, check_image
+
+SIZE = (256, 256)
+
+
+def legacy_app():
+    app = FastAPI()
+
+    @app.post("/predict")
+    async def predict(file: UploadFile = File(...)):
+        data = await file.read()
+        try:
+            image = decode_image(io.BytesIO(data), SIZE)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Not a supported image file")
+        return {"shape": list(image.shape)}
+
+    return app
+
+
+def streaming_app():
+    app = FastAPI()
+    app.add_middleware(UploadLimitMiddleware)
+
+    @app.post("/predict")
+    async def predict(file: UploadFile = File(...)):
+        check_image(file.file)
+        image = decode_image(file.file, SIZE)
+        return {"shape": list(image.shape)}
+
+    return app
+
+
+def make_uploads(directory, oversize_mb):
+    """Write the three uploads to `directory`; returns {name: path}."""
+    directory = Path(directory)
+    photo = directory / "photo.jpg"
+    source = sample_images(1)
+    image = Image.open(source[0]).convert("RGB") if source else Image.new("RGB", (64, 64), "green")
+    image.resize((4032, 3024)).save(photo, "JPEG", quality=90)
+
+    oversized = directory / "oversized.jpg"
+    with open(oversized, "wb") as out:
+        out.write(b"\xff\xd8\xff\xe0")
+        for _ in range(oversize_mb):
+            out.write(os.urandom(2**20))
+
+    # Just over our pixel limit, under Pillow's (2 x MAX_IMAGE_PIXELS)
+    side = int((UPLOAD_MAX_PIXELS * 1.1) ** 0.5)
+    bomb = directory / "bomb.png"
+    Image.new("L", (side, side)).save(bomb, "PNG", optimize=True)
+    return {"photo": photo, "oversized": oversized, "bomb": bomb}
+
+
+async def measure(client, path):
+    """(status, seconds, peak traced bytes above the baseline) for one upload."""
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+    with open(path, "rb") as upload:
+        start = time.perf_counter()
+        response = await client.post("/predict", files={"file": (path.name, upload)})
+        elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    return response.status_code, elapsed, peak
+
+
+async def main(args):
+    apps = {"legacy": legacy_app(), "streaming": streaming_app()}
+    report = {"upload_max_bytes": UPLOAD_MAX_BYTES, "upload_max_pixels": UPLOAD_MAX_PIXELS,
+              "uploads": {}}
+    tracemalloc.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        uploads = make_uploads(tmp, args.oversize_mb)
+        for upload, path in uploads.items():
+            entry = report["uploads"][upload] = {"bytes": path.stat().st_size}
+            for name, app in apps.items():
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                             base_url="http://bench") as client:
+                    runs = [await measure(client, path) for _ in range(args.repeats)]
+                entry[name] = {
+                    "status": runs[-1][0],
+                    "median_ms": statistics.median(r[1] for r in runs) * 1000,
+                    "peak_mb": max(r[2] for r in runs) / 1e6,
+                }
+    tracemalloc.stop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--oversize-mb", type=int, default=32,
+                        help="size of the oversized upload")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,44 @@
+"""
+Shared helpers for the benchmark scripts.
+
+The API modules import each other by bare module name (they are run from the
+api/ directory), so the benchmarks put api/ on sys.path before importing them.
+"""
+import random
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+API_DIR = ROOT / "api"
+DATASET_DIR = ROOT / "training" / "archive1"
+MODELS_DIR = ROOT / "models"
+
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
+
+
+def sample_images(n, seed=123, dataset_dir=DATASET_DIR):
+    """Return up to `n` image paths sampled across all class folders."""
+    paths = sorted(p for p in Path(dataset_dir).rglob("*")
+                   if p.suffix.lower() in (".jpg", ".jpeg", ".png"))
+    random.Random(seed).shuffle(paths)
+    return paths[:n] if n else paths
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Latency summary (in milliseconds) for a list of durations in seconds."""
+    return {
+        "count": len(samples),
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+        "max_ms": max(samples) * 1000 if samples else 0.0,
+    }
@@ -0,0 +1,127 @@
+"""
+Accuracy and latency of each inference backend on the labelled dataset.
+
+Runs the same stratified sample of training/archive1 through every backend
+whose model file exists (keras, plus any TFLite exports made with
+api/export_model.py) and reports overall and per-class accuracy, agreement
+with the Keras model, and latency at batch size 1 and the serving batch size.
+Exits non-zero if any backend loses more than --max-class-drop accuracy on
+any class relative to Keras, so quantization can't quietly hurt one disease.
+
+    python benchmarks/compare_backends.py --images 500 --output backends.json
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from common import DATASET_DIR, MODELS_DIR, summarize
+
+from export_model import calibration_images
+from preprocessing import decode_image
+from runtimes import BACKENDS, load_runtime
+
+CLASS_NAMES = ['Alternaria leaf spot', 'Brown spot', 'Gray spot', 'Healthy leaf', 'Rust']
+
+
+def load_dataset(count, input_size, calibration_count):
+    # Leave out the images int8 calibration saw (export_model's default sample)
+    seen = set(calibration_images(DATASET_DIR, calibration_count))
+    paths = [p for p in calibration_images(DATASET_DIR, count + len(seen), seed=1)
+             if p not in seen][:count]
+    images = np.stack([decode_image(p, input_size) for p in paths])
+    labels = np.array([CLASS_NAMES.index(p.parent.name) for p in paths])
+    return images, labels
+
+
+def evaluate(runtime, images, labels, batch_size, repeats):
+    predictions = np.concatenate([runtime.predict(images[i:i + batch_size])
+                                  for i in range(0, len(images), batch_size)])
+    predicted = predictions.argmax(axis=1)
+
+    per_class = {}
+    for index, name in enumerate(CLASS_NAMES):
+        mask = labels == index
+        per_class[name] = float((predicted[mask] == index).mean()) if mask.any() else None
+
+    latency = {}
+    for size in sorted({1, batch_size}):
+        batch = images[:size]
+        runtime.predict(batch)  # allocate tensors / trace before timing
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            runtime.predict(batch)
+            samples.append(time.perf_counter() - start)
+        latency[f"batch_{size}"] = {**summarize(samples),
+                                    "per_image_ms": summarize(samples)["p50_ms"] / size}
+
+    return predicted, {
+        "model": str(runtime.path),
+        "size_mb": runtime.path.stat().st_size / 1e6,
+        "accuracy": float((predicted == labels).mean()),
+        "per_class_accuracy": per_class,
+        "latency": latency,
+    }
+
+
+def main(args):
+    model_path = MODELS_DIR / f"{args.version}.keras"
+    reference = load_runtime("keras", model_path)
+    images, labels = load_dataset(args.images, reference.input_size,
+                                  args.calibration_images)
+
+    report = {"images": len(images), "backends": {}}
+    failures = []
+    keras_predicted = None
+    for backend in BACKENDS:
+        try:
+            runtime = reference if backend == "keras" else load_runtime(backend, model_path)
+        except FileNotFoundError as e:
+            print(f"skipping {backend}: {e}", file=sys.stderr)
+            continue
+        predicted, result = evaluate(runtime, images, labels, args.batch_size, args.repeats)
+        if keras_predicted is None:
+            keras_predicted = predicted
+        else:
+            result["agreement_with_keras"] = float((predicted == keras_predicted).mean())
+            baseline = report["backends"]["keras"]["per_class_accuracy"]
+            for name, accuracy in result["per_class_accuracy"].items():
+                if accuracy is not None and baseline[name] - accuracy > args.max_class_drop:
+                    failures.append(f"{backend}: {name} {baseline[name]:.3f} -> {accuracy:.3f}")
+        report["backends"][backend] = result
+
+    print(f"| backend | size MB | accuracy | {' | '.join(CLASS_NAMES)} | ms/img @1 | ms/img @{args.batch_size} |")
+    print("|" + "---|" * (len(CLASS_NAMES) + 5))
+    for backend, result in report["backends"].items():
+        per_class = " | ".join("-" if a is None else f"{a:.3f}"
+                               for a in result["per_class_accuracy"].values())
+        latency = result["latency"]
+        print(f"| {backend} | {result['size_mb']:.1f} | {result['accuracy']:.3f} | {per_class} | "
+              f"{latency['batch_1']['per_image_ms']:.2f} | "
+              f"{latency[f'batch_{args.batch_size}']['per_image_ms']:.2f} |")
+
+    report["regressions"] = failures
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if failures:
+        print("Per-class accuracy dropped by more than "
+              f"{args.max_class_drop:.3f}:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--version", default="1", help="models/<version>.keras")
+    parser.add_argument("--images", type=int, default=500)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--max-class-drop", type=float, default=0.02,
+                        help="largest per-class accuracy loss tolerated vs keras")
+    parser.add_argument("--calibration-images", type=int, default=200,
+                        help="as passed to export_model.py; those images are excluded")
+    parser.add_argument("--output", help="also write the report as JSON")
+    main(parser.parse_args())
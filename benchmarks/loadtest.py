@@ -0,0 +1,293 @@
+"""
+End-to-end load test of the prediction and auth services.
+
+Starts `uvicorn main:app` and `uvicorn auth:app` from api/ (or targets
+running services with --main-url / --auth-url) against a scratch MySQL
+database (DB_NAME, default apple_disease_bench, created with
+setup_database.py), and seeds --users accounts. Virtual users then log in
+and replay a weighted mix of requests:
+
+- login: POST /login
+- predict: POST /predict with an image sampled from training/archive1
+- history_write: POST /history with an image and its prediction
+- history_read: GET /history, first page
+
+Each --concurrency level runs for --duration seconds after --warmup
+seconds that are not recorded. For every level, throughput and
+p50/p95/p99 latency are reported per endpoint and overall. The report is
+saved as JSON (default benchmarks/results/loadtest-<commit>.json), and
+--compare prints the change against an earlier report.
+
+    python benchmarks/loadtest.py --concurrency 1 4 16 64 --duration 30
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest-<commit>.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from common import API_DIR, ROOT, sample_images, summarize
+
+os.environ.setdefault("DB_NAME", "apple_disease_bench")
+# Every virtual user logs in from the same address; keep the limiter out of the way
+os.environ.setdefault("LOGIN_RATE_PER_IP", "1000000")
+os.environ.setdefault("LOGIN_RATE_PER_USERNAME", "1000000")
+
+import repository
+import setup_database
+from werkzeug.security import generate_password_hash
+
+PASSWORD = "LoadTestPassw0rd"
+DEFAULT_MIX = "login=1,predict=10,history_write=3,history_read=6"
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def parse_mix(mix):
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"Unknown endpoint {name!r} in --mix; expected {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def seed_users(count):
+    """Create loadtest_<i> users with PASSWORD; returns their usernames."""
+    setup_database.create_database()
+    password_hash = generate_password_hash(PASSWORD)
+    with repository.transaction() as cursor:
+        cursor.execute("SELECT COUNT(*) AS n FROM users WHERE username LIKE 'loadtest\\_%'")
+        have = cursor.fetchone()["n"]
+        cursor.executemany(
+            "INSERT INTO users (username, email, password_hash, is_admin) VALUES (%s, %s, %s, FALSE)",
+            [(f"loadtest_{i}", f"loadtest_{i}@example.com", password_hash)
+             for i in range(have, count)])
+    return [f"loadtest_{i}" for i in range(count)]
+
+
+def start_service(module, port, env):
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", f"{module}:app", "--port", str(port)],
+        cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_until_ready(url, timeout):
+    deadline = time.perf_counter() + timeout
+    with httpx.Client(timeout=5) as client:
+        while time.perf_counter() < deadline:
+            try:
+                if client.get(url).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            time.sleep(0.1)
+    raise SystemExit(f"{url} not ready after {timeout}s")
+
+
+# Requests. Each takes (session, context) and returns the response.
+
+async def login(session, context):
+    return await session.auth.post("/login", json={"username": session.username,
+                                                   "password": PASSWORD})
+
+
+async def predict(session, context):
+    name, data = random.choice(context["images"])
+    return await session.main.post("/predict", files={"file": (name, data)})
+
+
+async def history_write(session, context):
+    name, data = random.choice(context["images"])
+    return await session.auth.post(
+        "/history", headers=session.headers, files={"file": (name, data)},
+        data={"result": Path(name).parent.name, "confidence": "0.9"})
+
+
+async def history_read(session, context):
+    return await session.auth.get("/history", headers=session.headers)
+
+
+ENDPOINTS = {
+    "login": login,
+    "predict": predict,
+    "history_write": history_write,
+    "history_read": history_read,
+}
+
+
+class Session:
+    """One virtual user: a logged-in account and its clients."""
+
+    def __init__(self, username, main, auth):
+        self.username = username
+        self.main = main
+        self.auth = auth
+        self.headers = {}
+
+    async def login(self):
+        response = await login(self, None)
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run_level(args, context, concurrency):
+    """Replay the mix with `concurrency` virtual users; returns the level's report."""
+    names = list(context["weights"])
+    weights = list(context["weights"].values())
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=args.main_url, timeout=args.timeout, limits=limits) as main, \
+            httpx.AsyncClient(base_url=args.auth_url, timeout=args.timeout, limits=limits) as auth:
+        sessions = [Session(context["usernames"][i % len(context["usernames"])], main, auth)
+                    for i in range(concurrency)]
+        await asyncio.gather(*(session.login() for session in sessions))
+
+        loop = asyncio.get_running_loop()
+        record_from = loop.time() + args.warmup
+        stop_at = record_from + args.duration
+
+        async def virtual_user(session, rng):
+            while loop.time() < stop_at:
+                name = rng.choices(names, weights)[0]
+                start = time.perf_counter()
+                try:
+                    response = await ENDPOINTS[name](session, context)
+                    failed = response.status_code >= 400
+                except httpx.HTTPError:
+                    failed = True
+                elapsed = time.perf_counter() - start
+                if loop.time() >= record_from:
+                    latencies[name].append(elapsed)
+                    errors[name] += failed
+
+        await asyncio.gather(*(virtual_user(session, random.Random(i))
+                               for i, session in enumerate(sessions)))
+
+    endpoints = {}
+    for name in names:
+        endpoints[name] = {**summarize(latencies[name]), "errors": errors[name],
+                           "requests_per_second": len(latencies[name]) / args.duration}
+    everything = [sample for samples in latencies.values() for sample in samples]
+    return {
+        "concurrency": concurrency,
+        "overall": {**summarize(everything), "errors": sum(errors.values()),
+                    "requests_per_second": len(everything) / args.duration},
+        "endpoints": endpoints,
+    }
+
+
+def print_level(level):
+    print(f"\nconcurrency {level['concurrency']}")
+    print(f"{'endpoint':<15}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+    for name, stats in [*level["endpoints"].items(), ("overall", level["overall"])]:
+        print(f"{name:<15}{stats['requests_per_second']:>9.1f}{stats['p50_ms']:>9.1f}"
+              f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['errors']:>8}")
+
+
+def compare(report, baseline):
+    """Print throughput and p95 changes against `baseline` for the shared levels."""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    print(f"\nchange vs {baseline['commit']} (throughput, p95)")
+    for level in report["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        for name, stats in [*level["endpoints"].items(), ("overall", level["overall"])]:
+            old = before["endpoints"].get(name) if name != "overall" else before["overall"]
+            if not old or not old["requests_per_second"] or not old["p95_ms"]:
+                continue
+            throughput = stats["requests_per_second"] / old["requests_per_second"] - 1
+            p95 = stats["p95_ms"] / old["p95_ms"] - 1
+            print(f"c={level['concurrency']:<4} {name:<15}{throughput:>+9.1%}{p95:>+9.1%}")
+
+
+async def run(args, context):
+    levels = []
+    for concurrency in args.concurrency:
+        level = await run_level(args, context, concurrency)
+        print_level(level)
+        levels.append(level)
+    return levels
+
+
+def main(args):
+    context = {"weights": parse_mix(args.mix)}
+    context["images"] = [(f"{p.parent.name}/{p.name}", p.read_bytes())
+                         for p in sample_images(args.images)]
+    context["usernames"] = seed_users(args.users)
+
+    servers = []
+    env = dict(os.environ)
+    if args.no_prediction_cache:
+        env["PREDICTION_CACHE_ENABLED"] = "false"
+    try:
+        if args.main_url is None:
+            args.main_url = f"http://127.0.0.1:{args.port}"
+            servers.append(start_service("main", args.port, env))
+        if args.auth_url is None:
+            args.auth_url = f"http://127.0.0.1:{args.port + 1}"
+            servers.append(start_service("auth", args.port + 1, env))
+        wait_until_ready(f"{args.main_url}/ready", args.startup_timeout)
+        wait_until_ready(f"{args.auth_url}/ping", args.startup_timeout)
+        levels = asyncio.run(run(args, context))
+    finally:
+        for server in servers:
+            server.terminate()
+            server.wait()
+
+    report = {
+        "commit": git_commit(),
+        "started": datetime.now(timezone.utc).isoformat(),
+        "machine": {"python": platform.python_version(), "cpus": os.cpu_count(),
+                    "platform": platform.platform()},
+        "settings": {"mix": context["weights"], "duration_s": args.duration,
+                     "warmup_s": args.warmup, "users": args.users, "images": len(context["images"]),
+                     "prediction_cache": not args.no_prediction_cache},
+        "levels": levels,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"loadtest-{report['commit']}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\nSaved {output}")
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--duration", type=float, default=30, help="recorded seconds per level")
+    parser.add_argument("--warmup", type=float, default=5, help="unrecorded seconds per level")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="endpoint=weight,...")
+    parser.add_argument("--users", type=int, default=100, help="accounts the virtual users log in as")
+    parser.add_argument("--images", type=int, default=200, help="images sampled for uploads")
+    parser.add_argument("--no-prediction-cache", action="store_true",
+                        help="run the prediction service with PREDICTION_CACHE_ENABLED=false")
+    parser.add_argument("--port", type=int, default=8100,
+                        help="prediction service port; the auth service gets the next one")
+    parser.add_argument("--main-url", help="use a running prediction service instead")
+    parser.add_argument("--auth-url", help="use a running auth service instead")
+    parser.add_argument("--timeout", type=float, default=60, help="per-request timeout")
+    parser.add_argument("--startup-timeout", type=float, default=180)
+    parser.add_argument("--output", help="report path (default: benchmarks/results/loadtest-<commit>.json)")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    main(parser.parse_args())
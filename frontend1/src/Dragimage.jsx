@@ -9,6 +9,9 @@ const Dragimage = ({ onDetectionComplete }) => {
   const navigate = useNavigate();
   const API_URL =
     process.env.REACT_APP_API_URL || "http://localhost:8000/predict";
+  // Predicts and records the result in the user's history in one upload
+  const RECORD_API_URL =
+    process.env.REACT_APP_RECORD_API_URL || `${API_URL}/record`;
   const HISTORY_API_URL = 
     process.env.REACT_APP_HISTORY_API_URL || "http://localhost:5000/history";
   const BASE_URL = process.env.REACT_APP_BASE_URL || "http://localhost:5000";
@@ -70,50 +73,6 @@ const Dragimage = ({ onDetectionComplete }) => {
     }
   };
 
-  // Save detection result to database
-  const saveToDatabase = async (file, prediction) => {
-    try {
-      const token = localStorage.getItem("access_token");
-      const formData = new FormData();
-      formData.append("file", file);
-      formData.append("result", prediction.class);
-      formData.append("confidence", prediction.confidence.toString());
-
-      const response = await axios.post(HISTORY_API_URL, formData, {
-        headers: {
-          "Content-Type": "multipart/form-data",
-          Authorization: `Bearer ${token}`,
-        },
-      });
-
-      console.log("Successfully saved to database:", response.data);
-      
-      // Reload history from database to get the latest data
-      await loadHistoryFromDatabase();
-      
-      return response.data;
-    } catch (err) {
-      console.error("Failed to save to database:", err);
-      
-      // Fallback: save to localStorage if database fails
-      const newHistoryItem = {
-        id: Date.now(),
-        class: prediction.class,
-        timestamp: new Date().toLocaleString(),
-        confidence: prediction.confidence,
-        imageUrl: URL.createObjectURL(file),
-      };
-
-      setHistory((prevHistory) => {
-        const updatedHistory = [newHistoryItem, ...prevHistory];
-        localStorage.setItem("detection_history", JSON.stringify(updatedHistory));
-        return updatedHistory;
-      });
-
-      throw err; // Re-throw to handle in calling function
-    }
-  };
-
   // Check API status
   const checkApiStatus = async () => {
     try {
@@ -199,7 +158,7 @@ const Dragimage = ({ onDetectionComplete }) => {
         const formData = new FormData();
         formData.append("file", file);
 
-        const response = await axios.post(API_URL, formData, {
+        const response = await axios.post(RECORD_API_URL, formData, {
           headers: {
             "Content-Type": "multipart/form-data",
             Authorization: `Bearer ${localStorage.getItem("access_token")}`,
@@ -220,14 +179,10 @@ const Dragimage = ({ onDetectionComplete }) => {
 
           setPrediction(newPrediction);
 
-          // Save to database (this will also update the history state)
-          try {
-            await saveToDatabase(file, newPrediction);
-            console.log("Successfully saved detection result to database");
-          } catch (dbErr) {
-            console.warn("Database save failed, but continuing with local storage fallback");
-            // Error handling already done in saveToDatabase function
-          }
+          // The server records the result in the background; show it right
+          // away and pick up the stored entry on the next history refresh
+          setHistory((prevHistory) => [newPrediction, ...prevHistory]);
+          setTimeout(loadHistoryFromDatabase, 1000);
 
           if (onDetectionComplete) {
             onDetectionComplete(newPrediction);
@@ -269,7 +224,7 @@ const Dragimage = ({ onDetectionComplete }) => {
     };
 
     predictDisease();
-  }, [file, API_URL, navigate, onDetectionComplete]);
+  }, [file, RECORD_API_URL, navigate, onDetectionComplete]);
 
   const resetAll = () => {
     setFile(null);
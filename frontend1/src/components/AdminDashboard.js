@@ -4,6 +4,10 @@ import { useNavigate } from "react-router-dom";
 
 function AdminDashboard() {
   const [users, setUsers] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [search, setSearch] = useState("");
+  const [query, setQuery] = useState(""); // the search the list shows
+  const [diseaseStats, setDiseaseStats] = useState([]);
   const [error, setError] = useState("");
   const navigate = useNavigate();
 
@@ -19,26 +23,61 @@ function AdminDashboard() {
       return;
     }
 
-    // Fetch all users (admin-only route)
-    const fetchUsers = async () => {
+    // Predictions per disease over the last 30 days (served from rollups)
+    const fetchDiseaseStats = async () => {
       try {
-        const response = await axios.get("http://localhost:5000/admin/users", {
-          headers: {
-            Authorization: `Bearer ${accessToken}`,
-          },
-        });
-        setUsers(response.data);
+        const response = await axios.get(
+          "http://localhost:5000/admin/analytics/diseases",
+          {
+            headers: {
+              Authorization: `Bearer ${accessToken}`,
+            },
+          }
+        );
+        setDiseaseStats(response.data);
       } catch (err) {
-        setError(err.response?.data?.detail || "Failed to fetch users");
-        // Optionally redirect to login on error
-        if (err.response?.status === 401) {
-          navigate("/login");
-        }
+        setError(err.response?.data?.detail || "Failed to fetch disease statistics");
       }
     };
 
     fetchUsers();
-  }, [navigate]);
+    fetchDiseaseStats();
+  }, [navigate]); // eslint-disable-line react-hooks/exhaustive-deps
+
+  // Fetch a page of users (admin-only route). `cursor` continues the
+  // current listing; without it the list restarts, filtered by `prefix`.
+  const fetchUsers = async (cursor = null, prefix = query) => {
+    try {
+      const params = {};
+      if (cursor) params.cursor = cursor;
+      if (prefix) {
+        params.q = prefix;
+        params.search_by = prefix.includes("@") ? "email" : "username";
+      }
+      const response = await axios.get("http://localhost:5000/admin/users", {
+        params,
+        headers: {
+          Authorization: `Bearer ${localStorage.getItem("access_token")}`,
+        },
+      });
+      setQuery(prefix);
+      setUsers((previous) =>
+        cursor ? [...previous, ...response.data] : response.data
+      );
+      setNextCursor(response.headers["x-next-cursor"] || null);
+    } catch (err) {
+      setError(err.response?.data?.detail || "Failed to fetch users");
+      // Optionally redirect to login on error
+      if (err.response?.status === 401) {
+        navigate("/login");
+      }
+    }
+  };
+
+  const handleSearch = (e) => {
+    e.preventDefault();
+    fetchUsers(null, search.trim());
+  };
 
   const handleLogout = () => {
     // Clear user data from localStorage
@@ -56,6 +95,15 @@ function AdminDashboard() {
       {error && <p className="error">{error}</p>}
       <div className="dashboard-content">
         <h2>Registered Users</h2>
+        <form onSubmit={handleSearch}>
+          <input
+            type="text"
+            placeholder="Search by username or email prefix"
+            value={search}
+            onChange={(e) => setSearch(e.target.value)}
+          />
+          <button type="submit">Search</button>
+        </form>
         <table>
           <thead>
             <tr>
@@ -76,6 +124,28 @@ function AdminDashboard() {
             ))}
           </tbody>
         </table>
+        {nextCursor && (
+          <button onClick={() => fetchUsers(nextCursor)}>Load more</button>
+        )}
+        <h2>Detections in the Last 30 Days</h2>
+        <table>
+          <thead>
+            <tr>
+              <th>Disease</th>
+              <th>Detections</th>
+              <th>Mean Confidence</th>
+            </tr>
+          </thead>
+          <tbody>
+            {diseaseStats.map((stat) => (
+              <tr key={stat.disease_name}>
+                <td>{stat.disease_name}</td>
+                <td>{stat.predictions}</td>
+                <td>{(stat.mean_confidence * 100).toFixed(1)}%</td>
+              </tr>
+            ))}
+          </tbody>
+        </table>
         <div className="admin-actions">
           <button onClick={() => navigate("/detect")}>
             Go to Disease Detection
@@ -9,6 +9,9 @@ const HistoryPage = () => {
   const [history, setHistory] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
+  // Cursor for the next page of history, null when everything is loaded
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   // API URLs - Fixed to ensure proper URL construction
   const HISTORY_API_URL =
@@ -25,9 +28,13 @@ const HistoryPage = () => {
     loadHistoryFromDatabase();
   }, [navigate]);
 
-  const loadHistoryFromDatabase = async () => {
+  const loadHistoryFromDatabase = async (cursor = null) => {
     try {
-      setLoading(true);
+      if (cursor) {
+        setLoadingMore(true);
+      } else {
+        setLoading(true);
+      }
       setError(null);
 
       const token = localStorage.getItem("access_token");
@@ -35,6 +42,7 @@ const HistoryPage = () => {
         headers: {
           Authorization: `Bearer ${token}`,
         },
+        params: cursor ? { cursor } : {},
       });
 
       console.log("History loaded from database:", response.data);
@@ -49,7 +57,10 @@ const HistoryPage = () => {
         });
       });
 
-      setHistory(response.data);
+      setHistory((prevHistory) =>
+        cursor ? [...prevHistory, ...response.data] : response.data
+      );
+      setNextCursor(response.headers["x-next-cursor"] || null);
     } catch (err) {
       console.error("Failed to load history from database:", err);
 
@@ -74,6 +85,7 @@ const HistoryPage = () => {
       }
     } finally {
       setLoading(false);
+      setLoadingMore(false);
     }
   };
 
@@ -184,25 +196,16 @@ const HistoryPage = () => {
     ).length;
   };
 
-  // FIXED: Improved image URL generation with better debugging
-  const getImageUrl = (item) => {
-    if (!item.image_path) {
+  // The list shows thumbnails; the full-size upload opens on click
+  const getImageUrl = (item, fullSize = false) => {
+    const path = fullSize ? item.image_path : item.thumbnail_path || item.image_path;
+    if (!path) {
       return null;
     }
 
     // Ensure path uses forward slashes and remove any leading slash
-    const normalizedPath = item.image_path
-      .replace(/\\/g, "/")
-      .replace(/^\/+/, "");
-    const imageUrl = `${BASE_URL}/${normalizedPath}`;
-
-    console.log("Generated image URL:", {
-      original: item.image_path,
-      normalized: normalizedPath,
-      url: imageUrl,
-    });
-
-    return imageUrl;
+    const normalizedPath = path.replace(/\\/g, "/").replace(/^\/+/, "");
+    return `${BASE_URL}/${normalizedPath}`;
   };
 
   // Enhanced image URL testing function
@@ -228,21 +231,6 @@ const HistoryPage = () => {
     }
   };
 
-  // Add a function to test all image URLs on component mount
-  useEffect(() => {
-    if (history.length > 0) {
-      console.log("Testing all image URLs...");
-      history.forEach((item, index) => {
-        const imageUrl = getImageUrl(item);
-        if (imageUrl) {
-          testImageUrl(imageUrl).then((result) => {
-            console.log(`Image ${index} test result:`, result, imageUrl);
-          });
-        }
-      });
-    }
-  }, [history]);
-
   if (loading) {
     return (
       <div className="history-page">
@@ -381,6 +369,10 @@ const HistoryPage = () => {
                           }`}
                           className="history-image"
                           loading="lazy"
+                          style={{ cursor: "zoom-in" }}
+                          onClick={() =>
+                            window.open(getImageUrl(item, true), "_blank", "noreferrer")
+                          }
                           onError={(e) => {
                             console.error("Image failed to load:", imageUrl);
                             console.error("Image error event:", e);
@@ -494,6 +486,16 @@ const HistoryPage = () => {
                 );
               })}
             </div>
+
+            {nextCursor && (
+              <button
+                className="start-detecting-btn"
+                onClick={() => loadHistoryFromDatabase(nextCursor)}
+                disabled={loadingMore}
+              >
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            )}
           </>
         )}
       </div>
@@ -8,6 +8,11 @@ from dotenv import load_dotenv
 # Load environment variables
 load_dotenv()
 
+# Tables, columns and indexes added since the initial schema are defined once,
+# in api/migrations.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api"))
+from migrations import apply_migrations
+
 def create_database_and_tables():
     connection = None
     try:
@@ -59,6 +64,8 @@ def create_database_and_tables():
 );
         """)
         print("History table created successfully")
+
+        apply_migrations(cursor, 'apple_disease_detection')
         
         connection.commit()
     except Error as e:
@@ -0,0 +1,19 @@
+"""
+Training code for the apple leaf disease models.
+
+Run the modules from the project root, e.g. `python -m training.datastore`.
+The serving code in api/ imports its modules by bare name, so api/ is put on
+sys.path here to share its image decoding: training then sees exactly the
+pixels the service will feed the model.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+API_DIR = ROOT / "api"
+DATASET_DIR = ROOT / "training" / "archive1"
+CACHE_DIR = ROOT / "training" / "cache"
+MODELS_DIR = ROOT / "models"
+
+if str(API_DIR) not in sys.path:
+    sys.path.insert(0, str(API_DIR))
@@ -0,0 +1,210 @@
+"""
+Decoded-once image store for training.
+
+`image_dataset_from_directory` decodes and resizes every JPEG again on each
+run, and `.cache()` only lasts for the session. Instead, a dataset folder
+laid out one directory per class (like training/archive1) is decoded once
+into a raw uint8 array on disk, shape (N, height, width, 3), plus an index
+of file names and labels:
+
+    training/cache/archive1-256x256/images.u8
+    training/cache/archive1-256x256/index.json
+    training/cache/archive1-256x256/labels.npy
+
+Each image size has its own store, so the 256px CNN and the 224px
+MobileNetV2 pipelines don't evict each other. Reads go through np.memmap:
+batches are gathered straight from the page cache, with no decoding and no
+copy of the whole dataset in the Python heap. The index records a
+fingerprint of the source files, and a store whose sources changed is
+rebuilt.
+
+    python -m training.datastore --size 256 --size 224
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from training import CACHE_DIR, DATASET_DIR  # also puts api/ on sys.path
+from preprocessing import decode_image
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png")
+INDEX_VERSION = 1
+
+
+def list_images(dataset_dir):
+    """(relative path, class name) for every image, sorted; classes are the sub-folders."""
+    dataset_dir = Path(dataset_dir)
+    files = []
+    for class_dir in sorted(p for p in dataset_dir.iterdir() if p.is_dir()):
+        for path in sorted(class_dir.iterdir()):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                files.append((path.relative_to(dataset_dir).as_posix(), class_dir.name))
+    return files
+
+
+def source_fingerprint(dataset_dir, files):
+    """Changes whenever an image is added, removed, replaced or touched."""
+    digest = hashlib.sha256()
+    for name, _ in files:
+        stat = (Path(dataset_dir) / name).stat()
+        digest.update(f"{name}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+class ImageStore:
+    """A built store, memory-mapped read-only."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / "index.json") as f:
+            index = json.load(f)
+        self.class_names = index["class_names"]
+        self.files = index["files"]
+        self.size = tuple(index["size"])
+        self.fingerprint = index["fingerprint"]
+        self.labels = np.load(self.path / "labels.npy")
+        self.images = np.memmap(self.path / "images.u8", dtype=np.uint8, mode="r",
+                                shape=(len(self.files), *self.size, 3))
+
+    def __len__(self):
+        return len(self.files)
+
+    def gather(self, indices):
+        """Copy the images at `indices` into one batch array (sorted reads are sequential)."""
+        indices = np.asarray(indices)
+        batch = np.empty((len(indices), *self.size, 3), dtype=np.uint8)
+        for slot in np.argsort(indices):
+            batch[slot] = self.images[indices[slot]]
+        return batch
+
+
+def store_path(dataset_dir, size, cache_dir=CACHE_DIR):
+    height, width = size
+    return Path(cache_dir) / f"{Path(dataset_dir).name}-{height}x{width}"
+
+
+def build_store(dataset_dir, size, cache_dir=CACHE_DIR, workers=None):
+    """Decode every image in `dataset_dir` at `size` into a new store."""
+    dataset_dir = Path(dataset_dir)
+    files = list_images(dataset_dir)
+    if not files:
+        raise FileNotFoundError(f"No images found in {dataset_dir}")
+    class_names = sorted({label for _, label in files})
+    path = store_path(dataset_dir, size, cache_dir)
+    path.mkdir(parents=True, exist_ok=True)
+
+    # The index is written last, so an interrupted build is never opened
+    index_path = path / "index.json"
+    if index_path.exists():
+        index_path.unlink()
+
+    images = np.memmap(path / "images.u8", dtype=np.uint8, mode="w+",
+                       shape=(len(files), *size, 3))
+    # Each worker decodes straight into its slot of the mapped file
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        list(pool.map(lambda i: decode_image(dataset_dir / files[i][0], size, out=images[i]),
+                      range(len(files))))
+    images.flush()
+    del images
+
+    labels = np.array([class_names.index(label) for _, label in files], dtype=np.int16)
+    np.save(path / "labels.npy", labels)
+    index = {
+        "version": INDEX_VERSION,
+        "dataset": str(dataset_dir),
+        "size": list(size),
+        "class_names": class_names,
+        "files": [name for name, _ in files],
+        "fingerprint": source_fingerprint(dataset_dir, files),
+    }
+    tmp = index_path.with_suffix(".tmp")
+    with open(tmp, "w") as f:
+        json.dump(index, f)
+    os.replace(tmp, index_path)
+    return ImageStore(path)
+
+
+def open_store(dataset_dir=DATASET_DIR, size=(256, 256), cache_dir=CACHE_DIR,
+               rebuild=False, workers=None):
+    """Open the store for `dataset_dir` at `size`, building it if missing or stale."""
+    path = store_path(dataset_dir, size, cache_dir)
+    if not rebuild and (path / "index.json").exists():
+        store = ImageStore(path)
+        files = list_images(dataset_dir)
+        if ([name for name, _ in files] == store.files
+                and source_fingerprint(dataset_dir, files) == store.fingerprint):
+            return store
+    return build_store(dataset_dir, size, cache_dir, workers)
+
+
+def augmentation():
+    """The notebooks' augmentation: random flips and up to 20% rotation."""
+    import tensorflow as tf
+
+    return tf.keras.Sequential([
+        tf.keras.layers.RandomFlip("horizontal_and_vertical"),
+        tf.keras.layers.RandomRotation(0.2),
+    ])
+
+
+def to_dataset(store, indices=None, batch_size=32, shuffle=False, augment=False, seed=None):
+    """
+    tf.data pipeline over `store` (or the subset `indices`).
+
+    Only indices flow through shuffle/batch; each batch is then gathered from
+    the memory map in parallel, and augmentation runs as its own parallel
+    map, so neither ever waits on JPEG decoding. Yields (images, labels)
+    batches with pixels in 0-255, which the models' Rescaling layer expects:
+    uint8, or float32 once augmented.
+    """
+    import tensorflow as tf
+
+    indices = np.arange(len(store)) if indices is None else np.asarray(indices)
+    autotune = tf.data.AUTOTUNE
+    height, width = store.size
+
+    def gather(batch_indices):
+        return store.gather(batch_indices), store.labels[batch_indices].astype(np.int32)
+
+    def load(batch_indices):
+        images, labels = tf.numpy_function(gather, [batch_indices], (tf.uint8, tf.int32))
+        images.set_shape((None, height, width, 3))
+        labels.set_shape((None,))
+        return images, labels
+
+    ds = tf.data.Dataset.from_tensor_slices(indices)
+    if shuffle:
+        ds = ds.shuffle(len(indices), seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size).map(load, num_parallel_calls=autotune, deterministic=not shuffle)
+    if augment:
+        layers = augmentation()
+        ds = ds.map(lambda x, y: (layers(tf.cast(x, tf.float32), training=True), y),
+                    num_parallel_calls=autotune, deterministic=False)
+    return ds.prefetch(autotune)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", default=str(DATASET_DIR))
+    parser.add_argument("--size", type=int, action="append",
+                        help="square image size; repeat for several (default: 256)")
+    parser.add_argument("--cache-dir", default=str(CACHE_DIR))
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for size in args.size or [256]:
+        start = time.perf_counter()
+        store = open_store(args.dataset, (size, size), args.cache_dir, args.rebuild, args.workers)
+        print(f"{store.path}: {len(store)} images, {len(store.class_names)} classes, "
+              f"{store.images.nbytes / 1e6:.0f} MB, ready in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Two-stage MobileNetV2 training on cached backbone features.
+
+With the backbone frozen, training2.ipynb still runs every image through
+all of MobileNetV2 on every epoch just to train the Dense head. Here the
+backbone runs once. Each training image is passed through in `views` views:
+the plain image plus views-1 augmented copies. The pooled 1280-d features
+are stored on disk, and val and test get a single plain view:
+
+    training/cache/features/archive1-224x224-mobilenetv2-v4-s123-<split>-<store>/
+        train.npy  (views, N, 1280) float16    train_labels.npy
+        val.npy    (1, N, 1280)                val_labels.npy
+        test.npy   (1, N, 1280)                test_labels.npy
+
+Stage 1 trains the head on those features, which takes seconds. Stage 2 is
+optional. It rebuilds the full model with the trained head, unfreezes the
+top `fine_tune_layers` layers of the backbone (BatchNorm stays frozen), and
+trains end to end from the image store at a low learning rate.
+"""
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+from training import CACHE_DIR
+from training.datastore import augmentation
+from training.models import (
+    build_mobilenetv2, classifier_head, mobilenetv2_backbone, resize_and_rescale,
+)
+
+FEATURES_DIR = CACHE_DIR / "features"
+
+
+def feature_extractor(image_size, base_model):
+    return models.Sequential([
+        layers.Input(shape=(image_size, image_size, 3)),
+        resize_and_rescale(image_size),
+        base_model,
+        layers.GlobalAveragePooling2D(),
+    ])
+
+
+def extract(extractor, store, indices, path, views=1, batch_size=64, seed=123):
+    """
+    Write (views, len(indices), features) float16 features to `path`. View 0
+    is the plain image and later views are augmented. The array is written
+    through a memory map and renamed into place when complete.
+    """
+    augment = augmentation()
+    tf.keras.utils.set_random_seed(seed)
+    width = extractor.output_shape[-1]
+    tmp = path.with_suffix(".tmp.npy")
+    features = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float16,
+                                         shape=(views, len(indices), width))
+    indices = np.asarray(indices)
+    for view in range(views):
+        for start in range(0, len(indices), batch_size):
+            batch = store.gather(indices[start:start + batch_size]).astype(np.float32)
+            if view:
+                batch = augment(batch, training=True)
+            features[view, start:start + len(batch)] = extractor.predict_on_batch(batch)
+    features.flush()
+    del features
+    tmp.replace(path)
+
+
+def cached_features(store, split_indices, split_id, image_size, views, seed, base_model):
+    """Features for every split, extracting whichever aren't cached yet."""
+    # The store fingerprint changes when any image is replaced, the split id when any moves
+    directory = FEATURES_DIR / (f"{store.path.name}-mobilenetv2-v{views}-s{seed}"
+                                f"-{split_id}-{store.fingerprint[:8]}")
+    directory.mkdir(parents=True, exist_ok=True)
+    extractor = None
+    result = {}
+    for split, indices in split_indices.items():
+        path = directory / f"{split}.npy"
+        if not path.exists():
+            extractor = extractor or feature_extractor(image_size, base_model)
+            extract(extractor, store, indices, path,
+                    views=views if split == "train" else 1, seed=seed)
+            np.save(directory / f"{split}_labels.npy", store.labels[indices])
+        result[split] = (np.load(path, mmap_mode="r"),
+                         np.load(directory / f"{split}_labels.npy"))
+    return directory, result
+
+
+def train_head(features, n_classes, epochs, batch_size, learning_rate, verbose):
+    """Stage 1: fit the Dense head on pooled features; returns the head layers."""
+    train_x, train_y = features["train"]
+    views, n, width = train_x.shape
+    # Every view is a separate training example with the image's label
+    train_x = np.asarray(train_x, dtype=np.float32).reshape(views * n, width)
+    train_y = np.tile(train_y, views)
+    val_x, val_y = features["val"]
+
+    head = classifier_head(n_classes)
+    model = models.Sequential([layers.Input(shape=(width,)), *head])
+    model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate),
+                  loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=False),
+                  metrics=['accuracy'])
+    model.fit(train_x, train_y, validation_data=(np.asarray(val_x[0], np.float32), val_y),
+              epochs=epochs, batch_size=batch_size, shuffle=True, verbose=verbose,
+              callbacks=[tf.keras.callbacks.EarlyStopping(
+                  monitor="val_accuracy", patience=10, restore_best_weights=True)])
+    return head
+
+
+def unfreeze_top(base_model, n_layers):
+    """Make the top `n_layers` of the backbone trainable, except BatchNorm."""
+    base_model.trainable = True
+    for layer in base_model.layers[:-n_layers]:
+        layer.trainable = False
+    for layer in base_model.layers[-n_layers:]:
+        if isinstance(layer, layers.BatchNormalization):
+            layer.trainable = False
+
+
+def train_two_stage(args, store, indices, split_id, train_ds, val_ds):
+    """Returns (model, timings) for train.py to evaluate and publish."""
+    image_size = store.size[0]
+    n_classes = len(store.class_names)
+    base_model = mobilenetv2_backbone(image_size)
+    timings = {}
+
+    start = time.perf_counter()
+    directory, features = cached_features(store, indices, split_id, image_size,
+                                          args.views, args.seed, base_model)
+    timings["features_seconds"] = time.perf_counter() - start
+    print(f"Features in {directory} ({timings['features_seconds']:.1f}s)")
+
+    start = time.perf_counter()
+    head = train_head(features, n_classes, args.epochs, args.batch_size,
+                      args.learning_rate, args.verbose)
+    timings["head_seconds"] = time.perf_counter() - start
+
+    # Same layers as the notebook's model, so it serves unchanged
+    model = build_mobilenetv2(image_size, n_classes, base_model=base_model)
+    for source, target in zip(head, model.layers[-len(head):]):
+        target.set_weights(source.get_weights())
+
+    if args.fine_tune_epochs:
+        start = time.perf_counter()
+        unfreeze_top(base_model, args.fine_tune_layers)
+        model.compile(optimizer=tf.keras.optimizers.Adam(args.fine_tune_learning_rate),
+                      loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=False),
+                      metrics=['accuracy'])
+        model.fit(train_ds, validation_data=val_ds, epochs=args.fine_tune_epochs,
+                  verbose=args.verbose,
+                  callbacks=[tf.keras.callbacks.EarlyStopping(
+                      monitor="val_accuracy", patience=3, restore_best_weights=True)])
+        timings["fine_tune_seconds"] = time.perf_counter() - start
+    else:
+        model.compile(loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=False),
+                      metrics=['accuracy'])
+    return model, timings
@@ -0,0 +1,79 @@
+"""
+Model architectures from the training notebooks.
+
+Both take raw 0-255 pixels and resize/rescale inside the model, as the
+serving code expects. The softmax layer is kept in float32 so the models
+stay numerically stable under a mixed-precision policy.
+"""
+import tensorflow as tf
+from tensorflow.keras import layers, models
+
+
+def resize_and_rescale(image_size):
+    return tf.keras.Sequential([
+        layers.Resizing(image_size, image_size),
+        layers.Rescaling(1. / 255),
+    ])
+
+
+def build_cnn(image_size, n_classes):
+    """The six-block CNN from training.ipynb."""
+    return models.Sequential([
+        layers.Input(shape=(image_size, image_size, 3)),
+        resize_and_rescale(image_size),
+        layers.Conv2D(32, kernel_size=(3, 3), activation='relu'),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, kernel_size=(3, 3), activation='relu'),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, kernel_size=(3, 3), activation='relu'),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.MaxPooling2D((2, 2)),
+        layers.Conv2D(64, (3, 3), activation='relu'),
+        layers.MaxPooling2D((2, 2)),
+        layers.Flatten(),
+        layers.Dense(64, activation='relu'),
+        layers.Dense(n_classes, activation='softmax', dtype='float32'),
+    ])
+
+
+def mobilenetv2_backbone(image_size, weights='imagenet'):
+    base_model = tf.keras.applications.MobileNetV2(
+        input_shape=(image_size, image_size, 3), include_top=False, weights=weights)
+    base_model.trainable = False
+    return base_model
+
+
+def classifier_head(n_classes):
+    """The Dense head training2.ipynb puts on the pooled MobileNetV2 features."""
+    return [
+        layers.Dense(128, activation='relu'),
+        layers.Dropout(0.2),
+        layers.Dense(n_classes, activation='softmax', dtype='float32'),
+    ]
+
+
+def build_mobilenetv2(image_size, n_classes, base_model=None):
+    """Frozen ImageNet MobileNetV2 with a small Dense head, from training2.ipynb."""
+    base_model = base_model or mobilenetv2_backbone(image_size)
+    return models.Sequential([
+        layers.Input(shape=(image_size, image_size, 3)),
+        resize_and_rescale(image_size),
+        base_model,
+        layers.GlobalAveragePooling2D(),
+        *classifier_head(n_classes),
+    ])
+
+
+ARCHITECTURES = {
+    "cnn": build_cnn,
+    "mobilenetv2": build_mobilenetv2,
+}
+
+# Input size each architecture was trained at in the notebooks
+DEFAULT_IMAGE_SIZE = {
+    "cnn": 256,
+    "mobilenetv2": 224,
+}
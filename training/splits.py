@@ -0,0 +1,141 @@
+"""
+Persisted, stratified train/val/test split of a dataset.
+
+The notebooks split *batches* with take/skip after a shuffle that is redone
+on every iteration, so images moved between train, val and test from epoch
+to epoch and class balance was left to chance. Here each class is shuffled
+with a fixed seed and cut by the requested fractions once. The result is
+written to a manifest, training/splits/<dataset>.json, which is committed
+so every run and every machine trains and evaluates on the same images.
+
+    python -m training.splits                    # create, or check the existing manifest
+    python -m training.splits --update           # assign newly added images, keep the rest
+"""
+import argparse
+import hashlib
+import json
+import random
+from pathlib import Path
+
+from training import DATASET_DIR, ROOT
+from training.datastore import list_images
+
+SPLITS = ("train", "val", "test")
+SPLITS_DIR = ROOT / "training" / "splits"
+
+
+def manifest_path(dataset_dir, splits_dir=SPLITS_DIR):
+    return Path(splits_dir) / f"{Path(dataset_dir).name}.json"
+
+
+def stratified_split(files, fractions=(0.8, 0.1, 0.1), seed=123):
+    """Assign (name, class) pairs to splits, per class, by `fractions` of train/val/test."""
+    by_class = {}
+    for name, label in files:
+        by_class.setdefault(label, []).append(name)
+
+    assignment = {split: [] for split in SPLITS}
+    for label in sorted(by_class):
+        names = sorted(by_class[label])
+        random.Random(f"{seed}:{label}").shuffle(names)
+        n_val = round(len(names) * fractions[1])
+        n_test = round(len(names) * fractions[2])
+        assignment["val"] += names[:n_val]
+        assignment["test"] += names[n_val:n_val + n_test]
+        assignment["train"] += names[n_val + n_test:]
+    return {split: sorted(names) for split, names in assignment.items()}
+
+
+def build_manifest(dataset_dir, splits, fractions, seed):
+    labels = dict(list_images(dataset_dir))
+    counts = {split: {} for split in SPLITS}
+    for split, names in splits.items():
+        for name in names:
+            counts[split][labels[name]] = counts[split].get(labels[name], 0) + 1
+    return {
+        "dataset": Path(dataset_dir).name,
+        "seed": seed,
+        "fractions": dict(zip(SPLITS, fractions)),
+        "counts": counts,
+        "splits": splits,
+    }
+
+
+def manifest_hash(manifest):
+    """Short id of the exact split, recorded with every trained model."""
+    return hashlib.sha256(json.dumps(manifest["splits"], sort_keys=True).encode()).hexdigest()[:12]
+
+
+def write_manifest(manifest, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(manifest, f, indent=1)
+        f.write("\n")
+
+
+def load_manifest(dataset_dir=DATASET_DIR, splits_dir=SPLITS_DIR,
+                  fractions=(0.8, 0.1, 0.1), seed=123):
+    """Load the dataset's manifest, creating it on first use."""
+    path = manifest_path(dataset_dir, splits_dir)
+    if path.exists():
+        with open(path) as f:
+            return json.load(f)
+    manifest = build_manifest(dataset_dir, stratified_split(list_images(dataset_dir), fractions, seed),
+                              fractions, seed)
+    write_manifest(manifest, path)
+    return manifest
+
+
+def update_manifest(manifest, dataset_dir):
+    """
+    Drop images that no longer exist and split newly added ones with the
+    manifest's seed and fractions, leaving existing assignments untouched.
+    """
+    files = list_images(dataset_dir)
+    present = {name for name, _ in files}
+    assigned = {name for names in manifest["splits"].values() for name in names}
+    fractions = tuple(manifest["fractions"][split] for split in SPLITS)
+    added = stratified_split([(n, c) for n, c in files if n not in assigned],
+                             fractions, manifest["seed"])
+    splits = {split: sorted([n for n in manifest["splits"][split] if n in present] + added[split])
+              for split in SPLITS}
+    return build_manifest(dataset_dir, splits, fractions, manifest["seed"])
+
+
+def split_indices(store, manifest):
+    """Map each split to row indices of `store` (an ImageStore over the same dataset)."""
+    rows = {name: i for i, name in enumerate(store.files)}
+    missing = [name for names in manifest["splits"].values() for name in names if name not in rows]
+    if missing:
+        raise ValueError(f"{len(missing)} images in the split manifest are not in the store "
+                         f"(e.g. {missing[0]}); run `python -m training.splits --update`")
+    return {split: [rows[name] for name in names] for split, names in manifest["splits"].items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", default=str(DATASET_DIR))
+    parser.add_argument("--seed", type=int, default=123)
+    parser.add_argument("--fractions", type=float, nargs=3, default=(0.8, 0.1, 0.1),
+                        metavar=("TRAIN", "VAL", "TEST"))
+    parser.add_argument("--update", action="store_true",
+                        help="assign images added since the manifest was made")
+    args = parser.parse_args()
+
+    path = manifest_path(args.dataset)
+    manifest = load_manifest(args.dataset, fractions=tuple(args.fractions), seed=args.seed)
+    if args.update:
+        manifest = update_manifest(manifest, args.dataset)
+        write_manifest(manifest, path)
+
+    assigned = {name for names in manifest["splits"].values() for name in names}
+    unassigned = [name for name, _ in list_images(args.dataset) if name not in assigned]
+    print(f"{path} ({manifest_hash(manifest)})")
+    for split in SPLITS:
+        print(f"  {split:5} {sum(manifest['counts'][split].values()):5}  {manifest['counts'][split]}")
+    if unassigned:
+        print(f"  {len(unassigned)} images are not in any split; run with --update")
+
+
+if __name__ == "__main__":
+    main()
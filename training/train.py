@@ -0,0 +1,197 @@
+"""
+Train a model on the persisted split and publish it to models/.
+
+    python -m training.train --arch cnn --epochs 50
+    python -m training.train --arch mobilenetv2 --epochs 50 --mixed-precision auto
+    python -m training.train --arch mobilenetv2 --mode cached-features --views 4 --fine-tune-epochs 5
+
+Images come from the memory-mapped store (training.datastore) and the
+stratified split manifest (training.splits). Each run keeps its state under
+training/runs/<run-name>/. Re-running an interrupted run with the same
+--run-name resumes from the last completed epoch; --fresh starts over. When
+training finishes, the model is evaluated on the test split and saved as
+the next models/N.keras, with models/N.json holding its class names, input
+size and metrics for the serving registry.
+
+--mode cached-features trains MobileNetV2's head on backbone features
+computed once and cached (see training.features) instead of running the
+frozen backbone every epoch.
+"""
+import argparse
+import json
+import shutil
+import time
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+
+from training import DATASET_DIR, MODELS_DIR, ROOT
+from training.datastore import open_store, to_dataset
+from training.features import train_two_stage
+from training.models import ARCHITECTURES, DEFAULT_IMAGE_SIZE
+from training.splits import load_manifest, manifest_hash, split_indices
+
+RUNS_DIR = ROOT / "training" / "runs"
+
+
+def cpu_supports_bfloat16():
+    """True on CPUs with native bfloat16 math (AVX512-BF16 or AMX)."""
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return "avx512_bf16" in flags or "amx_bf16" in flags
+
+
+def choose_precision(mode):
+    """
+    Pick a Keras dtype policy. "auto" uses float16 on a GPU, bfloat16 on CPUs
+    that compute it natively, and float32 elsewhere, where emulated
+    half precision is slower than full precision.
+    """
+    if mode == "off":
+        return "float32"
+    if tf.config.list_physical_devices("GPU"):
+        return "mixed_float16"
+    if mode == "on" or cpu_supports_bfloat16():
+        return "mixed_bfloat16"
+    return "float32"
+
+
+def next_model_version(models_dir=MODELS_DIR):
+    versions = [int(p.stem) for p in Path(models_dir).glob("*.keras") if p.stem.isdigit()]
+    return max(versions + [0]) + 1
+
+
+def per_class_accuracy(model, dataset, class_names):
+    correct = np.zeros(len(class_names))
+    total = np.zeros(len(class_names))
+    for images, labels in dataset:
+        predicted = np.argmax(model.predict_on_batch(images), axis=1)
+        labels = labels.numpy()
+        np.add.at(total, labels, 1)
+        np.add.at(correct, labels, predicted == labels)
+    return {name: float(correct[i] / total[i]) if total[i] else None
+            for i, name in enumerate(class_names)}
+
+
+def publish(model, class_names, image_size, report, models_dir=MODELS_DIR):
+    """Save as the next models/N.keras with its registry metadata."""
+    version = next_model_version(models_dir)
+    model.save(Path(models_dir) / f"{version}.keras")
+    metadata = {"class_names": class_names, "input_size": [image_size, image_size], **report}
+    with open(Path(models_dir) / f"{version}.json", "w") as f:
+        json.dump(metadata, f, indent=2)
+    return version
+
+
+def train_end_to_end(args, store, run_dir, train_ds, val_ds):
+    model = ARCHITECTURES[args.arch](store.size[0], len(store.class_names))
+    model.compile(
+        optimizer=tf.keras.optimizers.Adam(args.learning_rate),
+        loss=tf.keras.losses.SparseCategoricalCrossentropy(from_logits=False),
+        metrics=['accuracy'],
+    )
+    callbacks = [
+        # Restores model, optimizer and epoch after an interruption
+        tf.keras.callbacks.BackupAndRestore(str(run_dir / "backup")),
+        tf.keras.callbacks.ModelCheckpoint(str(run_dir / "best.keras"),
+                                           monitor="val_accuracy", save_best_only=True),
+        tf.keras.callbacks.CSVLogger(str(run_dir / "history.csv"), append=True),
+    ]
+    model.fit(train_ds, validation_data=val_ds, epochs=args.epochs,
+              callbacks=callbacks, verbose=args.verbose)
+
+    # Publish the epoch with the best validation accuracy, not the last one
+    if (run_dir / "best.keras").exists():
+        model = tf.keras.models.load_model(str(run_dir / "best.keras"))
+    return model
+
+
+def train(args):
+    if args.mode == "cached-features" and args.arch != "mobilenetv2":
+        raise SystemExit("--mode cached-features needs --arch mobilenetv2")
+    tf.keras.utils.set_random_seed(args.seed)
+    policy = choose_precision(args.mixed_precision)
+    tf.keras.mixed_precision.set_global_policy(policy)
+
+    image_size = args.image_size or DEFAULT_IMAGE_SIZE[args.arch]
+    store = open_store(args.dataset, (image_size, image_size))
+    manifest = load_manifest(args.dataset)
+    indices = split_indices(store, manifest)
+
+    train_ds = to_dataset(store, indices["train"], args.batch_size,
+                          shuffle=True, augment=True, seed=args.seed)
+    val_ds = to_dataset(store, indices["val"], args.batch_size)
+    test_ds = to_dataset(store, indices["test"], args.batch_size)
+
+    run_dir = RUNS_DIR / (args.run_name or f"{args.arch}-{image_size}")
+    if args.fresh and run_dir.exists():
+        shutil.rmtree(run_dir)
+    run_dir.mkdir(parents=True, exist_ok=True)
+
+    print(f"Training {args.arch} ({args.mode}) at {image_size}px with {policy} on split "
+          f"{manifest_hash(manifest)} ({len(indices['train'])} train, "
+          f"{len(indices['val'])} val, {len(indices['test'])} test); state in {run_dir}")
+    start = time.perf_counter()
+    if args.mode == "cached-features":
+        model, timings = train_two_stage(args, store, indices, manifest_hash(manifest),
+                                         train_ds, val_ds)
+    else:
+        model, timings = train_end_to_end(args, store, run_dir, train_ds, val_ds), {}
+    wall_time = time.perf_counter() - start
+
+    loss, accuracy = model.evaluate(test_ds, verbose=0)
+    report = {
+        "arch": args.arch,
+        "mode": args.mode,
+        "precision": policy,
+        "epochs": args.epochs,
+        "split": manifest_hash(manifest),
+        "train_seconds": wall_time,
+        **timings,
+        "test_loss": float(loss),
+        "test_accuracy": float(accuracy),
+        "test_per_class_accuracy": per_class_accuracy(model, test_ds, store.class_names),
+    }
+    if not args.no_publish:
+        report["model_version"] = publish(model, store.class_names, image_size, report)
+    with open(run_dir / "report.json", "w") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--arch", choices=sorted(ARCHITECTURES), default="cnn")
+    parser.add_argument("--mode", choices=("end-to-end", "cached-features"), default="end-to-end")
+    parser.add_argument("--image-size", type=int, help="default: 256 for cnn, 224 for mobilenetv2")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--seed", type=int, default=123)
+    parser.add_argument("--mixed-precision", choices=("auto", "on", "off"), default="auto")
+    parser.add_argument("--dataset", default=str(DATASET_DIR))
+    parser.add_argument("--views", type=int, default=4,
+                        help="cached-features: backbone passes per training image "
+                             "(1 plain + views-1 augmented)")
+    parser.add_argument("--fine-tune-epochs", type=int, default=0,
+                        help="cached-features: end-to-end epochs with the top layers unfrozen")
+    parser.add_argument("--fine-tune-layers", type=int, default=30,
+                        help="cached-features: backbone layers unfrozen for fine-tuning")
+    parser.add_argument("--fine-tune-learning-rate", type=float, default=1e-5)
+    parser.add_argument("--run-name", help="default: <arch>-<image size>")
+    parser.add_argument("--fresh", action="store_true", help="discard a previous run's state")
+    parser.add_argument("--no-publish", action="store_true", help="don't save to models/")
+    parser.add_argument("--verbose", type=int, default=2)
+    return parser
+
+
+def main():
+    print(json.dumps(train(build_parser().parse_args()), indent=2))
+
+
+if __name__ == "__main__":
+    main()